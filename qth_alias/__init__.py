@@ -1,28 +1,72 @@
 import asyncio
 
-import json
+import os
+import time
+import socket
 import logging
+import tempfile
+import tracemalloc
+
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
 import qth
 from qth_ls import Ls
 
 from qth_alias.version import __version__  # noqa
 from qth_alias.alias import Alias
+from qth_alias.computed import ComputedAlias
+from qth_alias.shard import shard_of, RemoteAlias
+from qth_alias.cluster import Cluster
+from qth_alias.stats import AliasStats, ServerStats
+from qth_alias.trace import Tracer, RingBufferSink, JsonLinesSink, EventSink
+from qth_alias.profiler import Profile
+from qth_alias.memory import memory_report
+from qth_alias.errors import ErrorReporter
+from qth_alias.record import Recorder
+from qth_alias.spec import validate_spec
+from qth_alias.cache import CacheFile
+from qth_alias.reconcile import Reconciler
+
+
+# Interval (seconds) at which the event loop's responsiveness is sampled when
+# statistics are enabled.
+LOOP_LAG_INTERVAL = 0.1
+
+# Seconds a standby waits for competing claims after claiming a lease which
+# was released (rather than left to expire). Standbys see a release at the
+# same moment so competing claims arrive within a broker round trip.
+RELEASED_CLAIM_WINDOW = 0.01
 
 
 def has_cycle(aliases):
     """Chcek if {alias: target, ...} dictionary contains a cyclic dependency.
+    Targets may be a single path or a list of paths (for computed aliases).
     If there is, returns the cycle as a list of paths.
     """
+    def targets(path):
+        target = aliases[path]
+        return target if isinstance(target, list) else [target]
+
+    # Paths known not to be part of (or lead to) a cycle
+    acyclic = set()
+
     for start in aliases:
+        # Depth-first search from the start, 'visited' holding the current
+        # path from the start and 'todo' the unexplored targets of each path
+        # in 'visited'.
         visited = [start]
-
-        pos = start
-        while pos in aliases:
-            pos = aliases[pos]
-            if pos in visited:
-                return visited + [pos]
-            visited.append(pos)
+        todo = [iter(targets(start))]
+        while todo:
+            for pos in todo[-1]:
+                if pos in visited:
+                    return visited + [pos]
+                if pos in aliases and pos not in acyclic:
+                    visited.append(pos)
+                    todo.append(iter(targets(pos)))
+                break
+            else:
+                acyclic.add(visited.pop())
+                todo.pop()
 
     return None
 
@@ -31,7 +75,16 @@ class AliasServer(object):
     """The Qth alias server."""
 
     def __init__(self, cache_file="/dev/null", prefix="meta/alias/",
-                 host=None, port=None, keepalive=10):
+                 host=None, port=None, keepalive=10,
+                 transform_cache_size=0, transform_budget=None,
+                 quarantine_after=5, client=None, ls=None,
+                 shards=1, shard=None, node_id=None, heartbeat_interval=5.0,
+                 node_timeout=15.0, standby=False, lease_interval=1.0,
+                 lease_timeout=3.0, stats_interval=None,
+                 stats_per_alias=False, trace_rate=None, trace_buffer=0,
+                 trace_file=None, trace_event=False, profile_dir=None,
+                 error_window=10.0, record_file=None, lazy_timeout=60.0,
+                 echo_suppression="counter", settle_window=0.0):
         """
         Initialise the Qth Alias server. Call async_init() soon after
         construciton.
@@ -48,21 +101,250 @@ class AliasServer(object):
             Qth port.
         keepalive : int
             MQTT Keepalive interval.
+        transform_cache_size : int
+            The maximum number of results to memoise for each pure transform
+            expression with a scalar (or short string) value. Zero (the
+            default) disables memoisation.
+        transform_budget : float or None
+            The maximum time (seconds) a transform should take to evaluate.
+            Transforms executed in a thread or process pool are abandoned
+            after this time. If None, no limit is applied.
+        quarantine_after : int
+            The number of consecutive transform evaluations which may exceed
+            the budget before an alias is quarantined (and stops forwarding
+            values).
+        client : qth.Client or None
+            If given, use this Qth client rather than creating a new one. This
+            allows several alias servers (with different prefixes) to share a
+            single connection. 'host', 'port' and 'keepalive' are ignored.
+        ls : qth_ls.Ls or None
+            If given, use this registration index (which must use 'client')
+            rather than creating a new one.
+        shards : int
+            If greater than one, this server only runs the control plane
+            (the add, remove, aliases and error paths, cycle checking and the
+            cache file). The aliases themselves are partitioned between this
+            many worker processes by publishing each worker's share in the
+            '<prefix>shards/<n>' properties.
+        shard : int or None
+            If given, run as worker number 'shard' (of 'shards') of a sharded
+            server: serve only the aliases published for this worker by the
+            control plane.
+        node_id : str or None
+            If given, run as a member of a cluster of alias servers (sharing
+            the same broker and prefix) with this unique name. The aliases are
+            divided between the live members by consistent hashing of their
+            paths. Members announce themselves with heartbeat properties in
+            '<prefix>nodes/'.
+        heartbeat_interval : float
+            (Clusters only.) Seconds between heartbeats.
+        node_timeout : float
+            (Clusters only.) Seconds without a heartbeat after which a member
+            is presumed dead and its aliases are taken over by the others.
+        standby : bool
+            If True, start as a passive hot-standby: the aliases are loaded,
+            their targets' registrations tracked and their transforms
+            compiled but nothing is registered or forwarded until the lease
+            property '<prefix>lease' (refreshed by the active server) is
+            released or expires. The server then takes over and holds the
+            lease itself. (Cannot be combined with sharding or clustering.)
+        lease_interval : float
+            (Standby only.) Seconds between refreshes of the lease while
+            active.
+        lease_timeout : float
+            (Standby only.) Seconds without a lease refresh after which a
+            passive server takes over.
+        stats_interval : float or None
+            If given, publish throughput and latency statistics to the
+            '<prefix>stats' property every this many seconds. Sharded
+            workers and cluster members publish the statistics of their own
+            share of the aliases to '<prefix>stats/shard/<n>' and
+            '<prefix>stats/node/<node_id>' respectively.
+        stats_per_alias : bool
+            If True (and stats_interval is given), also publish each alias'
+            statistics to '<prefix>stats/<alias path>'.
+        trace_rate : float or None
+            If given, trace this fraction (0.0 - 1.0) of the values forwarded
+            by aliases, recording when each was received, transformed and
+            published into the sinks below.
+        trace_buffer : int
+            (Tracing only.) If non-zero, keep this many of the most recent
+            spans in memory.
+        trace_file : str or None
+            (Tracing only.) If given, append spans to this file as JSON
+            lines.
+        trace_event : bool
+            (Tracing only.) If True, send each span to the '<prefix>trace'
+            event.
+        profile_dir : str or None
+            The directory into which profiles requested via the
+            '<prefix>profile' event are written. Defaults to the system's
+            temporary directory.
+        error_window : float
+            Repeated errors of the same kind from the same alias within this
+            many seconds are reported as a single summary event at the end of
+            the window. The current errors of each alias are published in
+            '<prefix>errors'.
+        record_file : str or None
+            If given, record every value forwarded by an alias (and every
+            change to the set of aliases) to this capture file, for replay
+            with 'qth_alias-bench replay'. Several servers (e.g. sharded
+            workers) may share a capture file.
+        lazy_timeout : float
+            Lazy event aliases stop watching their target once this many
+            seconds pass without an activation request (via
+            '<prefix>activate').
+        echo_suppression : str
+            How aliases recognise (and ignore) the echoes of their own writes.
+            "counter" counts the writes not yet received back, relying on the
+            broker delivering the messages on a path in order. "value"
+            ignores the next receipt of each value written, for brokers (or
+            bridges) which do not echo a client's own messages in order.
+        settle_window : float
+            Apply changes to a target's registration only once it has not
+            changed for this many seconds, coalescing the flapping
+            registrations of restarting devices (0 to apply changes
+            immediately).
         """
-        self._cache_file = cache_file
+        self._lazy_timeout = lazy_timeout
+        self._echo_suppression = echo_suppression
+
+        # Reconciles aliases once their target's registration settles
+        self._settle_window = settle_window
+        self._reconciler = Reconciler(settle_window)
+
+        self._transform_cache_size = transform_cache_size
+        self._transform_budget = transform_budget
+        self._quarantine_after = quarantine_after
+
+        # Pools used to execute transforms with the 'thread' and 'process'
+        # execution policies, created on demand. {policy: Executor, ...}
+        self._executors = {}
 
         self._add_path = prefix + "add"
         self._remove_path = prefix + "remove"
         self._aliases_path = prefix + "aliases"
         self._error_path = prefix + "error"
 
-        self._client = qth.Client(
-            "qth_alias",
-            "Defines aliases of Qth properties and events.",
-            host=host, port=port, keepalive=keepalive
-        )
+        # When the aliases are split between several workers or cluster
+        # members, each publishes the details of its own share of the aliases
+        # under this name (None for the sole server or the control plane).
+        if shard is not None:
+            self._owner = "shard/{}".format(shard)
+        elif node_id is not None:
+            self._owner = "node/{}".format(node_id)
+        else:
+            self._owner = None
+
+        self._errors_path = self._owner_path(prefix + "errors")
+        self._shards_path = prefix + "shards/"
+        self._lease_path = prefix + "lease"
+        self._stats_path = self._owner_path(prefix + "stats")
+        self._trace_path = prefix + "trace"
+        self._profile_path = prefix + "profile"
+        self._profile_response_path = prefix + "profile_response"
+        self._memory_path = prefix + "memory"
+        self._memory_response_path = prefix + "memory_response"
+        self._snapshot_path = prefix + "snapshot"
+        self._snapshot_response_path = prefix + "snapshot_response"
+        self._activate_path = prefix + "activate"
+
+        self._shards = shards
+        self._shard = shard
+
+        # The alias specifications most recently published for each worker.
+        # {shard: {"path/to/alias": spec, ...}, ...}
+        self._published_shards = {}
+
+        if client is None:
+            client = qth.Client(
+                "qth_alias",
+                "Defines aliases of Qth properties and events.",
+                host=host, port=port, keepalive=keepalive
+            )
+        self._client = client
+
+        if ls is None:
+            ls = Ls(self._client)
+        self._ls = ls
+
+        self._heartbeat_interval = heartbeat_interval
+        if node_id is not None:
+            self._cluster = Cluster(self._client, prefix + "nodes/", node_id,
+                                    self._rebalance, heartbeat_interval,
+                                    node_timeout)
+        else:
+            self._cluster = None
+
+        # (Clusters only.) Has the aliases property been received?
+        self._aliases_received = False
+        self._publish_initial_aliases_task = None
+
+        # (Standby only.) Is this server serving aliases? The lease holder
+        # identifies this server in the lease property.
+        self._standby = standby
+        self._active = not standby
+        self._lease_interval = lease_interval
+        self._lease_timeout = lease_timeout
+        self._lease_holder = "{}:{}".format(socket.gethostname(), os.getpid())
+
+        # (Standby only.) When the lease was last refreshed (loop.time()),
+        # an event set when it is released and the task which either waits
+        # for it to become available or refreshes it.
+        self._lease_seen = None
+        self._lease_released = asyncio.Event()
+        self._lease_task = None
+
+        # (Standby only.) The other server to which this server's current
+        # claim of the lease was lost (or None): one still refreshing the
+        # lease or claiming it with a lower holder name.
+        self._claim_lost_to = None
+
+        # Server-wide statistics and the task which samples and publishes
+        # them.
+        self._stats = ServerStats()
+        self._stats_interval = stats_interval
+        self._stats_per_alias = stats_per_alias
+        self._stats_task = None
 
-        self._ls = Ls(self._client)
+        # The cache file (written in the background)
+        self._cache = CacheFile(cache_file, self._stats)
+
+        # The aliases whose statistics properties are registered
+        self._stats_aliases = set()
+
+        # Reports (and coalesces) errors
+        self._errors = ErrorReporter(self._client, self._error_path,
+                                     self._errors_path, error_window)
+
+        # Tracer for forwarded values (or None if disabled) and its
+        # in-memory sink (if any).
+        self._trace_event = trace_event
+        self._trace_buffer = None
+        if trace_rate is not None:
+            sinks = []
+            if trace_buffer:
+                self._trace_buffer = RingBufferSink(trace_buffer)
+                sinks.append(self._trace_buffer)
+            if trace_file is not None:
+                sinks.append(JsonLinesSink(trace_file))
+            if trace_event:
+                sinks.append(EventSink(self._client, self._trace_path))
+            self._tracer = Tracer(sinks, trace_rate)
+        else:
+            self._tracer = None
+
+        # Recorder of forwarded values (or None if not recording)
+        if record_file is not None:
+            self._recorder = Recorder(record_file, source=prefix)
+        else:
+            self._recorder = None
+
+        # The profile currently being collected (or None) and the task
+        # which will end it.
+        self._profile_dir = profile_dir or tempfile.gettempdir()
+        self._profile = None
+        self._profile_task = None
 
         # Lock to hold while self._aliases is being updated.
         self._aliases_lock = asyncio.Lock()
@@ -73,16 +355,73 @@ class AliasServer(object):
 
     async def async_init(self):
         """Call asynchronously shortly after construction to complete setup."""
+        # Workers just serve the aliases assigned to them
+        if self._shard is not None:
+            await asyncio.wait(list(map(asyncio.create_task, [
+                self._client.register(self._errors_path,
+                                      qth.PROPERTY_ONE_TO_MANY,
+                                      "The errors recently encountered by "
+                                      "each alias served by worker "
+                                      "{}.".format(self._shard),
+                                      delete_on_unregister=True),
+                self._client.watch_property(
+                    self._shard_path(self._shard), self._on_shard_change),
+                self._client.watch_event(self._snapshot_path,
+                                         self._on_snapshot),
+                self._client.watch_event(self._activate_path,
+                                         self._on_activate),
+            ] + ([
+                self._client.register(self._stats_path,
+                                      qth.PROPERTY_ONE_TO_MANY,
+                                      "Throughput and latency statistics for "
+                                      "the aliases served by worker "
+                                      "{}.".format(self._shard),
+                                      delete_on_unregister=True)
+            ] if self._stats_interval is not None else []))))
+            self._start_stats()
+            return
 
         # Load existing aliases from file
-        initial_aliases = {}
-        try:
-            with open(self._cache_file, "r") as f:
-                initial_aliases = json.load(f)
-        except Exception as e:
-            logging.exception(e)
+        initial_aliases = await self._cache.load()
+
+        # A standby server prepares the cached aliases (before any newer set
+        # published by the active server arrives)
+        if self._standby:
+            await self._update_aliases(initial_aliases)
 
-        # Register with Qth Registrar
+        await asyncio.wait(list(map(asyncio.create_task, [
+            self._client.watch_event(self._add_path, self._on_add),
+            self._client.watch_event(self._remove_path, self._on_remove),
+            self._client.watch_event(self._profile_path, self._on_profile),
+            self._client.watch_event(self._memory_path, self._on_memory),
+            self._client.watch_event(self._snapshot_path, self._on_snapshot),
+            self._client.watch_event(self._activate_path, self._on_activate),
+            self._client.watch_property(self._aliases_path, self._on_change),
+        ])))
+
+        # ...then waits to take over
+        if self._standby:
+            self._lease_seen = asyncio.get_running_loop().time()
+            await self._client.watch_property(self._lease_path,
+                                              self._on_lease)
+            self._lease_task = asyncio.create_task(self._await_lease())
+            return
+
+        await self._register()
+        self._start_stats()
+
+        # Set property to initialise the alias set (and also the property in
+        # Qth).
+        if self._cluster is None:
+            await self._client.set_property(self._aliases_path,
+                                            initial_aliases)
+        else:
+            await self._cluster.start()
+            self._publish_initial_aliases_task = asyncio.create_task(
+                self._publish_initial_aliases(initial_aliases))
+
+    async def _register(self):
+        """Register the control paths with the Qth Registrar."""
         await asyncio.wait(list(map(asyncio.create_task, [
             self._client.register(self._aliases_path,
                                   qth.PROPERTY_ONE_TO_MANY,
@@ -100,7 +439,9 @@ class AliasServer(object):
                                   "'path/to/target', 'alias': "
                                   "'path/to/alias', 'transform': 'f(value)', "
                                   "'inverse': 'f_inverse(value)', "
-                                  "'description': '...'}, ...}"),
+                                  "'description': '...'}, ...}. Several "
+                                  "aliases may be added at once by sending "
+                                  "a list of these."),
             self._client.register(self._remove_path,
                                   qth.EVENT_MANY_TO_ONE,
                                   "Remove an alias. Call with the alias' "
@@ -108,133 +449,718 @@ class AliasServer(object):
             self._client.register(self._error_path, qth.EVENT_ONE_TO_MANY,
                                   "An event raised whenever qth_alias "
                                   "encounters a problem."),
-            self._client.watch_event(self._add_path, self._on_add),
-            self._client.watch_event(self._remove_path, self._on_remove),
-            self._client.watch_property(self._aliases_path, self._on_change),
+            self._client.register(self._errors_path,
+                                  qth.PROPERTY_ONE_TO_MANY,
+                                  "The errors recently encountered by each "
+                                  "alias.",
+                                  delete_on_unregister=True),
+            self._client.register(self._profile_path, qth.EVENT_MANY_TO_ONE,
+                                  "Profile the server for the given number "
+                                  "of seconds. The result is sent to "
+                                  "{}.".format(self._profile_response_path)),
+            self._client.register(self._profile_response_path,
+                                  qth.EVENT_ONE_TO_MANY,
+                                  "The results of profiles requested via "
+                                  "{}.".format(self._profile_path)),
+            self._client.register(self._memory_path, qth.EVENT_MANY_TO_ONE,
+                                  "Report memory usage (to {}). Send 'start' "
+                                  "or 'stop' to start or stop tracing memory "
+                                  "allocations or null to report.".format(
+                                      self._memory_response_path)),
+            self._client.register(self._memory_response_path,
+                                  qth.EVENT_ONE_TO_MANY,
+                                  "Memory usage reports requested via "
+                                  "{}.".format(self._memory_path)),
+            self._client.register(self._snapshot_path, qth.EVENT_MANY_TO_ONE,
+                                  "Request the current values of a list of "
+                                  "aliases ({{\"id\": ..., \"aliases\": "
+                                  "[path, ...]}}) or of all aliases with a "
+                                  "prefix ({{\"id\": ..., \"prefix\": "
+                                  "prefix}}). The values are sent to "
+                                  "{}.".format(self._snapshot_response_path)),
+            self._client.register(self._snapshot_response_path,
+                                  qth.EVENT_ONE_TO_MANY,
+                                  "Alias values requested via {}: "
+                                  "{{\"id\": ..., \"values\": {{path: "
+                                  "value, ...}}}}.".format(
+                                      self._snapshot_path)),
+            self._client.register(self._activate_path, qth.EVENT_MANY_TO_ONE,
+                                  "Request that a lazy alias (or a list of "
+                                  "lazy aliases) forwards target events for "
+                                  "the next {} seconds. Consumers should "
+                                  "repeat the request while "
+                                  "listening.".format(self._lazy_timeout)),
+        ] + ([
+            self._client.register(self._stats_path, qth.PROPERTY_ONE_TO_MANY,
+                                  "Throughput and latency statistics for "
+                                  "all aliases.",
+                                  delete_on_unregister=True)
+        ] if self._stats_interval is not None else []) + ([
+            self._client.register(self._trace_path, qth.EVENT_ONE_TO_MANY,
+                                  "Timings of values forwarded by "
+                                  "aliases.")
+        ] if self._tracer is not None and self._trace_event else []) + [
+            self._client.register(self._shard_path(shard),
+                                  qth.PROPERTY_ONE_TO_MANY,
+                                  "The aliases served by qth_alias worker "
+                                  "process {}.".format(shard),
+                                  delete_on_unregister=True)
+            for shard in range(self._shards) if self._shards > 1
         ])))
 
-        # Set property to initialise the alias set (and also the property in
-        # Qth).
-        await self._client.set_property(self._aliases_path, initial_aliases)
+    async def _await_lease(self):
+        """(Standby only.) Take over once the lease is released or has not
+        been refreshed for lease_timeout seconds (and this server wins the
+        claim for it)."""
+        loop = asyncio.get_running_loop()
+        while True:
+            timeout = self._lease_seen + self._lease_timeout - loop.time()
+            if timeout <= 0:
+                logging.info("Lease expired: claiming it.")
+                window = self._lease_interval
+            else:
+                try:
+                    await asyncio.wait_for(self._lease_released.wait(),
+                                           timeout)
+                    logging.info("Lease released: claiming it.")
+                    window = min(self._lease_interval, RELEASED_CLAIM_WINDOW)
+                except asyncio.TimeoutError:
+                    continue
+
+            if await self._claim_lease(window):
+                break
+
+        await self._take_over()
+
+    async def _claim_lease(self, window):
+        """(Standby only.) Claim the lease, returning True unless, within
+        'window' seconds, another server refreshes it (i.e. was still serving
+        the aliases after all) or claims it with a lower holder name. (When
+        several standbys claim the lease at once, just one takes over.)
+
+        An expired lease is claimed for a whole lease interval so that a
+        server which had merely stalled has a chance to refresh it.
+        """
+        self._lease_released.clear()
+        self._claim_lost_to = None
+        await self._client.set_property(self._lease_path, {
+            "holder": self._lease_holder,
+            "sequence": 0,
+        })
+        await asyncio.sleep(window)
+
+        lost_to = self._claim_lost_to
+        self._claim_lost_to = None
+        if lost_to is not None:
+            logging.info("Lease held by %s: standing by.", lost_to)
+            self._lease_seen = asyncio.get_running_loop().time()
+            return False
+        return True
+
+    async def _take_over(self):
+        """(Standby only.) Start serving the (already prepared) aliases."""
+        start = asyncio.get_running_loop().time()
+        self._active = True
+        await asyncio.wait([asyncio.create_task(c) for c in [
+            self._register(),
+            self._client.register(self._lease_path, qth.PROPERTY_ONE_TO_MANY,
+                                  "The qth_alias server currently serving "
+                                  "the aliases.",
+                                  delete_on_unregister=True),
+            self._client.set_property(self._lease_path, {
+                "holder": self._lease_holder,
+                "sequence": 0,
+            }),
+        ]])
+        self._lease_task = asyncio.create_task(self._refresh_lease())
+        self._start_stats()
+
+        async with self._aliases_lock:
+            todo = [alias.activate() for alias in self._aliases.values()]
+            todo.append(self._client.set_property(self._aliases_path,
+                                                  self._aliases_json))
+            await asyncio.wait([asyncio.create_task(c) for c in todo])
+
+        logging.info("Took over %d aliases in %.3f s.",
+                     len(self._aliases),
+                     asyncio.get_running_loop().time() - start)
+
+    async def _refresh_lease(self):
+        """(Standby only.) Task which refreshes the lease while active."""
+        sequence = 1
+        while True:
+            await asyncio.sleep(self._lease_interval)
+            await self._client.set_property(self._lease_path, {
+                "holder": self._lease_holder,
+                "sequence": sequence,
+            })
+            sequence += 1
+
+    async def _on_lease(self, _topic, lease):
+        """(Standby only.) Callback from changes to the lease property."""
+        holder = lease.get("holder") if isinstance(lease, dict) else None
+        if self._active:
+            # Another server is active too (e.g. this one stalled for longer
+            # than the lease timeout): the higher holder name steps down.
+            # (Standbys' claims are ignored: they back off on seeing this
+            # server refresh the lease.)
+            if (holder is not None and holder != self._lease_holder and
+                    lease.get("sequence", 0) > 0):
+                if holder < self._lease_holder:
+                    await self._step_down(holder)
+                else:
+                    logging.warning("Lease also held by %s.", holder)
+        elif lease is qth.Empty:
+            self._lease_released.set()
+        else:
+            self._lease_seen = asyncio.get_running_loop().time()
+            if holder is not None and holder != self._lease_holder and (
+                    lease.get("sequence", 0) > 0 or
+                    holder < self._lease_holder):
+                self._claim_lost_to = holder
+
+    async def _step_down(self, holder):
+        """(Standby only.) Return to standing by after finding that another
+        server, with a lower holder name, is also serving the aliases (e.g.
+        because this server stalled for longer than the lease timeout).
+
+        The aliases are left passive without applying their on_unregister or
+        delete_on_unregister behaviour (and the lease is not deleted) since
+        the other server still serves them.
+        """
+        logging.warning("Lease also held by %s: standing by.", holder)
+        paths = self._registered_paths() + [self._lease_path]
+        self._active = False
+
+        if self._lease_task is not None:
+            self._lease_task.cancel()
+            self._lease_task = None
+        if self._stats_task is not None:
+            self._stats_task.cancel()
+            self._stats_task = None
+
+        async with self._aliases_lock:
+            await asyncio.wait([asyncio.create_task(c) for c in [
+                self._client.unregister(path) for path in paths
+            ] + [
+                alias.deactivate() for alias in self._aliases.values()
+            ]])
+            self._stats_aliases = set()
+
+        self._lease_seen = asyncio.get_running_loop().time()
+        self._lease_released.clear()
+        self._lease_task = asyncio.create_task(self._await_lease())
+
+    def _registered_paths(self):
+        """The control paths registered by _register()."""
+        paths = [
+            self._aliases_path,
+            self._add_path,
+            self._remove_path,
+            self._error_path,
+            self._errors_path,
+            self._profile_path,
+            self._profile_response_path,
+            self._memory_path,
+            self._memory_response_path,
+            self._snapshot_path,
+            self._snapshot_response_path,
+            self._activate_path,
+        ] + [
+            self._shard_path(shard)
+            for shard in range(self._shards) if self._shards > 1
+        ] + self._stats_paths()
+        if self._tracer is not None and self._trace_event:
+            paths.append(self._trace_path)
+        return paths
+
+    def _stats_paths(self):
+        """The statistics properties registered by this server."""
+        if self._stats_interval is None or not self._active:
+            return []
+        return [self._stats_path] + [
+            "{}/{}".format(self._stats_path, path)
+            for path in self._stats_aliases]
+
+    def _start_stats(self):
+        """Start sampling and publishing statistics (if enabled)."""
+        if self._stats_interval is not None:
+            self._stats_task = asyncio.create_task(self._run_stats())
+
+    async def _run_stats(self):
+        """Task which samples the event loop lag and periodically publishes
+        the statistics."""
+        loop = asyncio.get_running_loop()
+        next_publish = loop.time() + self._stats_interval
+        while True:
+            wake = loop.time() + LOOP_LAG_INTERVAL
+            await asyncio.sleep(LOOP_LAG_INTERVAL)
+            now = loop.time()
+            self._stats.loop_lag.add(max(0.0, now - wake))
+
+            if now >= next_publish:
+                next_publish = now + self._stats_interval
+                await self._publish_stats()
+
+    async def _publish_stats(self):
+        """Publish the aggregate (and optionally per-alias) statistics."""
+        aliases = {path: alias for path, alias in self._aliases.items()
+                   if not isinstance(alias, RemoteAlias)}
+
+        total = AliasStats()
+        for alias in aliases.values():
+            alias._update_memo_stats()
+            total.merge(alias._stats)
+
+        stats = total.json
+        stats.update(self._stats.json)
+        stats["aliases"] = len(aliases)
+        stats["pending_tasks"] = len(asyncio.all_tasks())
+
+        todo = [self._client.set_property(self._stats_path, stats)]
+
+        if self._stats_per_alias:
+            for path in set(aliases) - self._stats_aliases:
+                todo.append(self._client.register(
+                    "{}/{}".format(self._stats_path, path),
+                    qth.PROPERTY_ONE_TO_MANY,
+                    "Throughput and latency statistics for alias "
+                    "{}.".format(path),
+                    delete_on_unregister=True))
+            for path in self._stats_aliases - set(aliases):
+                todo.append(self._client.unregister(
+                    "{}/{}".format(self._stats_path, path)))
+                todo.append(self._client.delete_property(
+                    "{}/{}".format(self._stats_path, path)))
+            self._stats_aliases = set(aliases)
+
+            for path, alias in aliases.items():
+                todo.append(self._client.set_property(
+                    "{}/{}".format(self._stats_path, path),
+                    alias._stats.json))
+
+        await asyncio.wait([asyncio.create_task(c) for c in todo])
+
+    async def _publish_initial_aliases(self, initial_aliases):
+        """(Clusters only.) Publish the cached set of aliases if, once the
+        other members have had a chance to announce themselves, no other
+        member has already done so and this member is the leader."""
+        await asyncio.sleep(self._heartbeat_interval)
+        if not self._aliases_received and self._cluster.is_leader:
+            await self._client.set_property(self._aliases_path,
+                                            initial_aliases)
 
     async def close(self):
         """Shut down the alias server"""
+        if self._cluster is not None:
+            if self._publish_initial_aliases_task is not None:
+                self._publish_initial_aliases_task.cancel()
+            await self._cluster.stop()
+
+        if self._lease_task is not None:
+            self._lease_task.cancel()
+            self._lease_task = None
+        if self._stats_task is not None:
+            self._stats_task.cancel()
+            self._stats_task = None
+        if self._profile_task is not None:
+            self._profile_task.cancel()
+            self._profile_task = None
+            self._profile.stop()
+            self._profile = None
+        self._reconciler.close()
+
         async with self._aliases_lock:
+            if self._shard is not None:
+                todo = [
+                    self._client.unregister(self._errors_path),
+                    self._client.unwatch_property(
+                        self._shard_path(self._shard), self._on_shard_change),
+                    self._client.unwatch_event(self._snapshot_path,
+                                               self._on_snapshot),
+                    self._client.unwatch_event(self._activate_path,
+                                               self._on_activate),
+                ] + [
+                    self._client.unregister(path)
+                    for path in self._stats_paths()
+                ]
+            elif not self._active:
+                todo = [
+                    self._client.unwatch_event(self._add_path, self._on_add),
+                    self._client.unwatch_event(self._remove_path,
+                                               self._on_remove),
+                    self._client.unwatch_event(self._profile_path,
+                                               self._on_profile),
+                    self._client.unwatch_event(self._memory_path,
+                                               self._on_memory),
+                    self._client.unwatch_event(self._snapshot_path,
+                                               self._on_snapshot),
+                    self._client.unwatch_event(self._activate_path,
+                                               self._on_activate),
+                    self._client.unwatch_property(self._aliases_path,
+                                                  self._on_change),
+                    self._client.unwatch_property(self._lease_path,
+                                                  self._on_lease),
+                ]
+            else:
+                todo = [
+                    self._client.unregister(path)
+                    for path in self._registered_paths()
+                ] + [
+                    self._client.unwatch_event(self._add_path, self._on_add),
+                    self._client.unwatch_event(self._remove_path,
+                                               self._on_remove),
+                    self._client.unwatch_event(self._profile_path,
+                                               self._on_profile),
+                    self._client.unwatch_event(self._memory_path,
+                                               self._on_memory),
+                    self._client.unwatch_event(self._snapshot_path,
+                                               self._on_snapshot),
+                    self._client.unwatch_event(self._activate_path,
+                                               self._on_activate),
+                    self._client.unwatch_property(self._aliases_path,
+                                                  self._on_change),
+                ]
+
             # Unregister everything and delete all aliases
-            await asyncio.wait(list(map(asyncio.create_task, [
-                self._client.unregister(self._aliases_path),
-                self._client.unregister(self._add_path),
-                self._client.unregister(self._remove_path),
-                self._client.unregister(self._error_path),
-                self._client.unwatch_event(self._add_path, self._on_add),
-                self._client.unwatch_event(self._remove_path, self._on_remove),
-                self._client.unwatch_property(self._aliases_path,
-                                              self._on_change),
-            ] + [
+            await asyncio.wait(list(map(asyncio.create_task, todo + [
                 alias.delete() for alias in self._aliases.values()
             ])))
 
+            await self._errors.close()
+
             # Delete aliases property (after all watches have been removed)
-            await self._client.delete_property(self._aliases_path)
+            if self._shard is None and self._active:
+                await asyncio.wait(list(map(asyncio.create_task, [
+                    self._client.delete_property(self._aliases_path),
+                    self._client.delete_property(self._errors_path),
+                ] + [
+                    self._client.delete_property(self._shard_path(shard))
+                    for shard in range(self._shards) if self._shards > 1
+                ] + [
+                    self._client.delete_property(path)
+                    for path in self._stats_paths()
+                ])))
+            elif self._shard is not None:
+                await asyncio.wait(list(map(asyncio.create_task, [
+                    self._client.delete_property(self._errors_path),
+                ] + [
+                    self._client.delete_property(path)
+                    for path in self._stats_paths()
+                ])))
+            self._stats_aliases = set()
+
+            # Release the lease (once all aliases have been removed) allowing
+            # a standby to take over immediately
+            if self._standby and self._active:
+                await asyncio.wait([asyncio.create_task(c) for c in [
+                    self._client.unwatch_property(self._lease_path,
+                                                  self._on_lease),
+                    self._client.unregister(self._lease_path),
+                    self._client.delete_property(self._lease_path),
+                ]])
 
             self._aliases = {}
+            self._published_shards = {}
+
+            if self._tracer is not None:
+                self._tracer.close()
+            if self._recorder is not None:
+                await asyncio.get_running_loop().run_in_executor(
+                    None, self._recorder.close)
+
+            for executor in self._executors.values():
+                executor.shutdown(wait=False)
+            self._executors = {}
+
+        await self._cache.flush()
 
     @property
     def _aliases_json(self):
         """Return the JSON-serialisable equivilent of _aliases."""
         return {path: alias.json for path, alias in self._aliases.items()}
 
-    def _error_sync(self, message):
-        """Non-async wrapper around _error."""
-        asyncio.get_event_loop().create_task(self._error(message))
+    def _owner_path(self, path):
+        """The path under which this server publishes its own share of a
+        property (e.g. <prefix>errors/shard/<n> for a worker)."""
+        if self._owner is None:
+            return path
+        return "{}/{}".format(path, self._owner)
 
-    async def _error(self, message):
-        """Report an error via the console and meta/alias/error."""
-        logging.error(message)
-        await self._client.send_event(self._error_path, message)
+    def _shard_path(self, shard):
+        """The path of the property listing a worker's aliases."""
+        return "{}{}".format(self._shards_path, shard)
 
-    async def _on_add(self, _topic, alias_spec):
-        """Callback from the meta/alias/add event."""
-        # Convert from short-form
-        if isinstance(alias_spec, list):
-            if len(alias_spec) == 2:
-                alias_spec = {
-                    "target": alias_spec[0],
-                    "alias": alias_spec[1],
-                }
+    @property
+    def _is_leader(self):
+        """Should this server handle control requests? (Only one member of a
+        cluster does and a passive standby does not.)"""
+        return self._active and (self._cluster is None or
+                                 self._cluster.is_leader)
+
+    @property
+    def _part(self):
+        """(part, parts): This server's index among the servers (workers or
+        cluster members) which each serve a share of the aliases."""
+        if self._shard is not None:
+            return (self._shard, self._shards)
+        elif self._cluster is not None:
+            members = self._cluster.members
+            return (members.index(self._cluster.node_id), len(members))
+        else:
+            return (0, 1)
+
+    def _make_alias(self, spec):
+        """Construct the Alias object for an alias specification."""
+        if self._shards > 1 and self._shard is None:
+            return RemoteAlias(self, **spec)
+        elif (self._cluster is not None and
+                not self._cluster.owns(spec["alias"])):
+            return RemoteAlias(self, **spec)
+        elif isinstance(spec["target"], list):
+            return ComputedAlias(self, **spec)
+        else:
+            return Alias(self, **spec)
+
+    def _get_executor(self, policy):
+        """Get the executor for the 'thread' or 'process' execution policy."""
+        executor = self._executors.get(policy)
+        if executor is None:
+            if policy == "thread":
+                executor = ThreadPoolExecutor()
             else:
-                await self._error(
-                    "{}: short form alias must have two entries".format(
-                        self._add_path))
-                return
+                executor = ProcessPoolExecutor()
+            self._executors[policy] = executor
+        return executor
 
-        if not isinstance(alias_spec, dict):
-            await self._error("{}: expected a list or dictionary".format(
-                self._add_path))
-            return
+    def _error_sync(self, message, alias=None, kind=None):
+        """Non-async wrapper around _error."""
+        self._errors.report_sync(message, alias, kind)
 
-        # Check for missing target/alias
-        if "target" not in alias_spec:
-            await self._error("{}: no 'target' in alias specification.".format(
-                self._add_path))
-            return
-        if "alias" not in alias_spec:
-            await self._error("{}: no 'alias' in alias specification.".format(
-                self._add_path))
-            return
+    async def _error(self, message, alias=None, kind=None):
+        """Report an error via the console and meta/alias/error. Repeated
+        errors of the same kind for the same alias are coalesced."""
+        await self._errors.report(message, alias, kind)
 
-        # Fill in defaults
-        if "transform" not in alias_spec:
-            alias_spec["transform"] = None
-        if "inverse" not in alias_spec:
-            alias_spec["inverse"] = None
-        if "description" not in alias_spec:
-            alias_spec["description"] = "Alias of {}.".format(
-                alias_spec["target"])
-
-        # Check for extra fields
-        fields = set(alias_spec)
-        expected = set("target alias transform inverse description".split())
-        if fields != expected:
-            await self._error("{}: unexpected extra fields {}".format(
-                self._add_path,
-                ", ".join(map(repr, fields - expected))
-            ))
+    async def _on_add(self, _topic, alias_spec):
+        """Callback from the meta/alias/add event."""
+        if not self._is_leader:
             return
 
-        # Validate the provided entries
-        if "target" not in alias_spec:
-            await self._error("{}: expected a 'target' entry".format(
-                self._add_path))
-            return
-        if "alias" not in alias_spec:
-            await self._error(": expected an 'alias' entry".format(
-                self._add_path))
-            return
-        if ((alias_spec["transform"] is None) !=
-                (alias_spec["inverse"] is None)):
-            await self._error(
-                "{}: expected either both or neither of 'transform' and "
-                "'inverse' to be supplied.".format(
-                    self._add_path))
-            return
+        # Several aliases may be added at once as a list of specifications
+        if (isinstance(alias_spec, list) and alias_spec and
+                all(isinstance(spec, (dict, list)) for spec in alias_spec)):
+            specs = alias_spec
+        else:
+            specs = [alias_spec]
 
-        # Insert into the specification
+        # Invalid specifications are reported (and skipped)
         aliases = self._aliases_json.copy()
-        aliases[alias_spec["alias"]] = alias_spec
+        for spec in specs:
+            try:
+                spec = validate_spec(spec)
+            except ValueError as e:
+                await self._error("{}: {}".format(self._add_path, e))
+                continue
+            aliases[spec["alias"]] = spec
         await self._update_aliases(aliases)
 
     async def _on_remove(self, _topic, alias_path):
         """Callback from the meta/alias/remove event."""
+        if not self._is_leader:
+            return
+
         # Remove the alias
         aliases = self._aliases_json.copy()
         aliases.pop(alias_path, None)
         await self._update_aliases(aliases)
 
+    async def _on_profile(self, _topic, duration):
+        """Callback from the meta/alias/profile event."""
+        if not self._active:
+            return
+
+        if (not isinstance(duration, (int, float)) or
+                isinstance(duration, bool) or duration <= 0):
+            await self._error("{}: expected a positive number of "
+                              "seconds.".format(self._profile_path))
+            return
+        if self._profile is not None:
+            await self._error("{}: a profile is already running.".format(
+                self._profile_path))
+            return
+
+        logging.info("Profiling for %s seconds.", duration)
+        self._profile = Profile()
+        self._profile.start()
+        self._profile_task = asyncio.create_task(
+            self._finish_profile(duration))
+
+    async def _finish_profile(self, duration):
+        """Stop profiling after 'duration' seconds, write the profile to a
+        file and send a summary to meta/alias/profile_response."""
+        await asyncio.sleep(duration)
+        profile = self._profile
+        self._profile = None
+        self._profile_task = None
+        profile.stop()
+
+        report = profile.report()
+        filename = os.path.join(
+            self._profile_dir,
+            "qth_alias-{}.prof".format(time.strftime("%Y%m%d-%H%M%S")))
+        try:
+            profile.write(filename)
+            report["file"] = filename
+        except OSError as e:
+            logging.exception(e)
+            report["file"] = None
+
+        logging.info("Profile written to %s.", filename)
+        await self._client.send_event(self._profile_response_path, report)
+
+    async def _on_memory(self, _topic, request):
+        """Callback from the meta/alias/memory event."""
+        if not self._active:
+            return
+
+        if request == "start":
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+        elif request == "stop":
+            tracemalloc.stop()
+        elif request is not None:
+            await self._error("{}: expected 'start', 'stop' or null.".format(
+                self._memory_path))
+            return
+
+        response = {
+            "tracing": tracemalloc.is_tracing(),
+            "aliases": len(self._aliases),
+        }
+        report = memory_report()
+        if report is not None:
+            response.update(report)
+        await self._client.send_event(self._memory_response_path, response)
+
+    async def _on_snapshot(self, _topic, request):
+        """Callback from the meta/alias/snapshot event."""
+        if not self._active:
+            return
+
+        if not (isinstance(request, dict) and
+                set(request) <= set(["id", "aliases", "prefix"]) and
+                ("aliases" in request) != ("prefix" in request) and
+                (isinstance(request.get("prefix", ""), str)) and
+                isinstance(request.get("aliases", []), list) and
+                all(isinstance(path, str)
+                    for path in request.get("aliases", []))):
+            # (Reported just once, not by every worker or cluster member)
+            if self._shard is None and self._is_leader:
+                await self._error(
+                    "{}: expected {{\"id\": ..., \"aliases\": [path, "
+                    "...]}} or {{\"id\": ..., \"prefix\": "
+                    "prefix}}.".format(self._snapshot_path))
+            return
+
+        # The aliases of a sharded server are served by its workers
+        if self._shards > 1 and self._shard is None:
+            return
+
+        if "aliases" in request:
+            aliases = [(path, self._aliases.get(path))
+                       for path in request["aliases"]]
+        else:
+            aliases = [(path, alias) for path, alias in self._aliases.items()
+                       if path.startswith(request["prefix"])]
+
+        values = {}
+        for path, alias in aliases:
+            if alias is not None:
+                value = alias.value
+                if value is not qth.Empty:
+                    values[path] = value
+
+        part, parts = self._part
+        await self._client.send_event(self._snapshot_response_path, {
+            "id": request.get("id"),
+            "values": values,
+            "part": part,
+            "parts": parts,
+        })
+
+    async def _on_activate(self, _topic, request):
+        """Callback from the meta/alias/activate event."""
+        if not self._active:
+            return
+
+        paths = request if isinstance(request, list) else [request]
+        if not all(isinstance(path, str) for path in paths):
+            # (Reported just once, not by every worker or cluster member)
+            if self._shard is None and self._is_leader:
+                await self._error(
+                    "{}: expected an alias path or a list of paths.".format(
+                        self._activate_path))
+            return
+
+        todo = []
+        for path in paths:
+            alias = self._aliases.get(path)
+            if alias is not None:
+                todo.append(alias.demand(self._lazy_timeout))
+        if todo:
+            await asyncio.wait([asyncio.create_task(c) for c in todo])
+
     async def _on_change(self, _topic, aliases):
         """Callback from changes to meta/alias/aliases property."""
+        # A passive standby keeps its aliases when the active server deletes
+        # the property as it shuts down
+        if aliases is qth.Empty and not self._active:
+            return
+        self._aliases_received = True
+        await self._update_aliases(aliases)
+
+    async def _on_shard_change(self, _topic, aliases):
+        """(Workers only.) Callback from changes to the set of aliases
+        assigned to this worker."""
+        if aliases is qth.Empty:
+            aliases = {}
         await self._update_aliases(aliases)
 
+    def _publish_shards(self):
+        """Return coroutines which publish the aliases assigned to each worker
+        (where changed)."""
+        shards = {shard: {} for shard in range(self._shards)}
+        for path, spec in self._aliases_json.items():
+            shards[shard_of(path, self._shards)][path] = spec
+
+        todo = []
+        for shard, aliases in shards.items():
+            if self._published_shards.get(shard) != aliases:
+                self._published_shards[shard] = aliases
+                todo.append(self._client.set_property(
+                    self._shard_path(shard), aliases))
+        return todo
+
+    async def _rebalance(self):
+        """(Clusters only.) Start or stop serving aliases locally following a
+        change in cluster membership."""
+        async with self._aliases_lock:
+            todo = []
+            moved = []
+            for path, alias in list(self._aliases.items()):
+                if self._cluster.owns(path) == isinstance(alias, RemoteAlias):
+                    moved.append(path)
+                    todo.append(alias.delete())
+                    alias = self._aliases[path] = self._make_alias(alias.json)
+                    todo.append(alias.async_init())
+
+            logging.info("Cluster members: %s. Moved aliases: %s.",
+                         ", ".join(self._cluster.members), ", ".join(moved))
+
+            if todo:
+                await asyncio.wait([asyncio.create_task(c) for c in todo])
+
     async def _update_aliases(self, aliases):
         """Update the set of aliases to match a new specification."""
         async with self._aliases_lock:
@@ -242,15 +1168,20 @@ class AliasServer(object):
             if self._aliases_json == aliases:
                 return
 
-            # Check for dependency cycles
-            cycle = has_cycle({a["alias"]: a["target"]
-                               for a in aliases.values()})
+            # Check for dependency cycles (the control plane has already
+            # done this for workers)
+            if self._shard is not None:
+                cycle = None
+            else:
+                cycle = has_cycle({a["alias"]: a["target"]
+                                   for a in aliases.values()})
             if cycle:
                 # Revert if cycle is found
                 await self._error("cyclic alias dependency: {}".format(
                     " -> ".join(cycle)))
-                await self._client.set_property(self._aliases_path,
-                                                self._aliases_json)
+                if self._is_leader:
+                    await self._client.set_property(self._aliases_path,
+                                                    self._aliases_json)
                 return
 
             old_aliases = set(self._aliases)
@@ -273,23 +1204,37 @@ class AliasServer(object):
 
             # Update the set of aliases
             for path in removed | changed:
+                self._errors.forget(path)
                 todo.append(self._aliases.pop(path).delete())
             for path in added | changed:
-                alias = Alias(self, **aliases[path])
+                alias = self._make_alias(aliases[path])
                 todo.append(alias.async_init())
                 self._aliases[path] = alias
 
+            # (Workers' aliases are a share of those recorded by the control
+            # process.)
+            if (self._recorder is not None and self._shard is None and
+                    (added or changed or removed)):
+                self._recorder.record_aliases(self._aliases_json)
+
+            # Workers have no control plane to update
+            if self._shard is not None:
+                if todo:
+                    await asyncio.wait([asyncio.create_task(c) for c in todo])
+                return
+
             # Update the property
-            todo.append(self._client.set_property(
-                self._aliases_path,
-                self._aliases_json))
+            if self._is_leader:
+                todo.append(self._client.set_property(
+                    self._aliases_path,
+                    self._aliases_json))
+
+            # Reassign aliases to workers
+            if self._shards > 1:
+                todo.extend(self._publish_shards())
 
             if todo:
                 await asyncio.wait([asyncio.create_task(c) for c in todo])
 
-            # Save aliases to file
-            try:
-                with open(self._cache_file, "w") as f:
-                    json.dump(self._aliases_json, f)
-            except Exception as e:
-                logging.exception(e)
+            # Save aliases to file (written in the background)
+            self._cache.save(self._aliases_json)
@@ -0,0 +1,168 @@
+"""
+Offline checking, import and export of alias files (see
+:py:mod:`qth_alias.spec`), used by the 'check', 'import' and 'export'
+subcommands of the qth_alias command::
+
+    $ qth_alias check aliases.jsonl
+    $ qth_alias import aliases.jsonl --chunk-size 500
+    $ qth_alias export aliases.jsonl
+"""
+
+import asyncio
+
+import qth
+
+from qth_alias import has_cycle
+from qth_alias.spec import validate_spec
+from qth_alias.transform import Transform
+
+
+def check_specs(specs):
+    """Validate a series of alias specifications, check them for dependency
+    cycles and compile their transforms, without contacting a server.
+
+    Parameters
+    ----------
+    specs : iterable
+        Alias specifications (in short or long form), e.g. from
+        :py:func:`qth_alias.spec.read_specs`.
+
+    Returns
+    -------
+    aliases : {path: spec, ...}
+        The valid specifications (in long form). Later specifications for
+        the same alias replace earlier ones, as they would when added.
+    errors : [str, ...]
+        A description of each problem found.
+    """
+    aliases = {}
+    errors = []
+    try:
+        for number, spec in enumerate(specs, 1):
+            try:
+                spec = validate_spec(spec)
+            except ValueError as e:
+                errors.append("entry {}: {}".format(number, e))
+                continue
+
+            for field in ["transform", "inverse", "filter"]:
+                if spec.get(field) is not None:
+                    try:
+                        Transform(spec[field], {})
+                    except (SyntaxError, ValueError) as e:
+                        errors.append("entry {} ({}): invalid {}: {}".format(
+                            number, spec["alias"], field, e))
+                        break
+            else:
+                aliases[spec["alias"]] = spec
+    except ValueError as e:
+        # Unreadable file
+        errors.append(str(e))
+
+    cycle = has_cycle({path: spec["target"]
+                       for path, spec in aliases.items()})
+    if cycle:
+        errors.append("cyclic alias dependency: {}".format(
+            " -> ".join(cycle)))
+
+    return aliases, errors
+
+
+async def import_aliases(client, aliases, prefix="meta/alias/",
+                         chunk_size=500, timeout=30.0, progress=None):
+    """Add aliases to a running server in chunks.
+
+    Each chunk is sent to '<prefix>add' once the server has applied the
+    previous one (or reported an error), so a large import neither floods
+    the server nor arrives as a single giant message.
+
+    Parameters
+    ----------
+    client : qth.Client
+    aliases : {path: spec, ...}
+        Valid alias specifications, e.g. from :py:func:`check_specs`.
+    chunk_size : int
+        The number of aliases sent per message.
+    timeout : float
+        Seconds to wait for the server to apply each chunk.
+    progress : callable or None
+        Called as progress(done, total) after each chunk.
+
+    Returns
+    -------
+    errors : [str, ...]
+        The errors reported by the server during the import.
+
+    Raises
+    ------
+    asyncio.TimeoutError
+        If the server does not apply a chunk within the timeout.
+    """
+    aliases_path = prefix + "aliases"
+    error_path = prefix + "error"
+
+    current = {}
+    errors = []
+    changed = asyncio.Event()
+
+    async def on_aliases(_topic, value):
+        current.clear()
+        if isinstance(value, dict):
+            current.update(value)
+        changed.set()
+
+    async def on_error(_topic, error):
+        errors.append(error)
+        changed.set()
+
+    await client.watch_property(aliases_path, on_aliases)
+    await client.watch_event(error_path, on_error)
+    try:
+        loop = asyncio.get_running_loop()
+        specs = list(aliases.values())
+        for start in range(0, len(specs), chunk_size):
+            chunk = specs[start:start + chunk_size]
+            num_errors = len(errors)
+            await client.send_event(prefix + "add", chunk)
+
+            deadline = loop.time() + timeout
+            while (len(errors) == num_errors and
+                    not all(current.get(spec["alias"]) == spec
+                            for spec in chunk)):
+                changed.clear()
+                await asyncio.wait_for(changed.wait(),
+                                       max(0, deadline - loop.time()))
+
+            if progress is not None:
+                progress(start + len(chunk), len(specs))
+    finally:
+        await client.unwatch_property(aliases_path, on_aliases)
+        await client.unwatch_event(error_path, on_error)
+
+    return errors
+
+
+async def export_aliases(client, prefix="meta/alias/", timeout=30.0):
+    """Fetch the aliases defined by a running server.
+
+    Returns
+    -------
+    aliases : {path: spec, ...}
+
+    Raises
+    ------
+    asyncio.TimeoutError
+        If no server publishes its aliases within the timeout.
+    """
+    aliases_path = prefix + "aliases"
+    received = asyncio.get_running_loop().create_future()
+
+    async def on_aliases(_topic, value):
+        if value is not qth.Empty and not received.done():
+            received.set_result(value)
+
+    await client.watch_property(aliases_path, on_aliases)
+    try:
+        return await asyncio.wait_for(received, timeout)
+    finally:
+        await client.unwatch_property(aliases_path, on_aliases)
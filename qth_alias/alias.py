@@ -1,8 +1,21 @@
 import math, functools, itertools  # noqa
 import asyncio
+import time
+import sys
+import weakref
 
 import qth
 
+try:
+    import numpy  # noqa
+except ImportError:  # pragma: no cover
+    numpy = None
+
+from qth_alias.transform import (
+    Transform, evaluate_in_worker, call_timed, freeze)
+from qth_alias.window import Window
+from qth_alias.stats import AliasStats
+
 
 PROPERTY_BEHAVIOURS = [
     qth.PROPERTY_MANY_TO_ONE,
@@ -13,22 +26,107 @@ EVENT_BEHAVIOURS = [
     qth.EVENT_ONE_TO_MANY,
 ]
 
+# How transforms may be executed:
+# * inline: Evaluated directly in the event loop
+# * thread: Evaluated in a thread pool
+# * process: Evaluated in a process pool
+EXECUTION_POLICIES = ["inline", "thread", "process"]
+
+# Default for _eval_transform_async's 'failed' argument: values whose
+# transform fails are passed through unchanged.
+_PASS_THROUGH = object()
+
+# Methods of recognising the echoes of an alias' own writes: by counting them
+# (relying on MQTT delivering the messages on a path in order) or by
+# comparing values.
+ECHO_SUPPRESSION = ["counter", "value"]
+
+
+class RegistrationTemplate(dict):
+    """A registration dictionary shared between aliases (see
+    :py:func:`registration_template`). Must not be modified."""
+
+    __slots__ = ["__weakref__"]
+
+
+# Alias registration details (excluding the description) shared between
+# aliases. Templates no longer used by any alias are dropped automatically.
+# {freeze(registration): RegistrationTemplate, ...}
+_registration_templates = weakref.WeakValueDictionary()
+
+
+def registration_template(registration):
+    """Return a shared copy of a registration dictionary."""
+    key = freeze(registration)
+    template = _registration_templates.get(key)
+    if template is None:
+        template = _registration_templates[key] = \
+            RegistrationTemplate(registration)
+    return template
+
+
+def profiled(callback):
+    """Decorator for Alias callbacks which records their duration while the
+    server is being profiled."""
+    @functools.wraps(callback)
+    async def wrapper(self, *args):
+        profile = self._alias_server._profile
+        if profile is None:
+            return await callback(self, *args)
+
+        start = time.monotonic()
+        try:
+            return await callback(self, *args)
+        finally:
+            profile.add_callback(self._alias, time.monotonic() - start)
+    return wrapper
+
 
 class Alias(object):
     """Holds the state (and logic) associated with a given alias."""
 
+    __slots__ = [
+        "_alias_server", "_target", "_alias", "_transform_code",
+        "_inverse_code", "_description", "_execution", "_array",
+        "_filter_code", "_window_spec", "_batch_spec", "_deleted", "_active",
+        "_target_registration", "_lock", "_alias_registration",
+        "_watching_property", "_watching_event", "_target_echoes",
+        "_alias_echoes", "_transforms", "_overruns", "_quarantined",
+        "_window", "_window_task", "_batch", "_batch_task", "_stats",
+        "_value", "_lazy", "_watching_target_event", "_demand_expiry",
+        "_demand_task",
+    ]
+
     def __init__(self, alias_server, target, alias,
-                 transform=None, inverse=None, description=""):
+                 transform=None, inverse=None, description="",
+                 execution="inline", array=False, filter=None,
+                 window=None, batch=None, lazy=False):
         self._alias_server = alias_server
 
-        self._target = target
-        self._alias = alias
+        # Paths are interned since the same strings are also held by the
+        # client's and registration index's tables
+        if isinstance(target, list):
+            self._target = [sys.intern(t) for t in target]
+        else:
+            self._target = sys.intern(target)
+        self._alias = sys.intern(alias)
         self._transform_code = transform
         self._inverse_code = inverse
         self._description = description
+        self._execution = execution
+        self._array = array
+        self._filter_code = filter
+        self._window_spec = window
+        self._batch_spec = batch
+        self._lazy = lazy
 
         self._deleted = False
 
+        # Passive aliases (created by a standby server) track the target's
+        # registration but do not register or forward anything until
+        # activate() is called.
+        self._active = alias_server._active
+
         # The most recently received registration of the target
         self._target_registration = None
 
@@ -38,37 +136,162 @@ class Alias(object):
         # * Seting up (and clearing) watches of the target and alias
         #   property/event
         #
-        self._registration_change_lock = asyncio.Lock()
+        # Created on first use (see _registration_change_lock).
+        self._lock = None
 
-        # The most recently sent alias registration
+        # The most recently sent alias registration (excluding the
+        # description), a shared registration_template.
         self._alias_registration = None
 
         # Are we currently watching as a property?
         self._watching_property = False
 
-        # Are we currently watching as an event?
+        # Are we currently watching the alias (and, unless lazy, the target)
+        # as an event?
         self._watching_event = False
 
-        # Values we've sent to the target or alias which we'll shortly receive
-        # back through the registered watchers. These values are ignored and
-        # removed from these lists to avoid a feedback loop.
-        self._ignored_target_values = []
-        self._ignored_alias_values = []
+        # Are we currently watching the target as an event? (Lazy aliases
+        # only do so while there is demand for the alias.)
+        self._watching_target_event = False
+
+        # (Lazy aliases only.) The (event loop) time at which the current
+        # demand for the alias expires (or None if there is no demand) and
+        # the task which waits for it to expire.
+        self._demand_expiry = None
+        self._demand_task = None
+
+        # Our own writes to the target or alias which we'll shortly receive
+        # back through the registered watchers and must ignore to avoid a
+        # feedback loop. Since a path's messages are delivered in order, this
+        # is just the number of writes not yet received back. (When the
+        # server suppresses echoes by value, a list of the values written
+        # instead.)
+        self._target_echoes = 0
+        self._alias_echoes = 0
+
+        # Compiled transform expressions (None until first
+        # used). {code: Transform, ...}
+        self._transforms = None
+
+        # The number of consecutive transform evaluations which have exceeded
+        # the server's time budget.
+        self._overruns = 0
+
+        # Set when the alias has been quarantined for repeatedly exceeding
+        # the time budget. Quarantined aliases no longer forward values.
+        self._quarantined = False
+
+        # For windowed aliases, the Window accumulating target values and the
+        # task which periodically publishes the aggregate.
+        if window is not None:
+            if window.get("mode", "tumbling") == "sliding":
+                self._window = Window(window["length"])
+            else:
+                self._window = Window()
+        else:
+            self._window = None
+        self._window_task = None
+
+        # For batching aliases, the (transformed) target events not yet sent
+        # to the alias and the task which will send them once the batch
+        # interval expires.
+        self._batch = [] if batch is not None else None
+        self._batch_task = None
+
+        # Throughput, error and timing counters
+        self._stats = AliasStats()
+
+        # The latest value of the alias property (qth.Empty if none has been
+        # received, or for event aliases)
+        self._value = qth.Empty
 
     async def async_init(self):
         """Call asynchronously shortly after construction to complete setup."""
+        self._compile()
+
+        if self._active and self._window is not None:
+            self._window_task = asyncio.create_task(self._run_window())
+
         await asyncio.wait([
             asyncio.create_task(self._ls.watch_path(
                 self._target, self._on_target_registration_changed)),
         ])
 
+    async def activate(self):
+        """Start serving a passive alias."""
+        if self._active:
+            return
+        self._active = True
+
+        if self._window is not None:
+            self._window_task = asyncio.create_task(self._run_window())
+
+        await self._reconcile()
+
+    async def deactivate(self):
+        """Stop serving an active alias, leaving it passive (e.g. when another
+        server has taken over). Unlike delete(), the alias' on_unregister or
+        delete_on_unregister behaviour is not applied since the alias is still
+        served elsewhere."""
+        if not self._active:
+            return
+        self._active = False
+
+        if self._window_task is not None:
+            self._window_task.cancel()
+            self._window_task = None
+        if self._batch_task is not None:
+            self._batch_task.cancel()
+            self._batch_task = None
+        if self._batch is not None:
+            self._batch = []
+        if self._demand_task is not None:
+            self._demand_task.cancel()
+            self._demand_task = None
+        self._demand_expiry = None
+
+        async with self._registration_change_lock:
+            todo = []
+            if self._alias_registration is not None:
+                self._alias_registration = None
+                todo.append(self._client.unregister(self._alias))
+            if self._watching_property:
+                self._watching_property = False
+                todo.append(self._client.unwatch_property(
+                    self._alias, self._on_alias_set))
+                todo.append(self._client.unwatch_property(
+                    self._target, self._on_target_set))
+            if self._watching_event:
+                self._watching_event = False
+                todo.append(self._client.unwatch_event(
+                    self._alias, self._on_alias_sent))
+            if self._watching_target_event:
+                self._watching_target_event = False
+                todo.append(self._client.unwatch_event(
+                    self._target, self._on_target_sent))
+            if todo:
+                await asyncio.wait([asyncio.create_task(c) for c in todo])
+
     async def delete(self):
         """Remove the alias."""
         self._deleted = True
 
+        if self._window_task is not None:
+            self._window_task.cancel()
+        if self._batch_task is not None:
+            self._batch_task.cancel()
+            self._batch_task = None
+        if self._demand_task is not None:
+            self._demand_task.cancel()
+            self._demand_task = None
+
         async with self._registration_change_lock:
             todo = []
 
+            # Send any partially filled batch
+            if self._batch and self._alias_registration:
+                todo.append(self._flush_batch())
+
             # Remove the alias registration
             if self._alias_registration:
                 todo.append(self._client.unregister(self._alias))
@@ -85,6 +308,7 @@ class Alias(object):
                 todo.append(self._client.unwatch_event(
                     self._alias,
                     self._on_alias_sent))
+            if self._watching_target_event:
                 todo.append(self._client.unwatch_event(
                     self._target,
                     self._on_target_sent))
@@ -110,13 +334,37 @@ class Alias(object):
     @property
     def json(self):
         """Return the JSON-serialisable specification for this alias."""
-        return {
+        spec = {
             "target": self._target,
             "alias": self._alias,
             "transform": self._transform_code,
             "inverse": self._inverse_code,
             "description": self._description,
         }
+        if self._execution != "inline":
+            spec["execution"] = self._execution
+        if self._array:
+            spec["array"] = True
+        if self._filter_code is not None:
+            spec["filter"] = self._filter_code
+        if self._window_spec is not None:
+            spec["window"] = self._window_spec
+        if self._batch_spec is not None:
+            spec["batch"] = self._batch_spec
+        if self._lazy:
+            spec["lazy"] = True
+        return spec
+
+    @property
+    def value(self):
+        """The latest value of the alias property (or qth.Empty)."""
+        return self._value
+
+    @property
+    def _registration_change_lock(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
 
     @property
     def _client(self):
@@ -126,6 +374,49 @@ class Alias(object):
     def _ls(self):
         return self._alias_server._ls
 
+    def _get_transform(self, code):
+        """Get the (compiled) Transform for a piece of code."""
+        if self._transforms is None:
+            self._transforms = {}
+        transform = self._transforms.get(code)
+        if transform is None:
+            transform = self._transforms[code] = Transform(
+                code, globals(), self._alias_server._transform_cache_size,
+                self._array)
+        return transform
+
+    def _update_memo_stats(self):
+        """Copy the hit and miss counts of the memos of this alias' transforms
+        into its statistics. (Transforms evaluated by 'process' execution are
+        memoised within the pool's processes and so are not counted.)"""
+        memos = [transform.memo
+                 for transform in (self._transforms or {}).values()
+                 if transform.memo is not None]
+        self._stats.memo_hits = sum(memo.hits for memo in memos)
+        self._stats.memo_misses = sum(memo.misses for memo in memos)
+
+    def _compile(self):
+        """Compile the alias' transform, inverse and filter code ahead of
+        their first use."""
+        for code in [self._transform_code, self._inverse_code,
+                     self._filter_code]:
+            if code is not None:
+                try:
+                    self._get_transform(code)
+                except Exception:
+                    # Reported when first evaluated
+                    pass
+
+    def _report_transform_error(self, code, message):
+        self._stats.errors += 1
+        self._alias_server._error_sync(
+            "transform/invert: Exception while transforming/inverting "
+            "value for alias {} with code {}: {}".format(
+                self._alias,
+                repr(code),
+                message),
+            alias=self._alias, kind="transform")
+
     def _eval_transform(self, code, value):
         """Eval 'code' with local variable 'value'.
 
@@ -139,15 +430,116 @@ class Alias(object):
             return value
         else:
             try:
-                return eval(code, globals(), {"value": value})
+                return self._get_transform(code)(value)
             except Exception as e:
+                self._report_transform_error(code, str(e))
+                return value
+
+    async def _eval_transform_async(self, code, value, failed=_PASS_THROUGH):
+        """Like _eval_transform but evaluates the code according to the
+        alias' execution policy and enforces the server's time budget.
+
+        Transforms which run in a pool and exceed the budget are abandoned
+        and the value passed through (with an error event), as for an
+        exception. If 'failed' is given, it is returned instead of the value
+        when the transform fails.
+        """
+        if code is None:
+            return value
+        elif value is qth.Empty:
+            return value
+
+        budget = self._alias_server._transform_budget
+        profile = self._alias_server._profile
+        start = time.monotonic()
+        cpu_time = None
+        try:
+            if self._execution == "process":
+                call = (evaluate_in_worker, code,
+                        self._alias_server._transform_cache_size,
+                        self._array, value)
+            else:
+                call = (self._get_transform(code), value)
+
+            # While profiling, CPU time is measured by the thread evaluating
+            # the transform (the event loop runs other callbacks while
+            # awaiting a pool)
+            if profile is not None:
+                call = (call_timed, ) + call
+
+            if self._execution == "inline":
+                result = call[0](*call[1:])
+            else:
+                executor = self._alias_server._get_executor(self._execution)
+                result = await asyncio.wait_for(
+                    asyncio.get_running_loop().run_in_executor(
+                        executor, *call),
+                    budget)
+
+            if profile is not None:
+                result, cpu_time = result
+        except asyncio.TimeoutError:
+            self._report_transform_error(
+                code, "exceeded time budget of {} s".format(budget))
+            result = value if failed is _PASS_THROUGH else failed
+        except Exception as e:
+            self._report_transform_error(code, str(e))
+            result = value if failed is _PASS_THROUGH else failed
+
+        duration = time.monotonic() - start
+        self._stats.add_transform_time(duration)
+        if cpu_time is not None:
+            profile.add_cpu(self._alias, cpu_time)
+        self._check_budget(duration)
+
+        return result
+
+    def _check_budget(self, duration):
+        """Record how long a transform took to evaluate, quarantining the
+        alias if it repeatedly exceeds the server's time budget."""
+        budget = self._alias_server._transform_budget
+        if budget is None:
+            return
+
+        if duration <= budget:
+            self._overruns = 0
+            return
+
+        self._overruns += 1
+        if (not self._quarantined and
+                self._overruns >= self._alias_server._quarantine_after):
+            self._quarantined = True
+            self._alias_server._error_sync(
+                "quarantined alias {}: {} consecutive transforms/inverses "
+                "exceeded the time budget of {} s".format(
+                    self._alias, self._overruns, budget),
+                alias=self._alias, kind="quarantine")
+
+    def _filter(self, target_value):
+        """Return True if a target value should be forwarded to the alias.
+
+        If there is no filter, or the value is qth.Empty, always returns True.
+        If the filter raises an exception, an error event is sent and the
+        value is dropped.
+        """
+        if self._filter_code is None:
+            return True
+        elif target_value is qth.Empty:
+            return True
+        else:
+            try:
+                return bool(self._get_transform(self._filter_code)(
+                    target_value))
+            except Exception as e:
+                self._stats.errors += 1
                 self._alias_server._error_sync(
-                    "transform/invert: Exception while transforming/inverting "
-                    "value for alias {} with code {}: {}".format(
+                    "filter: Exception while filtering value for alias {} "
+                    "with code {}: {}".format(
                         self._alias,
-                        repr(code),
-                        str(e)))
-                return value
+                        repr(self._filter_code),
+                        str(e)),
+                    alias=self._alias, kind="filter")
+                return False
 
     def _transform(self, target_value):
         """Transform a value from the target value to an alias value."""
@@ -157,41 +549,259 @@ class Alias(object):
         """Transform a value from the alias value to a target value."""
         return self._eval_transform(self._inverse_code, alias_value)
 
+    async def _transform_async(self, target_value):
+        """Asynchronous version of _transform."""
+        return await self._eval_transform_async(self._transform_code,
+                                                target_value)
+
+    async def _inverse_async(self, alias_value):
+        """Asynchronous version of _inverse."""
+        return await self._eval_transform_async(self._inverse_code,
+                                                alias_value)
+
+    def _start_trace(self, direction):
+        """Start tracing a forwarded value, if tracing is enabled and the
+        value is sampled. Returns a Span or None. (Values aggregated by a
+        window or batch are not traced.)"""
+        tracer = self._alias_server._tracer
+        if tracer is None:
+            return None
+        return tracer.start(self._alias, direction)
+
+    def _record(self, direction, kind, value):
+        """Record a value received (and forwarded) by this alias, if the
+        server is recording."""
+        recorder = self._alias_server._recorder
+        if recorder is not None:
+            recorder.record_message(
+                self._alias, direction,
+                self._target if direction == "to_alias" else self._alias,
+                kind, value)
+
+    def _add_echo(self, echoes, value):
+        """Return 'echoes' (see _target_echoes) updated to expect the echo
+        of a value we're about to send."""
+        if self._alias_server._echo_suppression == "value":
+            if not echoes:
+                return [value]
+            echoes.append(value)
+            return echoes
+        else:
+            return echoes + 1
+
+    def _remove_echo(self, echoes, value):
+        """If a received value is the echo of one we sent, return 'echoes'
+        (see _target_echoes) updated to no longer expect it. Otherwise return
+        None."""
+        if not echoes:
+            return None
+        elif self._alias_server._echo_suppression == "value":
+            if value not in echoes:
+                return None
+            echoes.remove(value)
+            return echoes
+        else:
+            return echoes - 1
+
+    def _ignore_target_value(self, value):
+        """Ignore the next receipt of a value we're sending to the target."""
+        self._target_echoes = self._add_echo(self._target_echoes, value)
+
+    def _ignore_alias_value(self, value):
+        """Ignore the next receipt of a value we're sending to the alias."""
+        self._alias_echoes = self._add_echo(self._alias_echoes, value)
+
+    def _is_target_echo(self, value):
+        """Test whether a value received from the target is the echo of one
+        we sent (which is then no longer expected)."""
+        echoes = self._remove_echo(self._target_echoes, value)
+        if echoes is None:
+            return False
+        self._target_echoes = echoes
+        self._stats.echoes_suppressed += 1
+        return True
+
+    def _is_alias_echo(self, value):
+        """Test whether a value received from the alias is the echo of one
+        we sent (which is then no longer expected)."""
+        echoes = self._remove_echo(self._alias_echoes, value)
+        if echoes is None:
+            return False
+        self._alias_echoes = echoes
+        self._stats.echoes_suppressed += 1
+        return True
+
+    @profiled
     async def _on_target_set(self, _path, target_value):
         """Called when the target property is set."""
-        if target_value in self._ignored_target_values:
-            self._ignored_target_values.remove(target_value)
-        else:
-            alias_value = self._transform(target_value)
-            self._ignored_alias_values.append(alias_value)
-            await self._client.set_property(self._alias, alias_value)
-
+        if self._is_target_echo(target_value):
+            return
+        elif not self._quarantined and self._filter(target_value):
+            self._stats.to_alias += 1
+            self._record("to_alias", "property", target_value)
+            span = self._start_trace("to_alias")
+            alias_value = await self._transform_async(target_value)
+            if self._window is not None:
+                self._add_to_window(alias_value)
+            else:
+                self._ignore_alias_value(alias_value)
+                if span is not None:
+                    span.mark_transformed()
+                await self._client.set_property(self._alias, alias_value)
+                if span is not None:
+                    self._alias_server._tracer.finish(span)
+
+    @profiled
     async def _on_alias_set(self, _path, alias_value):
         """Called when the alias property is set."""
-        if alias_value in self._ignored_alias_values:
-            self._ignored_alias_values.remove(alias_value)
-        else:
-            transform_value = self._inverse(alias_value)
-            self._ignored_target_values.append(transform_value)
+        self._value = alias_value
+        if self._window is not None:
+            # Windowed aliases are read-only
+            return
+        elif self._is_alias_echo(alias_value):
+            return
+        elif not self._quarantined:
+            self._stats.to_target += 1
+            self._record("to_target", "property", alias_value)
+            span = self._start_trace("to_target")
+            transform_value = await self._inverse_async(alias_value)
+            self._ignore_target_value(transform_value)
+            if span is not None:
+                span.mark_transformed()
             await self._client.set_property(self._target, transform_value)
+            if span is not None:
+                self._alias_server._tracer.finish(span)
 
+    @profiled
     async def _on_target_sent(self, _path, target_value):
         """Called when an event is received from the target."""
-        if target_value in self._ignored_target_values:
-            self._ignored_target_values.remove(target_value)
-        else:
-            alias_value = self._transform(target_value)
-            self._ignored_alias_values.append(alias_value)
-            await self._client.send_event(self._alias, alias_value)
-
+        if self._is_target_echo(target_value):
+            return
+        elif not self._quarantined and self._filter(target_value):
+            self._stats.to_alias += 1
+            self._record("to_alias", "event", target_value)
+            span = self._start_trace("to_alias")
+            alias_value = await self._transform_async(target_value)
+            if self._window is not None:
+                self._add_to_window(alias_value)
+            elif self._batch_spec is not None:
+                await self._add_to_batch(alias_value)
+            else:
+                self._ignore_alias_value(alias_value)
+                if span is not None:
+                    span.mark_transformed()
+                await self._client.send_event(self._alias, alias_value)
+                if span is not None:
+                    self._alias_server._tracer.finish(span)
+
+    @profiled
     async def _on_alias_sent(self, _path, alias_value):
         """Called when an event is received from the alias."""
-        if alias_value in self._ignored_alias_values:
-            self._ignored_alias_values.remove(alias_value)
-        else:
-            transform_value = self._inverse(alias_value)
-            self._ignored_target_values.append(transform_value)
-            await self._client.send_event(self._target, transform_value)
+        if self._window is not None:
+            # Windowed aliases are read-only
+            return
+        elif self._is_alias_echo(alias_value):
+            return
+        elif not self._quarantined:
+            self._record("to_target", "event", alias_value)
+
+            # Batches sent to batching aliases are unpacked into individual
+            # target events
+            if self._batch_spec is not None and isinstance(alias_value, list):
+                alias_values = alias_value
+            else:
+                alias_values = [alias_value]
+            for alias_value in alias_values:
+                self._stats.to_target += 1
+                span = self._start_trace("to_target")
+                transform_value = await self._inverse_async(alias_value)
+                self._ignore_target_value(transform_value)
+                if span is not None:
+                    span.mark_transformed()
+                await self._client.send_event(self._target, transform_value)
+                if span is not None:
+                    self._alias_server._tracer.finish(span)
+
+    async def _add_to_batch(self, alias_value):
+        """Add a (transformed) target event to the current batch, sending the
+        batch if it is full."""
+        self._batch.append(alias_value)
+
+        if len(self._batch) >= self._batch_spec.get("size", math.inf):
+            await self._flush_batch()
+        elif self._batch_task is None and "interval" in self._batch_spec:
+            self._batch_task = asyncio.create_task(
+                self._flush_batch_after(self._batch_spec["interval"]))
+
+    async def _flush_batch_after(self, delay):
+        """Send the current batch after a delay."""
+        await asyncio.sleep(delay)
+        self._batch_task = None
+        await self._flush_batch()
+
+    async def _flush_batch(self):
+        """Send the current batch (if not empty) as a single alias event."""
+        if self._batch_task is not None:
+            self._batch_task.cancel()
+            self._batch_task = None
+
+        batch = self._batch
+        self._batch = []
+        if batch:
+            self._ignore_alias_value(batch)
+            await self._client.send_event(self._alias, batch)
+
+    async def demand(self, timeout):
+        """(Lazy aliases only.) Note that the alias is in demand: watch the
+        target until 'timeout' seconds pass without further demand."""
+        if not self._lazy or self._deleted:
+            return
+        loop = asyncio.get_running_loop()
+        self._demand_expiry = loop.time() + timeout
+        if self._demand_task is None:
+            self._demand_task = asyncio.create_task(self._await_idle())
+            await self._reconcile()
+
+    async def _await_idle(self):
+        """Task which stops watching the target once demand expires."""
+        loop = asyncio.get_running_loop()
+        while loop.time() < self._demand_expiry:
+            await asyncio.sleep(self._demand_expiry - loop.time())
+        self._demand_expiry = None
+        self._demand_task = None
+        await self._reconcile()
+
+    def _add_to_window(self, alias_value):
+        """Add a (transformed) target value to the window."""
+        if alias_value is qth.Empty:
+            return
+        try:
+            self._window.add(alias_value)
+        except (TypeError, ValueError):
+            self._stats.errors += 1
+            self._alias_server._error_sync(
+                "window: Non-numeric value {} for alias {}".format(
+                    repr(alias_value), self._alias),
+                alias=self._alias, kind="window")
+
+    async def _run_window(self):
+        """Task which publishes the window's aggregate once every period."""
+        loop = asyncio.get_running_loop()
+        period = self._window_spec["period"]
+        deadline = loop.time()
+        while True:
+            deadline += period
+            await asyncio.sleep(deadline - loop.time())
+
+            aggregate = self._window.aggregate()
+            self._window.advance()
+
+            if aggregate is None or self._alias_registration is None:
+                continue
+            if self._watching_property:
+                await self._client.set_property(self._alias, aggregate)
+            elif self._watching_event:
+                await self._client.send_event(self._alias, aggregate)
 
     async def _on_target_registration_changed(self, _path, registration):
         """Called when the target's registration info changes."""
@@ -207,36 +817,51 @@ class Alias(object):
         else:
             self._target_registration = None
 
+        # Wait for the registration to settle (unless no settle window is
+        # configured)
+        if self._alias_server._settle_window:
+            self._alias_server._reconciler.schedule(self)
+        else:
+            await self._reconcile()
+
+    async def _reconcile(self):
+        """Update the alias registration and the watches of the target and
+        alias to match the target's registration."""
+        start = time.monotonic()
         async with self._registration_change_lock:
-            if self._deleted:
+            if self._deleted or not self._active:
                 return
 
             todo = []
 
             # Update the Qth registration as required
             if self._target_registration is not None:
-                # Copy the relevant fields from the registration
+                # Copy the relevant fields from the registration (the alias'
+                # own description is used instead of the target's)
                 new_alias_registration = {}
-                for field in ["behaviour", "description",
+                for field in ["behaviour",
                               "on_unregister", "delete_on_unregister"]:
                     if field in self._target_registration:
                         new_alias_registration[field] = \
                             self._target_registration[field]
 
-                # Use the alias description instead
-                new_alias_registration["description"] = self._description
-
                 # If an on_unregister value is given, convert this into the
-                # alias' form
-                if "on_unregister" in new_alias_registration:
+                # alias' form. (Windowed aliases only ever publish aggregates
+                # so don't inherit it.)
+                if self._window is not None:
+                    new_alias_registration.pop("on_unregister", None)
+                elif "on_unregister" in new_alias_registration:
                     new_alias_registration["on_unregister"] = \
                         self._transform(
                             new_alias_registration["on_unregister"])
 
+                new_alias_registration = registration_template(
+                    new_alias_registration)
                 if new_alias_registration != self._alias_registration:
                     self._alias_registration = new_alias_registration
                     todo.append(self._client.register(
-                        self._alias, **new_alias_registration))
+                        self._alias, description=self._description,
+                        **new_alias_registration))
             elif self._alias_registration is not None:
                 # Unregister the alias since the target was also unregistered
                 self._alias_registration = None
@@ -262,22 +887,50 @@ class Alias(object):
                     self._watching_event = False
                     todo.append(self._client.unwatch_event(
                         self._alias, self._on_alias_sent))
-                    todo.append(self._client.unwatch_event(
-                        self._target, self._on_target_sent))
 
-                # Add new watch
+                # Add new watch (forgetting any echoes expected from an
+                # earlier watch, which will now never arrive)
                 if not self._watching_property and is_property:
                     self._watching_property = True
+                    self._alias_echoes = self._target_echoes = 0
                     todo.append(self._client.watch_property(
                         self._alias, self._on_alias_set))
                     todo.append(self._client.watch_property(
                         self._target, self._on_target_set))
                 if not self._watching_event and is_event:
                     self._watching_event = True
+                    self._alias_echoes = 0
                     todo.append(self._client.watch_event(
                         self._alias, self._on_alias_sent))
+
+                # Lazy aliases only watch the target while in demand
+                if self._lazy and is_property:
+                    self._stats.errors += 1
+                    self._alias_server._error_sync(
+                        "lazy: {} is a property so alias {} cannot be "
+                        "lazy.".format(self._target, self._alias),
+                        alias=self._alias, kind="lazy")
+
+                # Only events are batched
+                if self._batch_spec is not None and is_property:
+                    self._stats.errors += 1
+                    self._alias_server._error_sync(
+                        "batch: {} is a property so alias {} cannot batch "
+                        "values.".format(self._target, self._alias),
+                        alias=self._alias, kind="batch")
+                want_target_event = is_event and (
+                    not self._lazy or self._demand_expiry is not None)
+                if self._watching_target_event and not want_target_event:
+                    self._watching_target_event = False
+                    todo.append(self._client.unwatch_event(
+                        self._target, self._on_target_sent))
+                if not self._watching_target_event and want_target_event:
+                    self._watching_target_event = True
+                    self._target_echoes = 0
                     todo.append(self._client.watch_event(
                         self._target, self._on_target_sent))
 
             if todo:
                 await asyncio.wait([asyncio.create_task(c) for c in todo])
+                self._alias_server._stats.registration_latency.add(
+                    time.monotonic() - start)
@@ -0,0 +1,206 @@
+"""
+Benchmarks of the alias server, run against an in-process broker (see
+:py:mod:`qth_alias.testing`).
+
+Usage::
+
+    $ qth_alias-bench --sizes 1000,2000 --output results.json
+    $ qth_alias-bench --sizes 1000,2000 --compare results.json
+
+Larger numbers of aliases are slow to register (see LARGE_SIZES) and must be
+requested with ``--large`` (or ``--sizes``).
+
+A capture file recorded by a server (see :py:mod:`qth_alias.record`) may be
+replayed (here at ten times the original speed) with::
+
+    $ qth_alias-bench replay capture.jsonl --speed 10
+
+Results are printed (or written) as a JSON object whose keys are stable
+between versions so that results from different commits may be compared.
+"""
+
+import sys
+import json
+import time
+import asyncio
+import platform
+
+from argparse import ArgumentParser
+
+from qth_alias.version import __version__
+
+from qth_alias.bench.forwarding import KINDS, measure_forwarding
+from qth_alias.bench.control import measure_control, measure_startup
+from qth_alias.bench.cycles import measure_has_cycle
+from qth_alias.bench.memory import measure_memory
+from qth_alias.bench.replay import replay
+
+
+# The names of the available benchmarks
+BENCHMARKS = ["forwarding", "control", "startup", "has_cycle", "memory"]
+
+# The numbers of aliases benchmarked by default
+DEFAULT_SIZES = (1000, )
+
+# The numbers of aliases additionally benchmarked with --large. These are not
+# run by default since qth_ls.Ls re-checks every watched path
+# (get_path_listing) on every change to the registrar's listings
+# (_on_ls_tree_changed), making registering aliases (and so the control,
+# startup and memory benchmarks) quadratic in the number of aliases: these
+# take tens of minutes (10000) to many hours (100000).
+LARGE_SIZES = (10000, 100000)
+
+
+async def run_benchmarks(benchmarks=BENCHMARKS, sizes=DEFAULT_SIZES,
+                         messages=1000, samples=100):
+    """Run the named benchmarks, returning a list of results.
+
+    Parameters
+    ----------
+    benchmarks : [str, ...]
+        The benchmarks to run (see BENCHMARKS).
+    sizes : [int, ...]
+        The numbers of aliases with which to run the control, startup,
+        has_cycle and memory benchmarks.
+    messages : int
+        The number of values to forward in the forwarding benchmarks.
+    samples : int
+        The number of individual adds and removes to time in the control
+        benchmark.
+    """
+    results = []
+    for benchmark in benchmarks:
+        if benchmark == "forwarding":
+            for kind in KINDS:
+                results.append(await measure_forwarding(kind, messages))
+            continue
+
+        for size in sizes:
+            if benchmark == "control":
+                results.append(await measure_control(size, samples))
+            elif benchmark == "startup":
+                results.append(await measure_startup(size))
+            elif benchmark == "has_cycle":
+                results.append(measure_has_cycle(size))
+            elif benchmark == "memory":
+                results.append(await measure_memory(size))
+            else:
+                raise ValueError("Unknown benchmark {}".format(benchmark))
+    return results
+
+
+def result_key(result):
+    """A name identifying a benchmark result, e.g. 'forwarding/plain',
+    'control/1000' or 'replay/capture.jsonl'."""
+    for parameter in ["kind", "aliases", "capture"]:
+        if parameter in result:
+            return "{}/{}".format(result["benchmark"], result[parameter])
+    return result["benchmark"]
+
+
+def flatten(result, prefix=""):
+    """Return the numeric values in a (nested) result as {name: value, ...}
+    where nested names are joined with '.'."""
+    values = {}
+    for name, value in result.items():
+        if isinstance(value, dict):
+            values.update(flatten(value, prefix + name + "."))
+        elif (isinstance(value, (int, float)) and
+                not isinstance(value, bool)):
+            values[prefix + name] = value
+    return values
+
+
+def compare(results, baseline):
+    """Compare a list of results with those of an earlier run.
+
+    Returns {result_key: {value_name: new / old, ...}, ...} for every value
+    present (and non-zero) in both.
+    """
+    old_results = {result_key(result): flatten(result)
+                   for result in baseline}
+    comparison = {}
+    for result in results:
+        old = old_results.get(result_key(result))
+        if old is None:
+            continue
+        comparison[result_key(result)] = {
+            name: value / old[name]
+            for name, value in flatten(result).items()
+            if old.get(name)
+        }
+    return comparison
+
+
+def main(argv=None):
+    parser = ArgumentParser(description="Benchmark qth_alias.")
+    parser.add_argument("--benchmark", "-b", action="append",
+                        choices=BENCHMARKS,
+                        help="Run only the named benchmark (may be given "
+                             "multiple times).")
+    parser.add_argument("--sizes", "-n",
+                        default=",".join(map(str, DEFAULT_SIZES)),
+                        help="Comma-separated numbers of aliases for the "
+                             "control, startup, has_cycle and memory "
+                             "benchmarks (default %(default)s).")
+    parser.add_argument("--large", action="store_true",
+                        help="Also run these benchmarks with {} aliases. "
+                             "Slow: registering aliases is quadratic in "
+                             "their number due to qth_ls.".format(
+                                 " and ".join(map(str, LARGE_SIZES))))
+    parser.add_argument("--messages", default=1000, type=int,
+                        help="Number of values to forward in the forwarding "
+                             "benchmarks (default %(default)s).")
+    parser.add_argument("--samples", default=100, type=int,
+                        help="Number of individual adds/removes to time in "
+                             "the control benchmark (default %(default)s).")
+    parser.add_argument("--output", "-o",
+                        help="Write the results to this file (default: "
+                             "stdout).")
+    parser.add_argument("--compare", "-c",
+                        help="Compare the results with those in this file "
+                             "(written by an earlier run).")
+
+    subparsers = parser.add_subparsers(dest="command")
+    replay_parser = subparsers.add_parser(
+        "replay", help="Replay a capture file recorded by a server.")
+    replay_parser.add_argument("capture",
+                               help="The capture file to replay.")
+    replay_parser.add_argument("--speed", "-s", default=1.0, type=float,
+                               help="Replay this many times faster than "
+                                    "recorded (default %(default)s).")
+    args = parser.parse_args(argv)
+
+    if args.command == "replay":
+        if args.speed <= 0:
+            parser.error("--speed must be positive")
+        results = [asyncio.run(replay(args.capture, args.speed))]
+    else:
+        try:
+            sizes = [int(size) for size in args.sizes.split(",")]
+        except ValueError:
+            parser.error("--sizes must be a comma-separated list of integers")
+        if args.large:
+            sizes.extend(size for size in LARGE_SIZES if size not in sizes)
+        results = asyncio.run(run_benchmarks(
+            args.benchmark or BENCHMARKS, sizes, args.messages,
+            args.samples))
+
+    output = {
+        "version": __version__,
+        "python": platform.python_version(),
+        "time": time.time(),
+        "results": results,
+    }
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            output["comparison"] = compare(output["results"],
+                                           json.load(f)["results"])
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(output, f, indent=2)
+    else:
+        json.dump(output, sys.stdout, indent=2)
+        print()
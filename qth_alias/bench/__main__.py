@@ -0,0 +1,3 @@
+from qth_alias.bench import main
+
+main()
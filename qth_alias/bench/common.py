@@ -0,0 +1,82 @@
+import os
+import time
+
+import qth
+from qth_ls import Ls
+
+from qth_alias import AliasServer
+from qth_alias.spec import write_specs
+from qth_alias.testing import FakeClient
+
+
+def target_path(i):
+    """The path of the i-th benchmark target. (Each target lives in its own
+    directory since qth_ls only resolves a newly watched path once a listing
+    it depends on arrives.)"""
+    return "bench/{}/target".format(i)
+
+
+def alias_spec(i, transform=True):
+    """The specification of an alias of the i-th benchmark target."""
+    spec = {
+        "target": target_path(i),
+        "alias": "alias/{}".format(i),
+        "description": "Benchmark alias {}.".format(i),
+    }
+    if transform:
+        spec["transform"] = "value * 2"
+        spec["inverse"] = "value / 2"
+    return spec
+
+
+async def register_targets(broker, count, behaviour=qth.PROPERTY_ONE_TO_MANY):
+    """Register 'count' targets on behalf of a 'device' client, returning the
+    client."""
+    device = FakeClient(broker, "device")
+    for i in range(count):
+        await device.register(target_path(i), behaviour,
+                              "Benchmark target {}.".format(i))
+    await broker.settle()
+    return device
+
+
+def write_cache(directory, aliases):
+    """Write an alias server cache file holding the given {path: spec, ...}
+    aliases, returning its filename."""
+    cache_file = os.path.join(directory, "aliases.json")
+    with open(cache_file, "w") as f:
+        write_specs(f, aliases.values())
+    return cache_file
+
+
+async def start_server(broker, cache_file, **kwargs):
+    """Start an AliasServer connected to the broker."""
+    client = FakeClient(broker, "bench")
+    server = AliasServer(cache_file=cache_file, client=client,
+                         ls=Ls(client), **kwargs)
+    await server.async_init()
+    await broker.settle()
+    return server
+
+
+async def timed(coro):
+    """Await a coroutine, returning the time (seconds) it took."""
+    start = time.perf_counter()
+    await coro
+    return time.perf_counter() - start
+
+
+def summarise(samples):
+    """Summarise a list of durations (seconds) as a JSON-serialisable
+    dictionary of exact quantiles."""
+    if not samples:
+        return {"count": 0, "mean": None, "p50": None, "p99": None,
+                "max": None}
+    samples = sorted(samples)
+    return {
+        "count": len(samples),
+        "mean": sum(samples) / len(samples),
+        "p50": samples[int(0.5 * (len(samples) - 1))],
+        "p99": samples[int(0.99 * (len(samples) - 1))],
+        "max": samples[-1],
+    }
@@ -0,0 +1,107 @@
+import tempfile
+
+from qth_alias.testing import FakeBroker, FakeClient
+
+from qth_alias.bench.common import (
+    alias_spec, register_targets, write_cache, start_server, timed,
+    summarise)
+
+
+def make_aliases(start, stop):
+    """Return the {path: spec, ...} of the benchmark aliases start to
+    stop-1."""
+    aliases = {}
+    for i in range(start, stop):
+        spec = alias_spec(i)
+        aliases[spec["alias"]] = spec
+    return aliases
+
+
+def count_registered(server):
+    return sum(1 for path in server._client._registration
+               if path.startswith("alias/"))
+
+
+async def measure_control(count, samples=100):
+    """Measure the cost of control-plane operations with 'count' aliases.
+
+    The time taken to import 'count' aliases at once (by setting the aliases
+    property) is measured followed by the time taken to add and then remove
+    'samples' further aliases, one at a time, using the add and remove
+    events.
+
+    Returns a dictionary {"benchmark": "control", "aliases": count,
+    "registered": n, "bulk": seconds, "bulk_per_alias": seconds, "add":
+    {...}, "remove": {...}}.
+    """
+    broker = FakeBroker()
+    await register_targets(broker, count + samples)
+    admin = FakeClient(broker, "admin")
+
+    with tempfile.TemporaryDirectory() as directory:
+        server = await start_server(broker, write_cache(directory, {}))
+
+        async def settled(coro):
+            await coro
+            await broker.settle()
+
+        bulk = await timed(settled(admin.set_property(
+            server._aliases_path, make_aliases(0, count))))
+        registered = count_registered(server)
+
+        add = []
+        for spec in make_aliases(count, count + samples).values():
+            add.append(await timed(settled(admin.send_event(
+                server._add_path, spec))))
+
+        remove = []
+        for path in make_aliases(count, count + samples):
+            remove.append(await timed(settled(admin.send_event(
+                server._remove_path, path))))
+
+        await server.close()
+
+    return {
+        "benchmark": "control",
+        "aliases": count,
+        "registered": registered,
+        "bulk": bulk,
+        "bulk_per_alias": bulk / count,
+        "add": summarise(add),
+        "remove": summarise(remove),
+    }
+
+
+async def measure_startup(count):
+    """Measure the time taken to start an alias server with 'count' cached
+    aliases (until all are registered) and to shut it down again.
+
+    Returns a dictionary {"benchmark": "startup", "aliases": count,
+    "registered": n, "startup": seconds, "shutdown": seconds}.
+    """
+    broker = FakeBroker()
+    await register_targets(broker, count)
+
+    with tempfile.TemporaryDirectory() as directory:
+        cache_file = write_cache(directory, make_aliases(0, count))
+
+        servers = []
+
+        async def start():
+            servers.append(await start_server(broker, cache_file))
+
+        async def stop():
+            await servers[0].close()
+            await broker.settle()
+
+        startup = await timed(start())
+        registered = count_registered(servers[0])
+        shutdown = await timed(stop())
+
+    return {
+        "benchmark": "startup",
+        "aliases": count,
+        "registered": registered,
+        "startup": startup,
+        "shutdown": shutdown,
+    }
@@ -0,0 +1,40 @@
+import time
+
+from qth_alias import has_cycle
+
+
+def graphs(count):
+    """Generate (name, {alias: target, ...}) acyclic alias graphs of 'count'
+    aliases with different shapes."""
+    # Aliases of independent targets (the common case)
+    yield "independent", {
+        "alias/{}".format(i): "target/{}".format(i) for i in range(count)}
+
+    # A single long chain of aliases of aliases
+    yield "chain", {
+        "alias/{}".format(i): "alias/{}".format(i - 1) if i else "target"
+        for i in range(count)}
+
+    # Computed aliases, each of the two before it
+    yield "computed", {
+        "alias/{}".format(i): ["alias/{}".format(i - 1),
+                               "alias/{}".format(i - 2)] if i > 1 else []
+        for i in range(count)}
+
+
+def measure_has_cycle(count, repeat=3):
+    """Measure the time taken by has_cycle to check alias graphs of 'count'
+    aliases (the best of 'repeat' runs).
+
+    Returns a dictionary {"benchmark": "has_cycle", "aliases": count, shape:
+    seconds, ...}.
+    """
+    result = {"benchmark": "has_cycle", "aliases": count}
+    for name, aliases in graphs(count):
+        durations = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            assert has_cycle(aliases) is None
+            durations.append(time.perf_counter() - start)
+        result[name] = min(durations)
+    return result
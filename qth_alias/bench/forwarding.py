@@ -0,0 +1,98 @@
+import time
+import tempfile
+
+import qth
+
+from qth_alias.testing import FakeBroker, FakeClient
+
+from qth_alias.bench.common import (
+    target_path, alias_spec, register_targets, write_cache, start_server,
+    summarise)
+
+
+# The kinds of alias whose forwarding is measured
+KINDS = ["plain", "transformed", "event", "chained"]
+
+
+def kind_aliases(kind):
+    """Return the {path: spec, ...} aliases for a kind of benchmark and the
+    path of the alias at the end of the chain."""
+    spec = alias_spec(0, transform=(kind == "transformed"))
+    aliases = {spec["alias"]: spec}
+    if kind == "chained":
+        aliases["chain/0"] = {
+            "target": spec["alias"],
+            "alias": "chain/0",
+            "description": "Alias of an alias.",
+        }
+        return aliases, "chain/0"
+    return aliases, spec["alias"]
+
+
+async def measure_forwarding(kind, messages=1000):
+    """Measure the forwarding of values from a target to an alias of the
+    given kind (see KINDS).
+
+    Two phases are measured: a latency phase in which each value is sent
+    only once the previous one has been delivered and a throughput phase in
+    which all values are sent at once.
+
+    Returns a dictionary {"benchmark": "forwarding", "kind": kind,
+    "messages": messages, "received": n, "throughput": messages_per_second,
+    "latency": {...}}.
+    """
+    is_event = kind == "event"
+    broker = FakeBroker()
+    device = await register_targets(
+        broker, 1,
+        qth.EVENT_ONE_TO_MANY if is_event else qth.PROPERTY_ONE_TO_MANY)
+
+    async def send(value):
+        if is_event:
+            await device.send_event(target_path(0), value)
+        else:
+            await device.set_property(target_path(0), value)
+
+    aliases, end = kind_aliases(kind)
+    received = []
+
+    def on_value(_topic, _value):
+        received.append(time.perf_counter())
+
+    with tempfile.TemporaryDirectory() as directory:
+        server = await start_server(broker, write_cache(directory, aliases))
+
+        observer = FakeClient(broker, "observer")
+        if is_event:
+            await observer.watch_event(end, on_value)
+        else:
+            await observer.watch_property(end, on_value)
+
+        # Latency: one value at a time
+        latencies = []
+        for i in range(messages):
+            del received[:]
+            sent = time.perf_counter()
+            await send(i)
+            await broker.settle()
+            if received:
+                latencies.append(received[-1] - sent)
+
+        # Throughput: all values at once
+        del received[:]
+        start = time.perf_counter()
+        for i in range(messages):
+            await send(messages + i)
+        await broker.settle()
+        end_time = received[-1] if received else time.perf_counter()
+
+        await server.close()
+
+    return {
+        "benchmark": "forwarding",
+        "kind": kind,
+        "messages": messages,
+        "received": len(received),
+        "throughput": len(received) / (end_time - start),
+        "latency": summarise(latencies),
+    }
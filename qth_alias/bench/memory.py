@@ -0,0 +1,52 @@
+import gc
+import tempfile
+import tracemalloc
+
+from qth_alias.testing import FakeBroker
+
+from qth_alias.bench.common import (
+    alias_spec, register_targets, write_cache, start_server)
+
+
+async def measure_memory(count):
+    """Measure the memory used by 'count' registered property aliases (each
+    with a transform).
+
+    Returns a dictionary {"benchmark": "memory", "aliases": count, "bytes":
+    total, "bytes_per_alias": bytes}.
+    """
+    broker = FakeBroker()
+    await register_targets(broker, count)
+
+    with tempfile.TemporaryDirectory() as directory:
+        server = await start_server(broker, write_cache(directory, {}))
+
+        aliases = {}
+        for i in range(count):
+            spec = alias_spec(i)
+            aliases[spec["alias"]] = spec
+
+        gc.collect()
+        tracing = tracemalloc.is_tracing()
+        if not tracing:
+            tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+
+        await server._update_aliases(aliases)
+        await broker.settle()
+
+        # Only count what remains once the aliases are in place
+        del aliases
+        gc.collect()
+        used = tracemalloc.get_traced_memory()[0] - before
+        if not tracing:
+            tracemalloc.stop()
+
+        await server.close()
+
+    return {
+        "benchmark": "memory",
+        "aliases": count,
+        "bytes": used,
+        "bytes_per_alias": used / count,
+    }
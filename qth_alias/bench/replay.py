@@ -0,0 +1,164 @@
+import os
+import time
+import asyncio
+import tempfile
+
+import qth
+
+from qth_alias.record import read_capture
+from qth_alias.testing import FakeBroker, FakeClient
+
+from qth_alias.bench.common import write_cache, start_server, summarise
+
+
+def target_behaviours(alias_sets, event_aliases):
+    """Return the {path: behaviour, ...} of the targets (which are not
+    themselves aliases) of a series of alias sets. Targets of aliases
+    recorded forwarding events are events, the rest properties."""
+    targets = {}
+    for aliases in alias_sets:
+        for spec in aliases.values():
+            paths = spec["target"]
+            if not isinstance(paths, list):
+                paths = [paths]
+            for path in paths:
+                if path in aliases:
+                    continue
+                if spec["alias"] in event_aliases:
+                    targets[path] = qth.EVENT_ONE_TO_MANY
+                else:
+                    targets.setdefault(path, qth.PROPERTY_ONE_TO_MANY)
+    return targets
+
+
+def merge_alias_sets(records):
+    """Generate (index, aliases) for each record of a capture which changes
+    the combined set of aliases of all of the recording servers.
+
+    Each server (source) records its own complete set of aliases, so the
+    combined set is the union of the latest set recorded by each.
+    """
+    sources = {}
+    combined = None
+    for index, record in enumerate(records):
+        if record["type"] != "aliases":
+            continue
+        sources[record.get("source")] = record["aliases"]
+        aliases = {}
+        for source_aliases in sources.values():
+            aliases.update(source_aliases)
+        if aliases != combined:
+            combined = aliases
+            yield (index, aliases)
+
+
+async def replay(filename, speed=1.0, **kwargs):
+    """Replay a capture file written by a server's recorder (see
+    :py:class:`qth_alias.record.Recorder`) against a local server.
+
+    The server starts with the aliases recorded before the first message
+    (combining those of every server which recorded to the file, see
+    :py:func:`merge_alias_sets`). The recorded messages (and any later
+    changes to the set of aliases) are then sent with their original
+    timing, sped up by 'speed'. Any other keyword
+    arguments are passed to the AliasServer, e.g. to evaluate a change of
+    configuration.
+
+    Returns a dictionary {"benchmark": "replay", "capture": name, "speed":
+    speed, "messages": n, "forwarded": n, "duration": seconds, "latency":
+    {...}, "processing": {...}, "schedule_lag": {...}} where 'latency' is
+    the time from sending a message to its forwarded value being published,
+    'processing' that time excluding the wait before the alias received the
+    message and 'schedule_lag' how late messages were sent (i.e. how far the
+    replay fell behind the recording).
+    """
+    records = list(read_capture(filename))
+    alias_sets = list(merge_alias_sets(records))
+    if not alias_sets:
+        raise ValueError("{}: no aliases recorded".format(filename))
+
+    # Start with the aliases recorded before the first message
+    first_message = next((i for i, record in enumerate(records)
+                          if record["type"] == "message"), len(records))
+    first, initial = alias_sets[0]
+    for index, aliases in alias_sets:
+        if index < first_message:
+            first, initial = index, aliases
+    changes = dict((index, aliases) for index, aliases in alias_sets
+                   if index > first)
+    records = [(changes.get(index), record)
+               for index, record in enumerate(records)
+               if index > first and (record["type"] == "message" or
+                                     index in changes)]
+    messages = [record for _, record in records
+                if record["type"] == "message"]
+
+    broker = FakeBroker()
+    device = FakeClient(broker, "device")
+    admin = FakeClient(broker, "admin")
+    targets = target_behaviours(
+        [aliases for _, aliases in alias_sets],
+        set(record["alias"] for record in messages
+            if record["kind"] == "event"))
+    for path, behaviour in targets.items():
+        await device.register(path, behaviour, "Replayed target.")
+    await broker.settle()
+
+    # The (wall-clock) times at which each alias' messages were sent
+    # {(alias, direction): [time, ...], ...}
+    sent = {}
+    lags = []
+
+    with tempfile.TemporaryDirectory() as directory:
+        server = await start_server(
+            broker, write_cache(directory, initial), trace_rate=1.0,
+            trace_buffer=max(1, len(messages)), **kwargs)
+
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        t0 = records[0][1]["time"] if records else 0.0
+        for aliases, record in records:
+            due = start + (record["time"] - t0) / speed
+            if due > loop.time():
+                await asyncio.sleep(due - loop.time())
+            lags.append(loop.time() - due)
+
+            if aliases is not None:
+                await admin.set_property(server._aliases_path, aliases)
+                continue
+
+            sent.setdefault((record["alias"], record["direction"]),
+                            []).append(time.time())
+            if record.get("deleted"):
+                await device.delete_property(record["path"])
+            elif record["kind"] == "event":
+                await device.send_event(record["path"], record["value"])
+            else:
+                await device.set_property(record["path"], record["value"])
+        await broker.settle()
+        duration = loop.time() - start
+
+        spans = list(server._trace_buffer.spans)
+        await server.close()
+
+    # Match the spans of each alias with the messages it was sent, in order
+    spans.sort(key=lambda span: span.received)
+    alias_spans = {}
+    for span in spans:
+        alias_spans.setdefault((span.alias, span.direction), []).append(span)
+    latencies = []
+    for key, spans_of_key in alias_spans.items():
+        for sent_at, span in zip(sent.get(key, []), spans_of_key):
+            latencies.append(span.received - sent_at + span.published)
+
+    return {
+        "benchmark": "replay",
+        "capture": os.path.basename(filename),
+        "speed": speed,
+        "messages": len(messages),
+        "forwarded": len(spans),
+        "duration": duration,
+        "latency": summarise(latencies),
+        "processing": summarise([span.published for span in spans]),
+        "schedule_lag": summarise(lags),
+    }
@@ -0,0 +1,115 @@
+import os
+import time
+import shutil
+import asyncio
+import logging
+
+from qth_alias.spec import read_specs, write_specs
+
+
+def read_cache(filename):
+    """Read the aliases in a cache file, returning {path: spec, ...}."""
+    aliases = {}
+    with open(filename, "r") as f:
+        for spec in read_specs(f):
+            aliases[spec["alias"]] = spec
+    return aliases
+
+
+def write_cache(filename, specs):
+    """Replace the contents of a cache file with the given alias
+    specifications.
+
+    The specifications are written to a temporary file which then replaces
+    the cache file so that a crash mid-write never leaves a truncated cache.
+    Paths which exist but are not regular files (e.g. /dev/null) are written
+    in place.
+    """
+    filename = os.path.realpath(filename)
+    if os.path.exists(filename) and not os.path.isfile(filename):
+        with open(filename, "w") as f:
+            write_specs(f, specs)
+        return
+
+    temp_filename = "{}.tmp".format(filename)
+    try:
+        with open(temp_filename, "w") as f:
+            write_specs(f, specs)
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.exists(filename):
+            shutil.copymode(filename, temp_filename)
+        os.replace(temp_filename, filename)
+    except BaseException:
+        if os.path.exists(temp_filename):
+            os.remove(temp_filename)
+        raise
+
+
+class CacheFile(object):
+    """The alias server's cache file, read and written in a thread so that a
+    slow disk does not stall the event loop.
+
+    Saves are coalesced: while a write is in progress, only the most recent
+    set of aliases saved is written next.
+    """
+
+    def __init__(self, filename, stats):
+        """
+        Parameters
+        ----------
+        filename : str
+        stats : :py:class:`qth_alias.stats.ServerStats`
+            The time taken by each write is recorded in its
+            cache_write_latency.
+        """
+        self._filename = filename
+        self._stats = stats
+
+        # The most recently saved aliases not yet being written (or None)
+        self._pending = None
+
+        # The task writing saved aliases (None when idle)
+        self._writer_task = None
+
+    async def load(self):
+        """Read the cached aliases, returning {path: spec, ...}. Errors are
+        logged and an empty set of aliases returned."""
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                None, read_cache, self._filename)
+        except Exception as e:
+            logging.exception(e)
+            return {}
+
+    def save(self, aliases):
+        """Schedule the writing of a (new) set of aliases {path: spec, ...}.
+
+        The dictionary must not be modified afterwards.
+        """
+        self._pending = aliases
+        if self._writer_task is None:
+            self._writer_task = asyncio.create_task(self._write_pending())
+
+    async def _write_pending(self):
+        """Task which writes saved aliases until none are pending."""
+        loop = asyncio.get_running_loop()
+        try:
+            while self._pending is not None:
+                aliases = self._pending
+                self._pending = None
+                start = time.monotonic()
+                try:
+                    await loop.run_in_executor(
+                        None, write_cache, self._filename,
+                        list(aliases.values()))
+                except Exception as e:
+                    logging.exception(e)
+                self._stats.cache_write_latency.add(time.monotonic() - start)
+        finally:
+            self._writer_task = None
+
+    async def flush(self):
+        """Wait until all saved aliases have been written."""
+        while self._writer_task is not None:
+            await asyncio.shield(self._writer_task)
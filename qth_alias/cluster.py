@@ -0,0 +1,183 @@
+import asyncio
+import bisect
+import hashlib
+import logging
+
+import qth
+
+
+def _hash(key):
+    """A stable 64-bit hash of a string."""
+    return int.from_bytes(
+        hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+
+class HashRing(object):
+    """A consistent hash ring mapping paths to nodes.
+
+    Each node is placed on the ring at several pseudo-random points
+    ('replicas') and a path is owned by the node at the first point following
+    the path's hash. When a node is added or removed only the paths adjacent
+    to its points change owner.
+    """
+
+    def __init__(self, nodes=(), replicas=64):
+        self._replicas = replicas
+
+        # Sorted list of points on the ring and the node at each.
+        self._points = []
+        self._nodes = []
+
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node):
+        for replica in range(self._replicas):
+            point = _hash("{}#{}".format(node, replica))
+            i = bisect.bisect(self._points, point)
+            self._points.insert(i, point)
+            self._nodes.insert(i, node)
+
+    def remove(self, node):
+        keep = [(p, n) for p, n in zip(self._points, self._nodes)
+                if n != node]
+        self._points = [p for p, n in keep]
+        self._nodes = [n for p, n in keep]
+
+    def owner(self, path):
+        """Return the node which owns a path (or None if the ring is
+        empty)."""
+        if not self._points:
+            return None
+        i = bisect.bisect(self._points, _hash(path)) % len(self._points)
+        return self._nodes[i]
+
+
+class Cluster(object):
+    """Tracks the membership of a cluster of alias servers which share a Qth
+    broker and divides the aliases between them.
+
+    Each member publishes a heartbeat property '<nodes_path><node_id>'
+    (registered with delete_on_unregister so that it is removed if the
+    member disconnects) and watches the heartbeats of the others. Members
+    whose heartbeat stops for 'timeout' seconds are presumed dead.
+    """
+
+    def __init__(self, client, nodes_path, node_id, on_change,
+                 heartbeat_interval=5.0, timeout=15.0):
+        """
+        Parameters
+        ----------
+        client : qth.Client
+        nodes_path : str
+            The Qth path (ending in a '/') of the directory holding the
+            heartbeat properties.
+        node_id : str
+            The unique name of this member.
+        on_change : coroutine function
+            Called (with no arguments) whenever the membership changes.
+        heartbeat_interval : float
+            Seconds between heartbeats.
+        timeout : float
+            Seconds without a heartbeat after which a member is removed.
+        """
+        self._client = client
+        self._nodes_path = nodes_path
+        self._node_id = node_id
+        self._on_change = on_change
+        self._heartbeat_interval = heartbeat_interval
+        self._timeout = timeout
+
+        # The last time (loop.time()) a heartbeat was seen from each other
+        # member. {node_id: time, ...}
+        self._last_seen = {}
+
+        self._ring = HashRing([node_id])
+
+        self._task = None
+
+    @property
+    def node_id(self):
+        return self._node_id
+
+    @property
+    def members(self):
+        """The sorted list of live members (including this one)."""
+        return sorted(set(self._last_seen) | set([self._node_id]))
+
+    @property
+    def is_leader(self):
+        """Is this member the leader (the member with the lowest ID)? The
+        leader handles requests to the control plane."""
+        return self.members[0] == self._node_id
+
+    def owns(self, path):
+        """Is the alias 'path' served by this member?"""
+        return self._ring.owner(path) == self._node_id
+
+    async def start(self):
+        path = self._nodes_path + self._node_id
+        await asyncio.wait([asyncio.create_task(c) for c in [
+            self._client.register(path, qth.PROPERTY_ONE_TO_MANY,
+                                  "Heartbeat of qth_alias cluster member "
+                                  "{}.".format(self._node_id),
+                                  delete_on_unregister=True),
+            self._client.subscribe(self._nodes_path + "+",
+                                   self._on_heartbeat),
+        ]])
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+        path = self._nodes_path + self._node_id
+        await asyncio.wait([asyncio.create_task(c) for c in [
+            self._client.unsubscribe(self._nodes_path + "+",
+                                     self._on_heartbeat),
+            self._client.unregister(path),
+            self._client.delete_property(path),
+        ]])
+
+    async def _run(self):
+        """Task which sends heartbeats and expires silent members."""
+        loop = asyncio.get_running_loop()
+        sequence = 0
+        while True:
+            await self._client.set_property(self._nodes_path + self._node_id,
+                                            sequence)
+            sequence += 1
+
+            expired = [node for node, last_seen in self._last_seen.items()
+                       if loop.time() - last_seen > self._timeout]
+            if expired:
+                for node in expired:
+                    logging.info("Cluster member %s timed out.", node)
+                    self._remove(node)
+                await self._on_change()
+
+            await asyncio.sleep(self._heartbeat_interval)
+
+    def _remove(self, node):
+        self._last_seen.pop(node)
+        self._ring.remove(node)
+
+    async def _on_heartbeat(self, topic, value):
+        """Called when a member's heartbeat property changes."""
+        node = topic[len(self._nodes_path):]
+        if node == self._node_id:
+            return
+
+        if value is qth.Empty:
+            if node in self._last_seen:
+                logging.info("Cluster member %s left.", node)
+                self._remove(node)
+                await self._on_change()
+        else:
+            joined = node not in self._last_seen
+            self._last_seen[node] = asyncio.get_running_loop().time()
+            if joined:
+                logging.info("Cluster member %s joined.", node)
+                self._ring.add(node)
+                await self._on_change()
@@ -0,0 +1,188 @@
+import asyncio
+import functools
+
+import qth
+
+from qth_alias.alias import Alias, profiled, registration_template
+
+
+# Placeholder for inputs whose value is not yet known
+_MISSING = object()
+
+
+class ComputedAlias(Alias):
+    """An alias whose value is computed from the values of several target
+    properties.
+
+    The transform is evaluated with 'value' set to a list of the latest
+    values of each target (in the order given). The last value of each input
+    is cached and the transform is only re-evaluated when an input changes
+    (and all inputs have a value). The computed alias is a read-only
+    property.
+    """
+
+    __slots__ = ["_coalesce", "_values", "_input_callbacks", "_last_result",
+                 "_recompute_task"]
+
+    def __init__(self, alias_server, target, alias, transform=None,
+                 coalesce=None, **kwargs):
+        """
+        Parameters
+        ----------
+        target : [str, ...]
+            The paths of the target properties.
+        coalesce : float or None
+            If given, changes to inputs arriving within this many seconds of
+            each other result in a single re-computation.
+
+        Other parameters are as for :py:class:`Alias`.
+        """
+        super(ComputedAlias, self).__init__(
+            alias_server, target, alias, transform, **kwargs)
+
+        self._coalesce = coalesce
+
+        # The most recent value of each input (or _MISSING if unknown).
+        self._values = [_MISSING] * len(target)
+
+        # The callback watching each input, kept for unwatching.
+        self._input_callbacks = [functools.partial(self._on_input_set, i)
+                                 for i in range(len(target))]
+
+        # The most recently published value
+        self._last_result = _MISSING
+
+        # Task which will recompute the value after the coalescing delay has
+        # passed (or None if none is pending)
+        self._recompute_task = None
+
+    async def async_init(self):
+        """Call asynchronously shortly after construction to complete setup."""
+        self._compile()
+        if self._active:
+            await self._start()
+
+    async def activate(self):
+        """Start serving a passive alias."""
+        if self._active:
+            return
+        self._active = True
+        await self._start()
+
+    async def _start(self):
+        """Register the alias and watch the targets."""
+        async with self._registration_change_lock:
+            self._alias_registration = registration_template({
+                "behaviour": qth.PROPERTY_ONE_TO_MANY,
+                "delete_on_unregister": True,
+            })
+            await asyncio.wait([asyncio.create_task(c) for c in [
+                self._client.register(self._alias,
+                                      description=self._description,
+                                      **self._alias_registration),
+            ] + [
+                self._client.watch_property(target, callback)
+                for target, callback in zip(self._target,
+                                            self._input_callbacks)
+            ]])
+
+    async def deactivate(self):
+        """Stop serving an active alias, leaving it passive (see
+        :py:meth:`qth_alias.alias.Alias.deactivate`)."""
+        if not self._active:
+            return
+        self._active = False
+
+        if self._recompute_task is not None:
+            self._recompute_task.cancel()
+            self._recompute_task = None
+
+        async with self._registration_change_lock:
+            self._alias_registration = None
+            self._values = [_MISSING] * len(self._target)
+            self._last_result = _MISSING
+            await asyncio.wait([asyncio.create_task(c) for c in [
+                self._client.unregister(self._alias),
+            ] + [
+                self._client.unwatch_property(target, callback)
+                for target, callback in zip(self._target,
+                                            self._input_callbacks)
+            ]])
+
+    async def delete(self):
+        """Remove the alias."""
+        self._deleted = True
+
+        if self._recompute_task is not None:
+            self._recompute_task.cancel()
+
+        if not self._active:
+            return
+
+        async with self._registration_change_lock:
+            await asyncio.wait([asyncio.create_task(c) for c in [
+                self._client.unregister(self._alias),
+                self._client.delete_property(self._alias),
+            ] + [
+                self._client.unwatch_property(target, callback)
+                for target, callback in zip(self._target,
+                                            self._input_callbacks)
+            ]])
+
+    @property
+    def json(self):
+        """Return the JSON-serialisable specification for this alias."""
+        spec = super(ComputedAlias, self).json
+        if self._coalesce is not None:
+            spec["coalesce"] = self._coalesce
+        return spec
+
+    @property
+    def value(self):
+        """The latest computed value (or qth.Empty)."""
+        if self._last_result is _MISSING:
+            return qth.Empty
+        return self._last_result
+
+    @profiled
+    async def _on_input_set(self, index, _path, value):
+        """Called when the value of one of the target properties changes."""
+        recorder = self._alias_server._recorder
+        if recorder is not None:
+            recorder.record_message(self._alias, "to_alias",
+                                    self._target[index], "property", value)
+
+        if value is qth.Empty:
+            value = _MISSING
+        if self._values[index] == value:
+            return
+        self._values[index] = value
+
+        if self._coalesce is None:
+            await self._recompute()
+        elif self._recompute_task is None:
+            self._recompute_task = asyncio.create_task(
+                self._recompute_after(self._coalesce))
+
+    async def _recompute_after(self, delay):
+        """Recompute the value after a delay."""
+        await asyncio.sleep(delay)
+        self._recompute_task = None
+        await self._recompute()
+
+    async def _recompute(self):
+        """Recompute the alias value and publish it if it changed."""
+        if self._deleted or self._quarantined:
+            return
+        if any(value is _MISSING for value in self._values):
+            return
+
+        # (Nothing is published if the transform fails)
+        result = await self._eval_transform_async(
+            self._transform_code, list(self._values), failed=_MISSING)
+        if result is _MISSING:
+            return
+        if result != self._last_result:
+            self._last_result = result
+            self._stats.to_alias += 1
+            await self._client.set_property(self._alias, result)
@@ -0,0 +1,194 @@
+import asyncio
+import logging
+import time
+
+
+class _ErrorState(object):
+    """The recent occurrences of one kind of error for one alias."""
+
+    __slots__ = ["total", "recent", "suppressed", "message", "time"]
+
+    def __init__(self, message):
+        # Occurrences since the error started occurring
+        self.total = 1
+
+        # Occurrences in the current window and how many of those were not
+        # reported individually.
+        self.recent = 1
+        self.suppressed = 0
+
+        # The latest message and when (unix time) it occurred
+        self.message = message
+        self.time = time.time()
+
+    def add(self, message):
+        self.total += 1
+        self.recent += 1
+        self.suppressed += 1
+        self.message = message
+        self.time = time.time()
+
+    @property
+    def json(self):
+        return {
+            "count": self.total,
+            "message": self.message,
+            "time": self.time,
+        }
+
+
+class ErrorReporter(object):
+    """Reports errors via the log and the error event, coalescing storms of
+    repeated errors.
+
+    The first error of each kind for each alias is reported immediately.
+    Further errors of that kind are counted and a summary reported at the end
+    of each window. Once a whole window passes without an occurrence, the
+    error is considered resolved. Errors not associated with an alias are
+    always reported immediately.
+
+    The current errors of each alias are also published in a property of the
+    form {alias: {kind: {"count": n, "message": latest, "time": unix_time},
+    ...}, ...}.
+    """
+
+    def __init__(self, client, error_path, errors_path, window=10.0,
+                 max_pending=64):
+        """
+        Parameters
+        ----------
+        client : qth.Client
+        error_path : str
+            The event to which errors are sent.
+        errors_path : str
+            The property holding the current errors of each alias.
+        window : float
+            The deduplication window (seconds).
+        max_pending : int
+            The maximum number of error events waiting to be sent. Further
+            events are dropped (but counted).
+        """
+        self._client = client
+        self._error_path = error_path
+        self._errors_path = errors_path
+        self._window = window
+        self._max_pending = max_pending
+
+        # {(alias, kind): _ErrorState, ...}
+        self._state = {}
+
+        # The value of the errors property most recently published
+        self._published = {}
+
+        # Error events (and property updates) not yet sent
+        self._pending = set()
+
+        # Number of error events dropped because too many were pending
+        self.dropped = 0
+
+        # Task which ends each window (running only while there are errors)
+        self._task = None
+
+    @property
+    def errors(self):
+        """The current errors of each alias."""
+        errors = {}
+        for (alias, kind), state in self._state.items():
+            errors.setdefault(alias, {})[kind] = state.json
+        return errors
+
+    def _record(self, message, alias, kind):
+        """Record an error, returning True if it should be reported now."""
+        if alias is None:
+            logging.error(message)
+            return True
+
+        key = (alias, kind)
+        state = self._state.get(key)
+        if state is not None:
+            state.add(message)
+            return False
+
+        logging.error(message)
+        self._state[key] = _ErrorState(message)
+        if self._task is None:
+            self._task = asyncio.get_event_loop().create_task(self._run())
+        return True
+
+    async def report(self, message, alias=None, kind=None):
+        """Report an error."""
+        if self._record(message, alias, kind):
+            todo = [self._client.send_event(self._error_path, message)]
+            if alias is not None:
+                todo.append(self._publish())
+            await asyncio.wait([asyncio.create_task(c) for c in todo])
+
+    def report_sync(self, message, alias=None, kind=None):
+        """Report an error without waiting for it to be sent."""
+        if self._record(message, alias, kind):
+            self._send(self._client.send_event(self._error_path, message))
+            if alias is not None:
+                self._send(self._publish())
+
+    def _send(self, coro):
+        """Run a coroutine in a task unless too many are already pending."""
+        if len(self._pending) >= self._max_pending:
+            coro.close()
+            self.dropped += 1
+            return
+        task = asyncio.get_event_loop().create_task(coro)
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _publish(self):
+        """Update the errors property (if changed)."""
+        errors = self.errors
+        if errors != self._published:
+            self._published = errors
+            await self._client.set_property(self._errors_path, errors)
+
+    def forget(self, alias):
+        """Discard the errors of an alias (e.g. when it is removed)."""
+        for key in [key for key in self._state if key[0] == alias]:
+            del self._state[key]
+
+    async def flush(self):
+        """End the current window: report a summary of each error which
+        occurred repeatedly and forget those which did not occur."""
+        todo = []
+        for (alias, kind), state in list(self._state.items()):
+            if state.suppressed:
+                summary = (
+                    "{}: {}: {} further occurrences in the last {} s "
+                    "(latest: {})".format(alias, kind, state.suppressed,
+                                          self._window, state.message))
+                logging.error(summary)
+                todo.append(self._client.send_event(self._error_path,
+                                                    summary))
+
+            if state.recent == 0:
+                del self._state[(alias, kind)]
+            else:
+                state.recent = 0
+                state.suppressed = 0
+
+        if self.dropped:
+            logging.warning("Dropped %d error events.", self.dropped)
+            self.dropped = 0
+
+        todo.append(self._publish())
+        await asyncio.wait([asyncio.create_task(c) for c in todo])
+
+    async def _run(self):
+        """Task which ends each window while there are errors."""
+        while self._state or self._published:
+            await asyncio.sleep(self._window)
+            await self.flush()
+        self._task = None
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._pending:
+            await asyncio.wait(list(self._pending))
@@ -0,0 +1,50 @@
+import os
+import sys
+import tracemalloc
+
+
+def component_of(filename):
+    """Return the name of the component (a qth_alias module or a top-level
+    package/module) to which a source file belongs."""
+    parts = os.path.normpath(filename).split(os.sep)
+    if "qth_alias" in parts:
+        i = len(parts) - 1 - parts[::-1].index("qth_alias")
+        return ".".join(["qth_alias"] + [
+            os.path.splitext(part)[0] for part in parts[i + 1:]])
+
+    # Find the package containing the file within the search path
+    for path in sorted(sys.path, key=len, reverse=True):
+        path = os.path.normpath(path)
+        if path and filename.startswith(path + os.sep):
+            return os.path.splitext(
+                filename[len(path) + 1:].split(os.sep)[0])[0]
+
+    return filename
+
+
+def memory_report(top=10):
+    """Report the memory currently allocated (since tracemalloc was started)
+    by each component. Returns None if tracemalloc is not tracing."""
+    if not tracemalloc.is_tracing():
+        return None
+
+    snapshot = tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+    ])
+
+    # {component: [size, count], ...}
+    components = {}
+    for stat in snapshot.statistics("filename"):
+        entry = components.setdefault(
+            component_of(stat.traceback[0].filename), [0, 0])
+        entry[0] += stat.size
+        entry[1] += stat.count
+
+    return {
+        "total": sum(size for size, _count in components.values()),
+        "components": [
+            {"component": component, "size": size, "count": count}
+            for component, (size, count) in sorted(
+                components.items(), key=lambda c: c[1][0], reverse=True)[:top]
+        ],
+    }
@@ -0,0 +1,82 @@
+import collections
+import cProfile
+import pstats
+import time
+
+
+class Profile(object):
+    """An on-demand profile of the alias server.
+
+    Combines a cProfile of the event loop thread with the time spent in each
+    alias' callbacks (wall-clock, from receiving a value to publishing the
+    result) and evaluating its transforms (CPU time of the thread or process
+    evaluating them).
+    """
+
+    def __init__(self):
+        self._profiler = cProfile.Profile()
+        self._start = None
+        self._duration = None
+
+        # {alias: [calls, callback time, cpu time], ...}
+        self._aliases = collections.defaultdict(lambda: [0, 0.0, 0.0])
+
+    def start(self):
+        self._start = time.monotonic()
+        self._profiler.enable()
+
+    def stop(self):
+        self._profiler.disable()
+        self._duration = time.monotonic() - self._start
+
+    def add_callback(self, alias, duration):
+        """Record the duration of one callback of an alias."""
+        entry = self._aliases[alias]
+        entry[0] += 1
+        entry[1] += duration
+
+    def add_cpu(self, alias, duration):
+        """Record CPU time spent evaluating an alias' transforms."""
+        self._aliases[alias][2] += duration
+
+    def write(self, filename):
+        """Write the cProfile statistics to a file (readable with
+        :py:mod:`pstats`)."""
+        self._profiler.dump_stats(filename)
+
+    def report(self, top=10):
+        """Return a JSON-serialisable summary of the profile listing the
+        'top' aliases by callback and CPU time and the functions with the
+        greatest cumulative time."""
+        aliases = [
+            {
+                "alias": alias,
+                "calls": calls,
+                "callback_time": callback_time,
+                "cpu_time": cpu_time,
+            }
+            for alias, (calls, callback_time, cpu_time)
+            in self._aliases.items()
+        ]
+
+        functions = []
+        stats = pstats.Stats(self._profiler).stats
+        for (filename, line, name), (_cc, calls, total, cumulative, _) in \
+                sorted(stats.items(), key=lambda s: s[1][3],
+                       reverse=True)[:top]:
+            functions.append({
+                "function": "{}:{}({})".format(filename, line, name),
+                "calls": calls,
+                "total_time": total,
+                "cumulative_time": cumulative,
+            })
+
+        return {
+            "duration": self._duration,
+            "top_callback_time": sorted(
+                aliases, key=lambda a: a["callback_time"],
+                reverse=True)[:top],
+            "top_cpu_time": sorted(
+                aliases, key=lambda a: a["cpu_time"], reverse=True)[:top],
+            "top_functions": functions,
+        }
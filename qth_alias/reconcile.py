@@ -0,0 +1,85 @@
+import heapq
+import asyncio
+import itertools
+
+
+class Reconciler(object):
+    """Applies changes to the registrations of aliases' targets once they
+    have settled.
+
+    When a device restarts, the registrar may change its registrations
+    several times in quick succession. An alias whose target's registration
+    changes is reconciled (see :py:meth:`qth_alias.alias.Alias._reconcile`)
+    only once its target's registration has not changed for the settle
+    window, so just the final state is applied. Aliases which become due
+    together (e.g. those of all of a device's paths) are reconciled as a
+    single batch.
+    """
+
+    def __init__(self, settle_window=0.0):
+        """
+        Parameters
+        ----------
+        settle_window : float
+            Seconds without a further change after which an alias is
+            reconciled.
+        """
+        self._settle_window = settle_window
+
+        # The aliases awaiting reconciliation and the (event loop) time at
+        # which each becomes due. {alias: time, ...}
+        self._pending = {}
+
+        # A heap of (time, n, alias) ordered by when aliases become due (n
+        # breaks ties without comparing aliases). When an alias is
+        # rescheduled its earlier entry is left in place and skipped once
+        # reached (it no longer matches _pending).
+        self._deadlines = []
+        self._counter = itertools.count()
+
+        # The task which reconciles pending aliases (None when idle)
+        self._task = None
+
+    def schedule(self, alias):
+        """Reconcile an alias once its target's registration has settled."""
+        loop = asyncio.get_running_loop()
+        time = loop.time() + self._settle_window
+        self._pending[alias] = time
+        heapq.heappush(self._deadlines, (time, next(self._counter), alias))
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        """Task which reconciles aliases as they become due."""
+        loop = asyncio.get_running_loop()
+        try:
+            while self._deadlines:
+                now = loop.time()
+                due = []
+                while self._deadlines and self._deadlines[0][0] <= now:
+                    time, _, alias = heapq.heappop(self._deadlines)
+                    if self._pending.get(alias) == time:
+                        del self._pending[alias]
+                        due.append(alias)
+                if not due:
+                    if self._deadlines:
+                        await asyncio.sleep(self._deadlines[0][0] - now)
+                    continue
+
+                await asyncio.wait([asyncio.create_task(alias._reconcile())
+                                    for alias in due])
+        finally:
+            self._task = None
+
+    async def flush(self):
+        """Wait until all pending aliases have been reconciled."""
+        while self._task is not None:
+            await asyncio.shield(self._task)
+
+    def close(self):
+        """Abandon any pending reconciliations."""
+        self._pending = {}
+        self._deadlines = []
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
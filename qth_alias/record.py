@@ -0,0 +1,125 @@
+import json
+import time
+import queue
+import logging
+import threading
+
+import qth
+
+
+# Compact JSON encoding for capture files
+_SEPARATORS = (",", ":")
+
+
+class Recorder(object):
+    """Records the values forwarded by aliases (and each new set of aliases)
+    to a capture file for later replay (see :py:mod:`qth_alias.bench`).
+
+    The capture file holds one JSON object per line. Changes to the set of
+    aliases are recorded as::
+
+        {"type": "aliases", "time": unix_time, "source": source,
+         "aliases": {path: spec, ...}}
+
+    Where 'source' identifies the recording server (its prefix) so that the
+    sets of aliases of several servers sharing a capture file (e.g. one per
+    prefix) can be told apart (and merged) on replay.
+
+    And each value received (and forwarded) by an alias as::
+
+        {"type": "message", "time": unix_time, "alias": alias_path,
+         "direction": "to_alias" or "to_target", "path": received_on,
+         "kind": "property" or "event", "size": bytes, "value": value}
+
+    Deleted properties are recorded with "deleted": true (and no value).
+    Records are written as whole lines so several servers may append to the
+    same capture file.
+
+    Records are written (and flushed) by a writer thread so that a slow disk
+    does not stall the event loop. Lines queued while a write is in progress
+    are written together.
+    """
+
+    def __init__(self, filename, source=None):
+        """
+        Parameters
+        ----------
+        filename : str
+        source : str or None
+            Recorded with each set of aliases.
+        """
+        self._file = open(filename, "a")
+        self._source = source
+
+        # Lines awaiting the writer thread (followed by None once closed)
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run_writer,
+                                        name="qth_alias-recorder",
+                                        daemon=True)
+        self._thread.start()
+
+    def _write(self, line):
+        self._queue.put(line)
+
+    def _run_writer(self):
+        """Writer thread: writes queued lines until closed."""
+        closed = False
+        while not closed:
+            lines = [self._queue.get()]
+            while True:
+                try:
+                    lines.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if lines[-1] is None:
+                lines.pop()
+                closed = True
+            try:
+                self._file.write("".join(lines))
+                self._file.flush()
+            except Exception as e:
+                logging.exception(e)
+        self._file.close()
+
+    def record_aliases(self, aliases):
+        """Record the current set of aliases ({path: spec, ...})."""
+        self._write(json.dumps({
+            "type": "aliases",
+            "time": time.time(),
+            "source": self._source,
+            "aliases": aliases,
+        }, separators=_SEPARATORS) + "\n")
+
+    def record_message(self, alias, direction, path, kind, value):
+        """Record a value received on 'path' by an alias."""
+        record = {
+            "type": "message",
+            "time": time.time(),
+            "alias": alias,
+            "direction": direction,
+            "path": path,
+            "kind": kind,
+        }
+        if value is qth.Empty:
+            record["size"] = 0
+            record["deleted"] = True
+            self._write(json.dumps(record, separators=_SEPARATORS) + "\n")
+        else:
+            # Encode the value once, both to measure and to record it
+            payload = json.dumps(value, separators=_SEPARATORS)
+            record["size"] = len(payload)
+            line = json.dumps(record, separators=_SEPARATORS)
+            self._write(line[:-1] + ',"value":' + payload + "}\n")
+
+    def close(self):
+        """Write any queued records and close the file."""
+        self._queue.put(None)
+        self._thread.join()
+
+
+def read_capture(filename):
+    """Generate the records in a capture file written by a Recorder."""
+    with open(filename, "r") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
@@ -1,51 +1,331 @@
+import sys
+import time
 import asyncio
 import logging
+import multiprocessing
 
 from argparse import ArgumentParser
 
+import qth
+
 from qth_alias import AliasServer, __version__
+from qth_alias.alias import ECHO_SUPPRESSION
+from qth_alias.spec import read_specs, write_specs
+from qth_alias.admin import check_specs, import_aliases, export_aliases
+
+
+# Seconds to wait for worker processes to shut down before terminating them
+WORKER_STOP_TIMEOUT = 5.0
+
+
+def make_servers(args, prefixes, caches, **kwargs):
+    """Construct an AliasServer for each prefix. All prefixes share the first
+    server's Qth client and registration index."""
+    servers = []
+    for prefix, cache in zip(prefixes, caches):
+        servers.append(AliasServer(
+            cache_file=cache,
+            prefix=prefix,
+            host=args.host,
+            port=args.port,
+            keepalive=args.keepalive,
+            transform_cache_size=args.transform_cache_size,
+            transform_budget=args.transform_budget,
+            quarantine_after=args.quarantine_after,
+            node_id=args.node_id,
+            heartbeat_interval=args.heartbeat_interval,
+            node_timeout=args.node_timeout,
+            standby=args.standby,
+            lease_interval=args.lease_interval,
+            lease_timeout=args.lease_timeout,
+            stats_interval=args.stats_interval,
+            stats_per_alias=args.stats_per_alias,
+            trace_rate=args.trace_rate,
+            trace_file=args.trace_file,
+            trace_event=args.trace_event,
+            profile_dir=args.profile_dir,
+            error_window=args.error_window,
+            record_file=args.record_file,
+            lazy_timeout=args.lazy_timeout,
+            echo_suppression=args.echo_suppression,
+            settle_window=args.settle_window,
+            client=servers[0]._client if servers else None,
+            ls=servers[0]._ls if servers else None,
+            **kwargs))
+    return servers
+
+
+def run_servers(servers, debug=False):
+    """Run a set of AliasServers until interrupted."""
+    loop = asyncio.get_event_loop()
+    if debug:
+        loop.set_debug(True)
+
+    try:
+        loop.run_until_complete(asyncio.gather(
+            *(s.async_init() for s in servers)))
+        loop.run_forever()
+    except KeyboardInterrupt:
+        loop.run_until_complete(asyncio.gather(
+            *(s.close() for s in servers)))
+
+
+def run_worker(args, prefixes, caches, shard):
+    """Entry point for sharded worker processes."""
+    asyncio.set_event_loop(asyncio.new_event_loop())
+    run_servers(make_servers(args, prefixes, caches, shard=shard,
+                             shards=args.workers),
+                args.debug)
+
+
+def start_workers(args, prefixes, caches):
+    """Start the worker processes of a sharded server (if any).
+
+    Workers are not daemonic (daemonic processes may not start processes of
+    their own, as the process pools used by 'process' execution do) so must
+    be stopped with :py:func:`stop_workers`.
+    """
+    workers = []
+    if args.workers > 1:
+        for shard in range(args.workers):
+            worker = multiprocessing.Process(
+                target=run_worker,
+                args=(args, prefixes, caches, shard))
+            worker.start()
+            workers.append(worker)
+    return workers
+
+
+def stop_workers(workers, timeout=WORKER_STOP_TIMEOUT):
+    """Wait for worker processes to shut down (e.g. following a Ctrl+C, which
+    they also receive), terminating any still running after the timeout."""
+    deadline = time.monotonic() + timeout
+    for worker in workers:
+        worker.join(max(0.0, deadline - time.monotonic()))
+    for worker in workers:
+        if worker.is_alive():
+            worker.terminate()
+            worker.join()
+
+
+def open_file(filename, mode):
+    """Open a file, or stdin/stdout when the filename is '-'."""
+    if filename == "-":
+        return sys.stdin if mode == "r" else sys.stdout
+    return open(filename, mode)
+
+
+async def run_remote(args, prefix):
+    """Run the import or export subcommand against a running server."""
+    client = qth.Client(
+        "qth_alias-{}".format(args.command),
+        "Alias {} tool.".format(args.command),
+        host=args.host, port=args.port, keepalive=args.keepalive)
+    try:
+        if args.command == "import":
+            def progress(done, total):
+                print("Imported {} of {} aliases.".format(done, total),
+                      file=sys.stderr)
+            return await import_aliases(client, args.aliases, prefix,
+                                        args.chunk_size, args.timeout,
+                                        progress)
+        else:
+            return await export_aliases(client, prefix, args.timeout)
+    finally:
+        await client.close()
+
+
+def run_admin(args, prefix):
+    """Run the check, import or export subcommand, returning the exit
+    status."""
+    if args.command == "export":
+        try:
+            aliases = asyncio.run(run_remote(args, prefix))
+        except asyncio.TimeoutError:
+            print("No aliases published to {}aliases.".format(prefix),
+                  file=sys.stderr)
+            return 1
+        with open_file(args.file, "w") as f:
+            write_specs(f, (aliases[path] for path in sorted(aliases)))
+        return 0
+
+    with open_file(args.file, "r") as f:
+        aliases, errors = check_specs(read_specs(f))
+    for error in errors:
+        print("{}: {}".format(args.file, error), file=sys.stderr)
+    if errors:
+        return 1
+    if args.command == "check":
+        print("{}: {} aliases OK.".format(args.file, len(aliases)),
+              file=sys.stderr)
+        return 0
+
+    args.aliases = aliases
+    try:
+        errors = asyncio.run(run_remote(args, prefix))
+    except asyncio.TimeoutError:
+        print("Timed out waiting for the server to add the aliases.",
+              file=sys.stderr)
+        return 1
+    for error in errors:
+        print(error, file=sys.stderr)
+    return 1 if errors else 0
 
 
 def main():
     parser = ArgumentParser(
         description="A service which creates aliases for Qth paths.")
-    parser.add_argument("--cache", "-c", default="aliases.json",
-                        help="Filename of alias cache (default %(default)s).")
-    parser.add_argument("--prefix", "-p", default="meta/alias/",
+    parser.add_argument("--cache", "-c", action="append",
+                        help="Filename of alias cache (default aliases.json). "
+                             "When several --prefix arguments are given, "
+                             "give one --cache per prefix.")
+    parser.add_argument("--prefix", "-p", action="append",
                         help="Prefix for control events/properties "
-                             "(default %(default)s).")
+                             "(default meta/alias/). May be given several "
+                             "times to serve several independent sets of "
+                             "aliases from one process and connection.")
     parser.add_argument("--host", "-H", default=None,
                         help="Qth server hostname.")
     parser.add_argument("--port", "-P", default=None, type=int,
                         help="Qth server port.")
     parser.add_argument("--keepalive", "-K", default=10, type=int,
                         help="MQTT Keepalive interval (seconds).")
+    parser.add_argument("--transform-cache-size", default=0, type=int,
+                        help="Number of results to memoise for each pure "
+                             "transform expression with scalar values, 0 to "
+                             "disable (default %(default)s).")
+    parser.add_argument("--transform-budget", default=None, type=float,
+                        help="Maximum time (seconds) a transform may take "
+                             "(default: unlimited).")
+    parser.add_argument("--quarantine-after", default=5, type=int,
+                        help="Quarantine aliases whose transforms exceed the "
+                             "time budget this many times in a row "
+                             "(default %(default)s).")
+    parser.add_argument("--workers", "-w", default=1, type=int,
+                        help="Number of worker processes to share the "
+                             "aliases between (default %(default)s).")
+    parser.add_argument("--node-id", default=None,
+                        help="Join a cluster of alias servers sharing the "
+                             "same Qth broker under this unique name.")
+    parser.add_argument("--heartbeat-interval", default=5.0, type=float,
+                        help="Seconds between cluster heartbeats "
+                             "(default %(default)s).")
+    parser.add_argument("--node-timeout", default=15.0, type=float,
+                        help="Seconds without a heartbeat after which a "
+                             "cluster member is presumed dead "
+                             "(default %(default)s).")
+    parser.add_argument("--standby", default=False, action="store_true",
+                        help="Run as a hot-standby which prepares the "
+                             "aliases but only serves them once the active "
+                             "server's lease is released or expires.")
+    parser.add_argument("--lease-interval", default=1.0, type=float,
+                        help="Seconds between standby lease refreshes "
+                             "(default %(default)s).")
+    parser.add_argument("--lease-timeout", default=3.0, type=float,
+                        help="Seconds without a lease refresh after which a "
+                             "standby takes over (default %(default)s).")
+    parser.add_argument("--stats-interval", default=None, type=float,
+                        help="Publish statistics to <prefix>stats (workers "
+                             "and cluster members: <prefix>stats/shard/<n> "
+                             "and <prefix>stats/node/<id>) every this many "
+                             "seconds (default: disabled).")
+    parser.add_argument("--stats-per-alias", default=False,
+                        action="store_true",
+                        help="Also publish each alias' statistics to "
+                             "<prefix>stats/<alias path>.")
+    parser.add_argument("--trace-rate", default=None, type=float,
+                        help="Trace this fraction (0.0-1.0) of the values "
+                             "forwarded by aliases (default: disabled).")
+    parser.add_argument("--trace-file", default=None,
+                        help="Append traces to this file as JSON lines.")
+    parser.add_argument("--trace-event", default=False, action="store_true",
+                        help="Send traces to the <prefix>trace event.")
+    parser.add_argument("--profile-dir", default=None,
+                        help="Directory into which profiles requested via "
+                             "<prefix>profile are written (default: the "
+                             "system temporary directory).")
+    parser.add_argument("--error-window", default=10.0, type=float,
+                        help="Coalesce repeated errors from an alias within "
+                             "this many seconds (default %(default)s).")
+    parser.add_argument("--record-file", default=None,
+                        help="Record every forwarded value to this capture "
+                             "file (for replay with qth_alias-bench "
+                             "replay).")
+    parser.add_argument("--lazy-timeout", default=60.0, type=float,
+                        help="Seconds after the last activation request at "
+                             "which lazy aliases stop watching their target "
+                             "(default %(default)s).")
+    parser.add_argument("--echo-suppression", default="counter",
+                        choices=ECHO_SUPPRESSION,
+                        help="Recognise the echoes of aliases' own writes "
+                             "by counting them (relying on in-order "
+                             "delivery) or by comparing values "
+                             "(default %(default)s).")
+    parser.add_argument("--settle-window", default=0.0, type=float,
+                        help="Apply changes to a target's registration once "
+                             "it has not changed for this many seconds, "
+                             "coalescing the registrations of restarting "
+                             "devices (default %(default)s).")
     parser.add_argument("--quiet", "-q", default=False, action="store_true",
                         help="Only report errors.")
     parser.add_argument("--debug", default=False, action="store_true",
                         help="(Development only) Run asyncio in debug mode.")
     parser.add_argument("--version", "-V", action="version",
                         version="%(prog)s {}".format(__version__))
+
+    subparsers = parser.add_subparsers(dest="command")
+    check_parser = subparsers.add_parser(
+        "check", help="Validate an alias file (one alias per line) without "
+                      "contacting a server.")
+    import_parser = subparsers.add_parser(
+        "import", help="Validate an alias file and add its aliases to a "
+                       "running server.")
+    export_parser = subparsers.add_parser(
+        "export", help="Write a running server's aliases to a file.")
+    for subparser in [check_parser, import_parser, export_parser]:
+        subparser.add_argument("file", nargs="?", default="-",
+                               help="The alias file (default: "
+                                    "stdin/stdout).")
+    import_parser.add_argument("--chunk-size", default=500, type=int,
+                               help="Number of aliases to add per message "
+                                    "(default %(default)s).")
+    for subparser in [import_parser, export_parser]:
+        subparser.add_argument("--timeout", default=30.0, type=float,
+                               help="Seconds to wait for the server "
+                                    "(default %(default)s).")
     args = parser.parse_args()
 
-    if not args.quiet:
-        logging.basicConfig(level=logging.INFO)
+    prefixes = args.prefix or ["meta/alias/"]
+    if args.command is not None:
+        if len(prefixes) != 1:
+            parser.error("exactly one --prefix may be given with "
+                         "{}".format(args.command))
+        if args.command == "import" and args.chunk_size < 1:
+            parser.error("--chunk-size must be positive")
+        sys.exit(run_admin(args, prefixes[0]))
 
-    loop = asyncio.get_event_loop()
-    if not args.debug:
-        loop.set_debug(True)
+    caches = args.cache or ["aliases.json"]
+    if len(prefixes) != len(caches):
+        parser.error("exactly one --cache must be given for each --prefix")
+    if args.node_id is not None and args.workers > 1:
+        parser.error("--node-id cannot be combined with --workers")
+    if args.standby and (args.node_id is not None or args.workers > 1):
+        parser.error("--standby cannot be combined with --node-id or "
+                     "--workers")
 
-    s = AliasServer(cache_file=args.cache,
-                    prefix=args.prefix,
-                    host=args.host,
-                    port=args.port,
-                    keepalive=args.keepalive)
+    if not args.quiet:
+        logging.basicConfig(level=logging.INFO)
 
+    # When sharded, this process runs just the control plane and the aliases
+    # are served by the worker processes. (NB: Workers are started before
+    # this process creates its event loop.)
+    workers = start_workers(args, prefixes, caches)
     try:
-        loop.run_until_complete(s.async_init())
-        loop.run_forever()
-    except KeyboardInterrupt:
-        loop.run_until_complete(s.close())
+        run_servers(make_servers(args, prefixes, caches,
+                                 shards=args.workers),
+                    args.debug)
+    finally:
+        stop_workers(workers)
 
 
 if __name__ == "__main__":
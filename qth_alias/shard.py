@@ -0,0 +1,46 @@
+import zlib
+
+import qth
+
+
+def shard_of(path, shards):
+    """Return the index of the shard (0 to shards-1) which owns an alias.
+
+    Uses a stable hash of the alias path (unlike hash(), which differs between
+    processes).
+    """
+    return zlib.crc32(path.encode("utf-8")) % shards
+
+
+class RemoteAlias(object):
+    """Stands in for an alias which is served by another process.
+
+    Holds only the alias' specification so that the control plane (which
+    validates, cycle-checks and stores the full set of aliases) can treat it
+    like any other alias.
+    """
+
+    def __init__(self, alias_server, **spec):
+        self._spec = spec
+
+    async def async_init(self):
+        pass
+
+    async def activate(self):
+        pass
+
+    async def delete(self):
+        pass
+
+    async def demand(self, timeout):
+        pass
+
+    @property
+    def value(self):
+        """Remote aliases' values are not known."""
+        return qth.Empty
+
+    @property
+    def json(self):
+        """Return the JSON-serialisable specification for this alias."""
+        return self._spec
@@ -0,0 +1,210 @@
+"""
+Validation and (streamed) storage of alias specifications.
+
+Alias files, including the server's cache, hold one alias specification per
+line (JSON lines) so that large sets of aliases can be read and written
+without holding the whole file (and its parsed form) in memory at once::
+
+    {"target": "path/of/target", "alias": "path/of/alias", ...}
+    ["path/of/target", "path/of/alias"]
+"""
+
+import json
+
+from qth_alias.alias import EXECUTION_POLICIES
+from qth_alias.window import WINDOW_MODES
+
+
+# The fields of a (long-form) alias specification
+REQUIRED_FIELDS = set("target alias transform inverse description".split())
+OPTIONAL_FIELDS = set(["execution", "array", "filter", "window", "coalesce",
+                       "batch", "lazy"])
+
+
+def validate_spec(alias_spec):
+    """Validate an alias specification (in short or long form).
+
+    Returns the specification in long form with defaults filled in (and
+    default optional fields removed).
+
+    Raises
+    ------
+    ValueError
+        If the specification is not valid.
+    """
+    # Convert from short-form
+    if isinstance(alias_spec, list):
+        if len(alias_spec) == 2:
+            alias_spec = {
+                "target": alias_spec[0],
+                "alias": alias_spec[1],
+            }
+        else:
+            raise ValueError("short form alias must have two entries")
+
+    if not isinstance(alias_spec, dict):
+        raise ValueError("expected a list or dictionary")
+    alias_spec = alias_spec.copy()
+
+    # Check for missing target/alias
+    if "target" not in alias_spec:
+        raise ValueError("no 'target' in alias specification.")
+    if "alias" not in alias_spec:
+        raise ValueError("no 'alias' in alias specification.")
+
+    # Fill in defaults
+    if "transform" not in alias_spec:
+        alias_spec["transform"] = None
+    if "inverse" not in alias_spec:
+        alias_spec["inverse"] = None
+    if "description" not in alias_spec:
+        if isinstance(alias_spec["target"], list):
+            alias_spec["description"] = "Computed from {}.".format(
+                ", ".join(map(str, alias_spec["target"])))
+        else:
+            alias_spec["description"] = "Alias of {}.".format(
+                alias_spec["target"])
+
+    # Check for extra fields
+    fields = set(alias_spec)
+    if fields - OPTIONAL_FIELDS != REQUIRED_FIELDS:
+        raise ValueError("unexpected extra fields {}".format(
+            ", ".join(map(repr,
+                          fields - REQUIRED_FIELDS - OPTIONAL_FIELDS))))
+
+    # Validate the provided entries
+    if not isinstance(alias_spec["alias"], str):
+        raise ValueError("'alias' must be a path.")
+    for field in ["transform", "inverse"]:
+        if not isinstance(alias_spec[field] or "", str):
+            raise ValueError("'{}' must be a string.".format(field))
+    if isinstance(alias_spec["target"], list):
+        # Computed alias
+        if (not alias_spec["target"] or
+                not all(isinstance(t, str) for t in alias_spec["target"])):
+            raise ValueError("'target' must be a path or a non-empty list "
+                             "of paths.")
+        if (alias_spec["transform"] is None or
+                alias_spec["inverse"] is not None):
+            raise ValueError("aliases with several targets require a "
+                             "'transform' and no 'inverse'.")
+        for field in ["filter", "window", "batch", "lazy"]:
+            if alias_spec.get(field) not in (None, False):
+                raise ValueError("'{}' is not supported by aliases with "
+                                 "several targets.".format(field))
+        coalesce = alias_spec.get("coalesce")
+        if coalesce is not None and (
+                not isinstance(coalesce, (int, float)) or
+                isinstance(coalesce, bool) or coalesce < 0):
+            raise ValueError("'coalesce' must be a non-negative number.")
+    elif not isinstance(alias_spec["target"], str):
+        raise ValueError("'target' must be a path or a non-empty list of "
+                         "paths.")
+    elif alias_spec.get("coalesce") is not None:
+        raise ValueError("'coalesce' is only supported by aliases with "
+                         "several targets.")
+    elif ((alias_spec["transform"] is None) !=
+            (alias_spec["inverse"] is None)):
+        raise ValueError("expected either both or neither of 'transform' "
+                         "and 'inverse' to be supplied.")
+    if alias_spec.get("execution", "inline") not in EXECUTION_POLICIES:
+        raise ValueError("'execution' must be one of {}.".format(
+            ", ".join(EXECUTION_POLICIES)))
+
+    if not isinstance(alias_spec.get("array", False), bool):
+        raise ValueError("'array' must be true or false.")
+
+    if not isinstance(alias_spec.get("lazy", False), bool):
+        raise ValueError("'lazy' must be true or false.")
+
+    if not isinstance(alias_spec.get("filter") or "", str):
+        raise ValueError("'filter' must be a string.")
+
+    window = alias_spec.get("window")
+    if window is not None:
+        if (not isinstance(window, dict) or
+                not set(window) <= set(["period", "mode", "length"])):
+            raise ValueError("'window' must be a dictionary {'period': "
+                             "seconds, 'mode': 'tumbling' or 'sliding', "
+                             "'length': periods}.")
+        period = window.get("period")
+        if (not isinstance(period, (int, float)) or
+                isinstance(period, bool) or period <= 0):
+            raise ValueError("window 'period' must be a positive number.")
+        if window.get("mode", "tumbling") not in WINDOW_MODES:
+            raise ValueError("window 'mode' must be one of {}.".format(
+                ", ".join(WINDOW_MODES)))
+        length = window.get("length")
+        if (window.get("mode") == "sliding" and
+                (not isinstance(length, int) or
+                 isinstance(length, bool) or length < 1)):
+            raise ValueError("sliding windows require a positive integer "
+                             "'length'.")
+
+    batch = alias_spec.get("batch")
+    if batch is not None:
+        if (not isinstance(batch, dict) or not batch or
+                not set(batch) <= set(["size", "interval"])):
+            raise ValueError("'batch' must be a dictionary {'size': events, "
+                             "'interval': seconds} with at least one entry.")
+        size = batch.get("size", 1)
+        interval = batch.get("interval", 1)
+        if (not isinstance(size, int) or isinstance(size, bool) or
+                size < 1 or
+                not isinstance(interval, (int, float)) or
+                isinstance(interval, bool) or interval <= 0):
+            raise ValueError("batch 'size' must be a positive integer and "
+                             "'interval' a positive number.")
+        if window is not None:
+            raise ValueError("'batch' and 'window' cannot be combined.")
+
+    # Defaults for optional fields are omitted
+    if alias_spec.get("execution") == "inline":
+        del alias_spec["execution"]
+    for field in ["array", "lazy"]:
+        if alias_spec.get(field) is False:
+            del alias_spec[field]
+    for field in ["filter", "window", "coalesce", "batch"]:
+        if field in alias_spec and alias_spec[field] is None:
+            del alias_spec[field]
+
+    return alias_spec
+
+
+def read_specs(f):
+    """Generate the alias specifications in a file, one per line (JSON
+    lines), without validating them.
+
+    For compatibility, files holding a single JSON object {path: spec, ...}
+    (the format of caches written by earlier versions) are also read.
+
+    Raises
+    ------
+    ValueError
+        If a line is not valid JSON. The message gives the line number.
+    """
+    for lineno, line in enumerate(f, 1):
+        if not line.strip():
+            continue
+        try:
+            spec = json.loads(line)
+        except ValueError as e:
+            if lineno == 1 and f.seekable():
+                # Possibly an older (pretty-printed) cache file
+                f.seek(0)
+                yield from json.load(f).values()
+                return
+            raise ValueError("line {}: {}".format(lineno, e))
+        if (isinstance(spec, dict) and "alias" not in spec and
+                all(isinstance(s, dict) for s in spec.values())):
+            # An older cache file: {path: spec, ...}
+            yield from spec.values()
+        else:
+            yield spec
+
+
+def write_specs(f, specs):
+    """Write alias specifications to a file, one per line (JSON lines)."""
+    for spec in specs:
+        f.write(json.dumps(spec))
+        f.write("\n")
@@ -0,0 +1,177 @@
+import bisect
+
+
+def log_bounds(lowest=1e-6, highest=100.0, per_decade=4):
+    """Return the upper bounds of logarithmically spaced histogram buckets
+    from 'lowest' to (at least) 'highest' with 'per_decade' buckets per
+    power of ten."""
+    bounds = []
+    bound = lowest
+    while bound < highest * (1.0 + 1e-9):
+        bounds.append(bound)
+        bound = lowest * 10.0 ** (len(bounds) / per_decade)
+    return tuple(bounds)
+
+
+# Default bucket bounds (seconds) for timing histograms: 1 us to 100 s.
+DEFAULT_BOUNDS = log_bounds()
+
+
+class Histogram(object):
+    """A histogram of (non-negative) samples with fixed, logarithmically
+    spaced buckets.
+
+    All storage is allocated up-front so that adding a sample does not
+    allocate any objects.
+    """
+
+    __slots__ = ["_bounds", "counts", "count", "total", "maximum"]
+
+    def __init__(self, bounds=DEFAULT_BOUNDS):
+        """
+        Parameters
+        ----------
+        bounds : (float, ...)
+            The (sorted) upper bound of each bucket. Samples greater than the
+            last bound are counted in an additional overflow bucket.
+        """
+        self._bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def add(self, sample):
+        self.counts[bisect.bisect_left(self._bounds, sample)] += 1
+        self.count += 1
+        self.total += sample
+        if sample > self.maximum:
+            self.maximum = sample
+
+    def merge(self, other):
+        """Add the samples recorded in another histogram (with the same
+        bounds) to this one."""
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.count += other.count
+        self.total += other.total
+        self.maximum = max(self.maximum, other.maximum)
+
+    def quantile(self, q):
+        """Estimate the q-th quantile (0.0 - 1.0) as the upper bound of the
+        bucket containing it (or the maximum if it lies in the overflow
+        bucket). Returns None if no samples have been recorded."""
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self._bounds, self.counts):
+            seen += count
+            if seen >= rank and count:
+                return min(bound, self.maximum)
+        return self.maximum
+
+    @property
+    def json(self):
+        """A JSON-serialisable summary. 'buckets' lists [upper bound, count]
+        pairs for the non-empty buckets (the overflow bucket's bound being
+        null)."""
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "max": self.maximum,
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99),
+            "buckets": [
+                [bound, count]
+                for bound, count in zip(self._bounds + (None, ), self.counts)
+                if count
+            ],
+        }
+
+
+class AliasStats(object):
+    """Counters for a single alias."""
+
+    __slots__ = ["to_alias", "to_target", "echoes_suppressed", "errors",
+                 "transform_time", "memo_hits", "memo_misses"]
+
+    def __init__(self):
+        # Number of values forwarded from the target to the alias
+        self.to_alias = 0
+
+        # Number of values forwarded from the alias to the target
+        self.to_target = 0
+
+        # Number of values received which were our own echoes (and so were
+        # not forwarded)
+        self.echoes_suppressed = 0
+
+        # Number of transform, inverse, filter (etc.) errors
+        self.errors = 0
+
+        # Time (seconds) taken to evaluate each transform or inverse. (None
+        # until the first transform is evaluated since most aliases have no
+        # transform.)
+        self.transform_time = None
+
+        # Number of transform evaluations answered from (and missing) the
+        # transforms' memos. (Updated from the memos when published, see
+        # :py:meth:`qth_alias.alias.Alias._update_memo_stats`.)
+        self.memo_hits = 0
+        self.memo_misses = 0
+
+    def add_transform_time(self, duration):
+        if self.transform_time is None:
+            self.transform_time = Histogram()
+        self.transform_time.add(duration)
+
+    def merge(self, other):
+        """Add another alias' counters to this one."""
+        self.to_alias += other.to_alias
+        self.to_target += other.to_target
+        self.echoes_suppressed += other.echoes_suppressed
+        self.errors += other.errors
+        self.memo_hits += other.memo_hits
+        self.memo_misses += other.memo_misses
+        if other.transform_time is not None:
+            if self.transform_time is None:
+                self.transform_time = Histogram()
+            self.transform_time.merge(other.transform_time)
+
+    @property
+    def json(self):
+        return {
+            "to_alias": self.to_alias,
+            "to_target": self.to_target,
+            "echoes_suppressed": self.echoes_suppressed,
+            "errors": self.errors,
+            "transform_time": (self.transform_time or Histogram()).json,
+            "memo_hits": self.memo_hits,
+            "memo_misses": self.memo_misses,
+        }
+
+
+class ServerStats(object):
+    """Server-wide measurements."""
+
+    __slots__ = ["loop_lag", "registration_latency", "cache_write_latency"]
+
+    def __init__(self):
+        # How late (seconds) periodic wake-ups of the event loop were
+        self.loop_lag = Histogram()
+
+        # Time (seconds) taken to (re-)register aliases following a change to
+        # their target's registration
+        self.registration_latency = Histogram()
+
+        # Time (seconds) taken to write the cache file
+        self.cache_write_latency = Histogram()
+
+    @property
+    def json(self):
+        return {
+            "loop_lag": self.loop_lag.json,
+            "registration_latency": self.registration_latency.json,
+            "cache_write_latency": self.cache_write_latency.json,
+        }
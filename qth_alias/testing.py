@@ -0,0 +1,385 @@
+"""
+In-process stand-ins for a Qth (MQTT) broker, the Qth registrar and
+qth.Client, for testing (and benchmarking) alias servers without a network.
+
+The registrar emulation publishes the 'meta/ls/' listings of registered
+paths so the real :py:class:`qth_ls.Ls` may be used with
+:py:class:`FakeClient`.
+"""
+
+import asyncio
+import inspect
+import json
+import random
+
+import qth
+
+
+def topic_matches(pattern, topic):
+    """Test whether an MQTT topic matches a subscription pattern which may
+    contain '+' and '#' wildcards."""
+    pattern_parts = pattern.split("/")
+    topic_parts = topic.split("/")
+    for i, part in enumerate(pattern_parts):
+        if part == "#":
+            return True
+        if i >= len(topic_parts):
+            return False
+        if part != "+" and part != topic_parts[i]:
+            return False
+    return len(pattern_parts) == len(topic_parts)
+
+
+def path_directories(path):
+    """Given a Qth path, generate (directory, name, is_directory) for each
+    level of the path. For example 'foo/bar' generates ('', 'foo', True) and
+    ('foo/', 'bar', False)."""
+    parts = path.split("/")
+    for depth, name in enumerate(parts):
+        yield ("".join(part + "/" for part in parts[:depth]), name,
+               depth < len(parts) - 1)
+
+
+class FakeBroker(object):
+    """An in-process stand-in for an MQTT broker and the Qth registrar.
+
+    Messages are delivered to subscribed :py:class:`FakeClient` callbacks in
+    new tasks (as qth.Client does). Retained messages are kept and delivered
+    to new subscribers. Values are round-tripped through JSON, as they would
+    be on the wire.
+
+    Delivery may be delayed by a fixed latency plus a random jitter and
+    messages may be randomly dropped. Messages on a given topic are always
+    delivered to a given subscriber in the order they were published.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, drop_rate=0.0, seed=None,
+                 registrar=True):
+        """
+        Parameters
+        ----------
+        latency : float
+            Seconds between a message being published and delivered.
+        jitter : float
+            A random delay of up to this many seconds is added to the
+            latency of each message.
+        drop_rate : float
+            The probability (0.0 - 1.0) of a published message not being
+            delivered to a subscriber. (Retained values delivered on
+            subscription are never dropped.)
+        seed : int or None
+            Seed for the random jitter and drops.
+        registrar : bool
+            If True, emulate the Qth registrar: publish the 'meta/ls/'
+            listings of the paths registered by clients and apply their
+            on_unregister/delete_on_unregister behaviour when they
+            disconnect.
+        """
+        self._latency = latency
+        self._jitter = jitter
+        self._drop_rate = drop_rate
+        self._random = random.Random(seed)
+        self._registrar = registrar
+
+        # {topic: value, ...}
+        self._retained = {}
+
+        # Subscriptions to exact topics and to wildcard patterns
+        # {topic: [callback, ...], ...}
+        # [(pattern, callback), ...]
+        self._subscriptions = {}
+        self._wildcard_subscriptions = []
+
+        # Deliveries which have not yet completed
+        self._pending = set()
+
+        # The most recently scheduled delayed delivery for each subscription
+        # and topic (used to preserve ordering).
+        # {(pattern, callback, topic): task, ...}
+        self._last_delivery = {}
+
+        # The paths registered by each client.
+        # {client_id: {path: {"behaviour": ..., ...}, ...}, ...}
+        self._registrations = {}
+
+        # The registrar's listing of each directory and the number of
+        # registered paths within each subdirectory.
+        # {directory: {name: [entry, ...], ...}, ...}
+        # {(directory, name): count, ...}
+        self._listings = {}
+        self._directory_counts = {}
+
+        # Directories whose listings have changed but not yet been published
+        self._dirty_listings = set()
+
+        # Counters of messages published, delivered and dropped
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+
+    def _start(self, callback, topic, value):
+        """Call a subscriber's callback in a new task."""
+        async def deliver():
+            retval = callback(topic, value)
+            if inspect.isawaitable(retval):
+                await retval
+        self._track(asyncio.get_event_loop().create_task(deliver()))
+        self.delivered += 1
+
+    def _track(self, task):
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    def _deliver(self, pattern, callback, topic, value):
+        """Deliver a message to a subscriber, after any latency."""
+        delay = self._latency
+        if self._jitter:
+            delay += self._random.uniform(0.0, self._jitter)
+        key = (pattern, callback, topic)
+        previous = self._last_delivery.get(key)
+
+        if delay <= 0.0 and previous is None:
+            self._start(callback, topic, value)
+            return
+
+        loop = asyncio.get_event_loop()
+        deliver_at = loop.time() + delay
+
+        async def delayed():
+            if previous is not None:
+                await asyncio.wait([previous])
+            await asyncio.sleep(max(0.0, deliver_at - loop.time()))
+            self._start(callback, topic, value)
+
+        task = loop.create_task(delayed())
+        self._track(task)
+        self._last_delivery[key] = task
+
+        def done(task):
+            if self._last_delivery.get(key) is task:
+                del self._last_delivery[key]
+        task.add_done_callback(done)
+
+    def publish(self, topic, value, retain=False):
+        """Publish a message to all matching subscribers."""
+        if value is not qth.Empty:
+            value = json.loads(json.dumps(value))
+
+        if retain:
+            if value is qth.Empty:
+                self._retained.pop(topic, None)
+            else:
+                self._retained[topic] = value
+
+        self.published += 1
+        subscribers = [(topic, callback)
+                       for callback in self._subscriptions.get(topic, ())]
+        subscribers.extend(
+            (pattern, callback)
+            for pattern, callback in self._wildcard_subscriptions
+            if topic_matches(pattern, topic))
+        for pattern, callback in subscribers:
+            if self._drop_rate and self._random.random() < self._drop_rate:
+                self.dropped += 1
+            else:
+                self._deliver(pattern, callback, topic, value)
+
+    def subscribe(self, pattern, callback):
+        """Subscribe a callback to a topic pattern. Matching retained messages
+        are delivered immediately."""
+        if "+" in pattern or "#" in pattern:
+            self._wildcard_subscriptions.append((pattern, callback))
+            for topic, value in list(self._retained.items()):
+                if topic_matches(pattern, topic):
+                    self._deliver(pattern, callback, topic, value)
+        else:
+            self._subscriptions.setdefault(pattern, []).append(callback)
+            if pattern in self._retained:
+                self._deliver(pattern, callback, pattern,
+                              self._retained[pattern])
+
+    def unsubscribe(self, pattern, callback):
+        """Remove a subscription made with subscribe."""
+        if "+" in pattern or "#" in pattern:
+            self._wildcard_subscriptions.remove((pattern, callback))
+        else:
+            callbacks = self._subscriptions[pattern]
+            callbacks.remove(callback)
+            if not callbacks:
+                del self._subscriptions[pattern]
+
+    def get_retained(self, topic, default=None):
+        """Get the retained value of a topic."""
+        return self._retained.get(topic, default)
+
+    def register(self, client_id, path, registration):
+        """Register a path on behalf of a client."""
+        if not self._registrar:
+            return
+        self.unregister(client_id, path)
+        self._registrations.setdefault(client_id, {})[path] = registration
+
+        for directory, name, is_directory in path_directories(path):
+            listing = self._listings.setdefault(directory, {})
+            if is_directory:
+                key = (directory, name)
+                self._directory_counts[key] = \
+                    self._directory_counts.get(key, 0) + 1
+                if self._directory_counts[key] > 1:
+                    continue
+                entry = {
+                    "behaviour": qth.DIRECTORY,
+                    "description": "Holds subpaths {}{}/*.".format(
+                        directory, name),
+                }
+            else:
+                entry = dict(registration, client_id=client_id)
+            listing.setdefault(name, []).append(entry)
+            self._mark_dirty(directory)
+
+    def unregister(self, client_id, path):
+        """Unregister a path registered by a client. Returns the
+        registration (or None if it was not registered)."""
+        registration = self._registrations.get(client_id, {}).pop(path, None)
+        if registration is None:
+            return None
+
+        for directory, name, is_directory in path_directories(path):
+            listing = self._listings[directory]
+            if is_directory:
+                key = (directory, name)
+                self._directory_counts[key] -= 1
+                if self._directory_counts[key]:
+                    continue
+                del self._directory_counts[key]
+                entries = [e for e in listing[name]
+                           if e["behaviour"] != qth.DIRECTORY]
+            else:
+                entries = [e for e in listing[name]
+                           if e.get("client_id") != client_id or
+                           e["behaviour"] == qth.DIRECTORY]
+            if entries:
+                listing[name] = entries
+            else:
+                del listing[name]
+            if not listing:
+                del self._listings[directory]
+            self._mark_dirty(directory)
+
+        return registration
+
+    def disconnect(self, client_id):
+        """Unregister all of a client's paths, applying their on_unregister
+        or delete_on_unregister behaviour."""
+        for path in list(self._registrations.get(client_id, {})):
+            registration = self.unregister(client_id, path)
+            if "on_unregister" in registration:
+                self.publish(
+                    path, registration["on_unregister"],
+                    retain=registration["behaviour"].startswith("PROPERTY"))
+            elif registration.get("delete_on_unregister"):
+                self.publish(path, qth.Empty, retain=True)
+        self._registrations.pop(client_id, None)
+
+    def _mark_dirty(self, directory):
+        """Schedule a directory's listing to be published (changes made
+        within the same event loop iteration are published together)."""
+        if not self._dirty_listings:
+            async def publish_listings():
+                dirty = self._dirty_listings
+                self._dirty_listings = set()
+                for directory in sorted(dirty):
+                    self.publish("meta/ls/" + directory,
+                                 self._listings.get(directory, qth.Empty),
+                                 retain=True)
+            self._track(asyncio.get_event_loop().create_task(
+                publish_listings()))
+        self._dirty_listings.add(directory)
+
+    async def settle(self):
+        """Wait until all messages (including those sent in response to
+        other messages) have been delivered."""
+        while self._pending:
+            await asyncio.wait(list(self._pending))
+
+
+class FakeClient(object):
+    """A stand-in for qth.Client connected to a :py:class:`FakeBroker`."""
+
+    def __init__(self, broker, client_id="fake"):
+        self._broker = broker
+        self._client_id = client_id
+
+        # The paths registered by this client.
+        # {path: {"behaviour": ..., "description": ..., ...}, ...}
+        self._registration = {}
+
+    @property
+    def client_id(self):
+        return self._client_id
+
+    async def register(self, path, behaviour, description,
+                       on_unregister=None, delete_on_unregister=False):
+        self._registration[path] = {
+            "behaviour": behaviour,
+            "description": description,
+        }
+        if on_unregister is not None:
+            self._registration[path]["on_unregister"] = on_unregister
+        elif delete_on_unregister:
+            self._registration[path]["delete_on_unregister"] = True
+        self._broker.register(self._client_id, path,
+                              self._registration[path])
+
+    async def unregister(self, path):
+        self._registration.pop(path, None)
+        self._broker.unregister(self._client_id, path)
+
+    async def publish(self, topic, payload, retain=False):
+        self._broker.publish(topic, payload, retain)
+
+    async def subscribe(self, topic, callback):
+        self._broker.subscribe(topic, callback)
+
+    async def unsubscribe(self, topic, callback):
+        self._broker.unsubscribe(topic, callback)
+
+    async def send_event(self, topic, value=None):
+        await self.publish(topic, value)
+
+    async def watch_event(self, topic, callback):
+        await self.subscribe(topic, callback)
+
+    async def unwatch_event(self, topic, callback):
+        await self.unsubscribe(topic, callback)
+
+    async def set_property(self, topic, value):
+        await self.publish(topic, value, retain=True)
+
+    async def watch_property(self, topic, callback):
+        await self.subscribe(topic, callback)
+
+    async def unwatch_property(self, topic, callback):
+        await self.unsubscribe(topic, callback)
+
+    async def delete_property(self, topic):
+        await self.set_property(topic, qth.Empty)
+
+    async def ensure_connected(self):
+        pass
+
+    async def close(self):
+        """Disconnect, applying the on_unregister/delete_on_unregister
+        behaviour of registered paths as the Qth registrar would."""
+        registration = self._registration
+        self._registration = {}
+        if self._broker._registrar:
+            self._broker.disconnect(self._client_id)
+        else:
+            for path, entry in registration.items():
+                if "on_unregister" in entry:
+                    self._broker.publish(
+                        path, entry["on_unregister"],
+                        retain=entry["behaviour"].startswith("PROPERTY"))
+                elif entry.get("delete_on_unregister"):
+                    self._broker.publish(path, qth.Empty, retain=True)
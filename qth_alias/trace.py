@@ -0,0 +1,131 @@
+import asyncio
+import collections
+import json
+import random
+import time
+
+
+class Span(object):
+    """Timings of a single value as it is forwarded through an alias.
+
+    Attributes
+    ----------
+    alias : str
+        The alias path.
+    direction : "to_alias" or "to_target"
+        Which way the value was forwarded.
+    received : float
+        The (wall-clock) time at which the value was received.
+    transformed : float or None
+        Seconds after receipt at which the transform (or inverse) completed.
+    published : float or None
+        Seconds after receipt at which the broker acknowledged the forwarded
+        value.
+    """
+
+    __slots__ = ["alias", "direction", "received", "transformed",
+                 "published", "_start"]
+
+    def __init__(self, alias, direction):
+        self.alias = alias
+        self.direction = direction
+        self.received = time.time()
+        self.transformed = None
+        self.published = None
+        self._start = time.monotonic()
+
+    def mark_transformed(self):
+        self.transformed = time.monotonic() - self._start
+
+    def mark_published(self):
+        self.published = time.monotonic() - self._start
+
+    @property
+    def json(self):
+        return {
+            "alias": self.alias,
+            "direction": self.direction,
+            "received": self.received,
+            "transformed": self.transformed,
+            "published": self.published,
+        }
+
+
+class RingBufferSink(object):
+    """Keeps the most recent spans in memory."""
+
+    def __init__(self, size=1000):
+        self.spans = collections.deque(maxlen=size)
+
+    def record(self, span):
+        self.spans.append(span)
+
+    def close(self):
+        pass
+
+
+class JsonLinesSink(object):
+    """Appends spans to a file, one JSON object per line."""
+
+    def __init__(self, filename):
+        self._file = open(filename, "a")
+
+    def record(self, span):
+        self._file.write(json.dumps(span.json) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class EventSink(object):
+    """Sends each span as a Qth event."""
+
+    def __init__(self, client, path):
+        self._client = client
+        self._path = path
+
+    def record(self, span):
+        asyncio.get_event_loop().create_task(
+            self._client.send_event(self._path, span.json))
+
+    def close(self):
+        pass
+
+
+class Tracer(object):
+    """Records a sample of the values forwarded by aliases into a set of
+    sinks."""
+
+    def __init__(self, sinks, sample_rate=1.0, seed=None):
+        """
+        Parameters
+        ----------
+        sinks : [sink, ...]
+            Objects with a 'record(span)' method and a 'close()' method.
+        sample_rate : float
+            The fraction (0.0 - 1.0) of forwarded values to trace.
+        seed : int or None
+            Seed for the sampling decisions.
+        """
+        self._sinks = sinks
+        self._sample_rate = sample_rate
+        self._random = random.Random(seed)
+
+    def start(self, alias, direction):
+        """Start tracing a value received by an alias. Returns a Span or
+        None if this value is not sampled."""
+        if (self._sample_rate < 1.0 and
+                self._random.random() >= self._sample_rate):
+            return None
+        return Span(alias, direction)
+
+    def finish(self, span):
+        """Record a span once its value has been published."""
+        span.mark_published()
+        for sink in self._sinks:
+            sink.record(span)
+
+    def close(self):
+        for sink in self._sinks:
+            sink.close()
@@ -0,0 +1,262 @@
+import ast
+import time
+import threading
+
+from collections import OrderedDict
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+
+# Built-in functions which have no side effects and whose result depends only
+# on their arguments.
+PURE_BUILTINS = frozenset([
+    "abs", "all", "any", "bin", "bool", "chr", "complex", "dict", "divmod",
+    "enumerate", "filter", "float", "format", "frozenset", "hex", "int",
+    "isinstance", "len", "list", "map", "max", "min", "oct", "ord", "pow",
+    "range", "repr", "reversed", "round", "set", "slice", "sorted", "str",
+    "sum", "tuple", "zip",
+])
+
+# Modules all of whose functions are pure.
+PURE_MODULES = frozenset(["math", "itertools"])
+
+# Individual module functions which are pure.
+PURE_ATTRIBUTES = frozenset([
+    ("functools", "reduce"),
+    ("functools", "partial"),
+])
+
+
+def is_pure(tree):
+    """Determine whether a parsed transform expression is pure, that is, its
+    result depends only on 'value'.
+
+    This is a conservative check: only names bound within the expression
+    (e.g. by a lambda or comprehension), 'value', the functions in
+    PURE_BUILTINS and the module members in PURE_MODULES and PURE_ATTRIBUTES
+    may be referenced. Attribute lookups on anything else (e.g. methods of
+    'value') are considered impure.
+    """
+    # Names bound within the expression itself
+    bound = set(["value"])
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store):
+            bound.add(node.id)
+        elif isinstance(node, ast.arg):
+            bound.add(node.arg)
+
+    # Module names which appear as the base of an allowed attribute lookup
+    module_names = set()
+
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Attribute):
+            if not isinstance(node.value, ast.Name):
+                return False
+            module = node.value.id
+            if module in bound:
+                return False
+            if (module not in PURE_MODULES and
+                    (module, node.attr) not in PURE_ATTRIBUTES):
+                return False
+            module_names.add(id(node.value))
+
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and id(node) not in module_names:
+            if node.id not in bound and node.id not in PURE_BUILTINS:
+                return False
+
+    return True
+
+
+# The types of values and results which are memoised. Keying on (and safely
+# handing out) containers costs more than evaluating most transforms.
+MEMO_TYPES = (type(None), bool, int, float, str)
+
+# The longest string value which is memoised.
+MEMO_MAX_STR_LEN = 256
+
+
+def memoisable(value):
+    """Is a value small and immutable enough to be memoised (as a transform's
+    input or result)?"""
+    return type(value) in MEMO_TYPES and (
+        type(value) is not str or len(value) <= MEMO_MAX_STR_LEN)
+
+
+def freeze(value):
+    """Convert a JSON-style value into a hashable key.
+
+    The type of each value is included in the key so that values which
+    compare equal but behave differently (e.g. 1, 1.0 and True) do not
+    collide.
+    """
+    if isinstance(value, list):
+        return (list, tuple(map(freeze, value)))
+    elif isinstance(value, dict):
+        return (dict, tuple(sorted((k, freeze(v)) for k, v in value.items())))
+    else:
+        return (type(value), value)
+
+
+def to_json(value):
+    """Convert NumPy arrays and scalars into their JSON-serialisable
+    equivalents, including those within lists, tuples and dictionaries (e.g.
+    the result of '[value.min(), value.max()]'). Other values are returned
+    unchanged."""
+    if numpy is not None:
+        if isinstance(value, numpy.ndarray):
+            return value.tolist()
+        elif isinstance(value, numpy.generic):
+            return value.item()
+    if isinstance(value, (list, tuple)):
+        return [to_json(v) for v in value]
+    elif isinstance(value, dict):
+        return {k: to_json(v) for k, v in value.items()}
+    return value
+
+
+class LRUMemo(object):
+    """A bounded least-recently-used memo of input to output values.
+
+    Safe to use from multiple threads.
+    """
+
+    def __init__(self, size):
+        """
+        Parameters
+        ----------
+        size : int
+            The maximum number of entries to hold.
+        """
+        self.size = size
+
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def lookup(self, key):
+        """Return (True, result) if 'key' is memoised, (False, None)
+        otherwise.
+        """
+        with self._lock:
+            try:
+                result = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return (False, None)
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return (True, result)
+
+    def store(self, key, result):
+        """Memoise a result, evicting the least recently used entry if
+        full."""
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+
+class Transform(object):
+    """A compiled transform expression.
+
+    Call with a value to evaluate the expression with that value bound to the
+    variable 'value'.
+    """
+
+    def __init__(self, code, namespace, cache_size=0, array=False):
+        """
+        Parameters
+        ----------
+        code : str
+            A Python expression.
+        namespace : dict
+            The global namespace in which the expression is evaluated.
+        cache_size : int
+            If greater than zero and the expression is pure, memoise up to
+            this many results. Only scalar (and short string) values and
+            results are memoised (see :py:func:`memoisable`).
+        array : bool
+            If True and NumPy is installed, list values are presented to the
+            expression as NumPy arrays and NumPy results are converted back
+            into lists. Array transforms are never memoised.
+
+        Raises
+        ------
+        SyntaxError
+            If the expression is not valid.
+        """
+        self.code = code
+        self._namespace = namespace
+
+        tree = ast.parse(code, mode="eval")
+        self._compiled = compile(tree, "<transform>", "eval")
+
+        self.pure = is_pure(tree)
+
+        self.array = array and numpy is not None
+
+        if self.pure and cache_size > 0 and not self.array:
+            self.memo = LRUMemo(cache_size)
+        else:
+            self.memo = None
+
+    def __call__(self, value):
+        if self.array:
+            if isinstance(value, list):
+                value = numpy.asarray(value)
+            return to_json(
+                eval(self._compiled, self._namespace, {"value": value}))
+
+        if self.memo is None or not memoisable(value):
+            return eval(self._compiled, self._namespace, {"value": value})
+
+        # NB: The type is part of the key so that 1, 1.0 and True (which are
+        # equal) do not collide.
+        key = (type(value), value)
+        found, result = self.memo.lookup(key)
+        if not found:
+            result = eval(self._compiled, self._namespace, {"value": value})
+            # Results are handed out as-is so must be immutable
+            if memoisable(result):
+                self.memo.store(key, result)
+        return result
+
+
+def call_timed(function, *args):
+    """Call a function, returning (result, CPU time used by the calling
+    thread). Used to measure the CPU time of transforms evaluated in a
+    thread or process pool from within the worker doing so."""
+    start = time.thread_time()
+    result = function(*args)
+    return (result, time.thread_time() - start)
+
+
+# Transforms compiled within a worker process by evaluate_in_worker.
+# {(code, cache_size, array): Transform, ...}
+_worker_transforms = {}
+
+
+def evaluate_in_worker(code, cache_size, array, value):
+    """Evaluate a transform expression within a process pool worker.
+
+    Each expression is compiled (and its results memoised) once per worker
+    process rather than once per call.
+    """
+    key = (code, cache_size, array)
+    transform = _worker_transforms.get(key)
+    if transform is None:
+        # Evaluate in the same namespace as transforms run in the server
+        from qth_alias import alias
+        transform = _worker_transforms[key] = Transform(
+            code, vars(alias), cache_size, array)
+    return transform(value)
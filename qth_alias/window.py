@@ -0,0 +1,94 @@
+import math
+
+
+# The supported windowing modes:
+# * tumbling: Each published aggregate covers the samples received in the
+#   preceding period only.
+# * sliding: Each published aggregate covers the samples received in the
+#   preceding 'length' periods.
+WINDOW_MODES = ["tumbling", "sliding"]
+
+
+class Window(object):
+    """Aggregates numeric samples over a tumbling or sliding time window.
+
+    The window is a fixed-size ring buffer of buckets, one per period, each
+    holding the count, sum, minimum and maximum of the samples received during
+    that period. The count and sum of the whole window are kept as running
+    totals so adding a sample is O(1) and memory use is fixed regardless of
+    the sample rate.
+    """
+
+    def __init__(self, length=1):
+        """
+        Parameters
+        ----------
+        length : int
+            The number of periods covered by the window. A window with a
+            length of one is a tumbling window.
+        """
+        self._count = [0] * length
+        self._sum = [0.0] * length
+        self._min = [math.inf] * length
+        self._max = [-math.inf] * length
+
+        # Index of the bucket for the current period
+        self._current = 0
+
+        # Running totals over all buckets
+        self._total_count = 0
+        self._total_sum = 0.0
+
+    def add(self, sample):
+        """Add a numeric sample to the current period.
+
+        Raises
+        ------
+        TypeError, ValueError
+            If the sample is not a number.
+        """
+        if isinstance(sample, bool):
+            sample = int(sample)
+        sample = float(sample)
+
+        i = self._current
+        self._count[i] += 1
+        self._sum[i] += sample
+        if sample < self._min[i]:
+            self._min[i] = sample
+        if sample > self._max[i]:
+            self._max[i] = sample
+
+        self._total_count += 1
+        self._total_sum += sample
+
+    def advance(self):
+        """Start a new period, discarding the oldest period's samples."""
+        self._current = (self._current + 1) % len(self._count)
+
+        i = self._current
+        self._total_count -= self._count[i]
+        self._total_sum -= self._sum[i]
+        if self._total_count == 0:
+            # Avoid accumulating floating point error
+            self._total_sum = 0.0
+
+        self._count[i] = 0
+        self._sum[i] = 0.0
+        self._min[i] = math.inf
+        self._max[i] = -math.inf
+
+    def aggregate(self):
+        """Return a dictionary {"mean": ..., "min": ..., "max": ...,
+        "count": ...} summarising the samples in the window, or None if the
+        window holds no samples.
+        """
+        if self._total_count == 0:
+            return None
+
+        return {
+            "mean": self._total_sum / self._total_count,
+            "min": min(self._min),
+            "max": max(self._max),
+            "count": self._total_count,
+        }
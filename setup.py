@@ -31,11 +31,15 @@ setup(
 
     # Requirements
     install_requires=["qth>=0.7.0", "qth_ls>=0.2.0"],
+    extras_require={
+        "numpy": ["numpy"],
+    },
 
     # Scripts
     entry_points={
         "console_scripts": [
             "qth_alias = qth_alias.server:main",
+            "qth_alias-bench = qth_alias.bench:main",
         ],
     }
 )
@@ -0,0 +1,86 @@
+import pytest
+
+import asyncio
+
+from qth_ls import Ls
+
+from qth_alias import AliasServer
+from qth_alias.admin import check_specs, import_aliases, export_aliases
+from qth_alias.testing import FakeBroker, FakeClient
+
+
+def test_check_specs():
+    aliases, errors = check_specs([
+        ["a", "b"],
+        {"target": "c", "alias": "d", "transform": "value *",
+         "inverse": "value"},
+        {"target": "e"},
+        {"target": "f", "alias": "b"},
+    ])
+    # Later specifications replace earlier ones
+    assert aliases == {"b": {"target": "f", "alias": "b", "transform": None,
+                             "inverse": None,
+                             "description": "Alias of f."}}
+    assert len(errors) == 2
+    assert errors[0].startswith("entry 2 (d): invalid transform: ")
+    assert errors[1] == "entry 3: no 'alias' in alias specification."
+
+
+def test_check_specs_cycle():
+    aliases, errors = check_specs([["a", "b"], ["b", "a"]])
+    assert errors == ["cyclic alias dependency: b -> a -> b"]
+
+
+def test_check_specs_unreadable():
+    def specs():
+        yield ["a", "b"]
+        raise ValueError("line 2: nope")
+    aliases, errors = check_specs(specs())
+    assert set(aliases) == set(["b"])
+    assert errors == ["line 2: nope"]
+
+
+@pytest.mark.asyncio
+async def test_import_export():
+    broker = FakeBroker()
+    client = FakeClient(broker)
+    server = AliasServer(client=client, ls=Ls(client))
+    await server.async_init()
+    await broker.settle()
+
+    aliases, errors = check_specs(
+        ["import/{}/target".format(i), "import/{}/alias".format(i)]
+        for i in range(10))
+    assert errors == []
+
+    admin = FakeClient(broker, "admin")
+    progress = []
+    errors = await import_aliases(
+        admin, aliases, chunk_size=4,
+        progress=lambda done, total: progress.append((done, total)))
+    assert errors == []
+    assert progress == [(4, 10), (8, 10), (10, 10)]
+    assert server._aliases_json == aliases
+
+    assert await export_aliases(admin) == aliases
+
+    # Errors reported by the server are returned
+    cyclic = {"import/0/target": {
+        "target": "import/0/alias", "alias": "import/0/target",
+        "transform": None, "inverse": None, "description": ""}}
+    errors = await import_aliases(admin, cyclic)
+    assert len(errors) == 1
+    assert "cyclic" in errors[0]
+
+    await server.close()
+
+
+@pytest.mark.asyncio
+async def test_import_timeout():
+    broker = FakeBroker()
+    admin = FakeClient(broker, "admin")
+    with pytest.raises(asyncio.TimeoutError):
+        await import_aliases(admin, {"b": {"target": "a", "alias": "b"}},
+                             timeout=0.01)
+    with pytest.raises(asyncio.TimeoutError):
+        await export_aliases(admin, timeout=0.01)
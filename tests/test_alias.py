@@ -1,5 +1,10 @@
 import pytest
 import asyncio
+import gc
+import sys
+import time
+
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
 from mock import Mock
 
@@ -7,7 +12,13 @@ from util import AsyncMock
 
 import qth
 
-from qth_alias.alias import Alias
+from qth_alias.alias import Alias, registration_template
+from qth_alias import alias as alias_module
+from qth_alias.profiler import Profile
+from qth_alias.reconcile import Reconciler
+from qth_alias.transform import freeze
+from qth_alias.stats import ServerStats
+from qth_alias.trace import Tracer, RingBufferSink
 
 
 @pytest.fixture()
@@ -46,9 +57,35 @@ def mock_alias_server(mock_client, mock_ls):
     mock_alias_server._client = mock_client
     mock_alias_server._ls = mock_ls
 
+    mock_alias_server._transform_cache_size = 16
+    mock_alias_server._transform_budget = None
+    mock_alias_server._quarantine_after = 2
+    mock_alias_server._stats = ServerStats()
+    mock_alias_server._tracer = None
+    mock_alias_server._profile = None
+    mock_alias_server._recorder = None
+    mock_alias_server._echo_suppression = "counter"
+    mock_alias_server._settle_window = 0
+    mock_alias_server._active = True
+
     return mock_alias_server
 
 
+def test_registration_template():
+    registration = {"behaviour": "PROPERTY-1:N", "on_unregister": "template"}
+    a = registration_template(dict(registration))
+    b = registration_template(dict(registration))
+    assert a is b
+    assert a == registration
+
+    # Templates are dropped once no longer used
+    key = freeze(registration)
+    assert key in alias_module._registration_templates
+    del a, b
+    gc.collect()
+    assert key not in alias_module._registration_templates
+
+
 @pytest.mark.asyncio
 async def test_init(mock_alias_server, mock_ls):
     a = Alias(mock_alias_server, "foo/target", "foo/alias")
@@ -72,6 +109,16 @@ async def test_json(mock_alias_server, mock_ls):
         "description": "A test alias.",
     }
 
+    a = Alias(mock_alias_server, "foo/target", "foo/alias",
+              execution="thread", array=True)
+    assert a.json["execution"] == "thread"
+    assert a.json["array"] is True
+    assert "filter" not in a.json
+
+    a = Alias(mock_alias_server, "foo/target", "foo/alias",
+              filter="value > 1")
+    assert a.json["filter"] == "value > 1"
+
 
 @pytest.mark.asyncio
 async def test_eval_transform(mock_alias_server):
@@ -93,6 +140,290 @@ async def test_eval_transform(mock_alias_server):
     assert mock_alias_server._error_sync.call_count == 1
 
 
+@pytest.mark.asyncio
+async def test_eval_transform_memoised(mock_alias_server):
+    a = Alias(mock_alias_server, "foo/target", "foo/alias")
+
+    assert a._eval_transform("value / 63.0", 63) == 1.0
+    assert a._eval_transform("value / 63.0", 63) == 1.0
+    memo = a._transforms["value / 63.0"].memo
+    assert memo.hits == 1
+    assert memo.misses == 1
+
+    # Errors are not memoised
+    assert a._eval_transform("value / 63.0", "bad") == "bad"
+    assert a._eval_transform("value / 63.0", "bad") == "bad"
+    assert mock_alias_server._error_sync.call_count == 2
+
+    # The memo's counts are surfaced in the alias' statistics
+    a._update_memo_stats()
+    assert a._stats.json["memo_hits"] == 1
+    assert a._stats.json["memo_misses"] == 3
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("execution,executor", [
+    ("inline", None),
+    ("thread", ThreadPoolExecutor),
+    ("process", ProcessPoolExecutor),
+])
+async def test_eval_transform_async(mock_alias_server, execution, executor):
+    if executor is not None:
+        executor = executor(max_workers=1)
+    mock_alias_server._get_executor = Mock(return_value=executor)
+
+    a = Alias(mock_alias_server, "foo/target", "foo/alias",
+              "value / 63.0", "int(value * 63)", execution=execution)
+
+    try:
+        assert await a._transform_async(63) == 1.0
+        assert await a._inverse_async(1.0) == 63
+        assert await a._transform_async(qth.Empty) is qth.Empty
+        assert mock_alias_server._error_sync.call_count == 0
+
+        # Errors pass through the value
+        assert await a._transform_async("bad") == "bad"
+        assert mock_alias_server._error_sync.call_count == 1
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    if execution != "inline":
+        mock_alias_server._get_executor.assert_called_with(execution)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("execution,executor", [
+    ("inline", None),
+    ("thread", ThreadPoolExecutor),
+    ("process", ProcessPoolExecutor),
+])
+async def test_eval_transform_async_cpu_time(mock_alias_server, execution,
+                                             executor):
+    if executor is not None:
+        executor = executor(max_workers=1)
+    mock_alias_server._get_executor = Mock(return_value=executor)
+    mock_alias_server._profile = Profile()
+
+    # A transform which takes a while but uses little CPU time
+    a = Alias(mock_alias_server, "foo/target", "foo/alias",
+              "time.sleep(0.1) or value", "value", execution=execution)
+
+    async def busy():
+        # Uses CPU time on the event loop while the transform runs (when
+        # not inline)
+        end = time.monotonic() + 0.1
+        while time.monotonic() < end:
+            await asyncio.sleep(0)
+
+    try:
+        task = asyncio.create_task(busy())
+        assert await a._transform_async(1) == 1
+        await task
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    # Only the transform's own CPU time is attributed to the alias
+    calls, callback_time, cpu_time = \
+        mock_alias_server._profile._aliases["foo/alias"]
+    assert 0.0 <= cpu_time < 0.05
+
+
+@pytest.mark.asyncio
+async def test_transform_budget_quarantine(mock_alias_server, mock_client):
+    # NB: Abandoned evaluations continue to occupy a worker
+    executor = ThreadPoolExecutor(max_workers=4)
+    mock_alias_server._get_executor = Mock(return_value=executor)
+    mock_alias_server._transform_budget = 0.1
+
+    a = Alias(mock_alias_server, "foo/target", "foo/alias",
+              "time.sleep(value) or value", "value", execution="thread")
+
+    try:
+        # Within budget
+        assert await a._transform_async(0) == 0
+        assert mock_alias_server._error_sync.call_count == 0
+
+        # Exceeding budget: value passed through and error reported
+        assert await a._transform_async(0.3) == 0.3
+        assert mock_alias_server._error_sync.call_count == 1
+        assert not a._quarantined
+
+        # A successful evaluation resets the count
+        assert await a._transform_async(0) == 0
+        assert await a._transform_async(0.3) == 0.3
+        assert not a._quarantined
+
+        # Exceeding it again triggers quarantine
+        assert await a._transform_async(0.3) == 0.3
+        assert a._quarantined
+        assert "quarantined" in \
+            mock_alias_server._error_sync.mock_calls[-1][1][0]
+
+        # Quarantined aliases don't forward values
+        await a._on_target_set("foo/target", 0)
+        await a._on_target_sent("foo/target", 0)
+        assert mock_client.set_property.call_count == 0
+        assert mock_client.send_event.call_count == 0
+    finally:
+        executor.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_filter(mock_alias_server, mock_client):
+    a = Alias(mock_alias_server, "foo/target", "foo/alias",
+              "value['key']", "{'key': value}",
+              filter="value['duration'] > 1")
+
+    assert a._filter({"key": "a", "duration": 2}) is True
+    assert a._filter({"key": "a", "duration": 0}) is False
+    assert a._filter(qth.Empty) is True
+    assert mock_alias_server._error_sync.call_count == 0
+
+    # Errors drop the value
+    assert a._filter("bad") is False
+    assert mock_alias_server._error_sync.call_count == 1
+
+    # Only matching events are forwarded
+    await a._on_target_sent("foo/target", {"key": "a", "duration": 0})
+    assert mock_client.send_event.call_count == 0
+    await a._on_target_sent("foo/target", {"key": "b", "duration": 5})
+    mock_client.send_event.assert_called_once_with("foo/alias", "b")
+    await a._on_alias_sent("foo/alias", "b")  # (The echo)
+
+    # Likewise properties
+    await a._on_target_set("foo/target", {"key": "a", "duration": 0})
+    assert mock_client.set_property.call_count == 0
+    await a._on_target_set("foo/target", {"key": "c", "duration": 5})
+    mock_client.set_property.assert_called_once_with("foo/alias", "c")
+    await a._on_alias_set("foo/alias", "c")  # (The echo)
+
+    # Values sent to the alias are not filtered
+    await a._on_alias_sent("foo/alias", "d")
+    mock_client.send_event.assert_called_with(
+        "foo/target", {"key": "d"})
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("is_property", [True, False])
+async def test_window(mock_alias_server, mock_client, is_property):
+    a = Alias(mock_alias_server, "foo/target", "foo/alias",
+              "value * 2", "value / 2",
+              window={"period": 0.1})
+    assert a.json["window"] == {"period": 0.1}
+    await a.async_init()
+
+    try:
+        behaviour = "PROPERTY-1:N" if is_property else "EVENT-1:N"
+        await a._on_target_registration_changed("foo/target", [{
+            "behaviour": behaviour,
+            "description": "A power meter.",
+            "on_unregister": 0,
+        }])
+
+        # Aggregates don't inherit on_unregister values
+        assert "on_unregister" not in a._alias_registration
+
+        callback = a._on_target_set if is_property else a._on_target_sent
+        publish = (mock_client.set_property if is_property
+                   else mock_client.send_event)
+
+        # Values are aggregated, not forwarded
+        for value in [1, 2, 3]:
+            await callback("foo/target", value)
+        assert publish.call_count == 0
+
+        # Non-numeric values are reported
+        await callback("foo/target", "bad")
+        assert mock_alias_server._error_sync.call_count == 1
+
+        # Writes to the alias are ignored
+        await a._on_alias_set("foo/alias", 10)
+        await a._on_alias_sent("foo/alias", 10)
+        assert publish.call_count == 0
+
+        # Aggregate published at the end of the period
+        await asyncio.sleep(0.15)
+        publish.assert_called_once_with("foo/alias", {
+            "mean": 4.0, "min": 2.0, "max": 6.0, "count": 3,
+        })
+
+        # Nothing published for an empty window
+        await asyncio.sleep(0.1)
+        assert publish.call_count == 1
+    finally:
+        await a.delete()
+
+    assert a._window_task.cancelled() or a._window_task.done()
+
+
+@pytest.mark.asyncio
+async def test_batch(mock_alias_server, mock_client):
+    a = Alias(mock_alias_server, "foo/target", "foo/alias",
+              "value * 2", "value // 2",
+              batch={"size": 3, "interval": 0.1})
+    assert a.json["batch"] == {"size": 3, "interval": 0.1}
+    await a.async_init()
+    await a._on_target_registration_changed("foo/target", [{
+        "behaviour": "EVENT-1:N",
+        "description": "RFID reads.",
+    }])
+
+    # Batches sent when full
+    for value in [1, 2, 3, 4]:
+        await a._on_target_sent("foo/target", value)
+    mock_client.send_event.assert_called_once_with("foo/alias", [2, 4, 6])
+
+    # The echo of the batch is ignored
+    await a._on_alias_sent("foo/alias", [2, 4, 6])
+    assert mock_client.send_event.call_count == 1
+
+    # ...or when the interval expires
+    await asyncio.sleep(0.15)
+    assert mock_client.send_event.call_count == 2
+    mock_client.send_event.assert_called_with("foo/alias", [8])
+    await a._on_alias_sent("foo/alias", [8])  # (The echo)
+
+    # Batches sent to the alias are unpacked into individual events
+    await a._on_alias_sent("foo/alias", [10, 12])
+    assert mock_client.send_event.call_count == 4
+    mock_client.send_event.assert_any_call("foo/target", 5)
+    mock_client.send_event.assert_any_call("foo/target", 6)
+
+    # Non-list events are sent unchanged
+    await a._on_alias_sent("foo/alias", 14)
+    mock_client.send_event.assert_called_with("foo/target", 7)
+
+    # Echoes of unpacked events are ignored
+    for value in [5, 6, 7]:
+        await a._on_target_sent("foo/target", value)
+    assert a._batch == []
+
+    # Partial batches are sent on deletion
+    await a._on_target_sent("foo/target", 8)
+    await a.delete()
+    mock_client.send_event.assert_called_with("foo/alias", [16])
+
+
+@pytest.mark.asyncio
+async def test_batch_property(mock_alias_server, mock_client):
+    # Property aliases cannot batch: reported and forwarded as usual
+    a = Alias(mock_alias_server, "foo/target", "foo/alias",
+              batch={"size": 2})
+    await a._on_target_registration_changed("foo/target", [{
+        "behaviour": qth.PROPERTY_ONE_TO_MANY,
+        "description": "Target"}])
+    mock_alias_server._error_sync.assert_called_once_with(
+        "batch: foo/target is a property so alias foo/alias cannot batch "
+        "values.",
+        alias="foo/alias", kind="batch")
+    assert a._stats.errors == 1
+
+    await a._on_target_set("foo/target", 1)
+    mock_client.set_property.assert_called_once_with("foo/alias", 1)
+
+
 @pytest.mark.asyncio
 async def test_transform_inverse(mock_alias_server):
     a = Alias(mock_alias_server, "foo/target", "foo/alias",
@@ -153,7 +484,6 @@ async def test_on_target_registration_changed(mock_alias_server, mock_client):
     }
     assert a._alias_registration == {
         "behaviour": "EVENT-1:N",
-        "description": "Alias description.",
         "on_unregister": 1.0,
     }
 
@@ -186,7 +516,6 @@ async def test_on_target_registration_changed(mock_alias_server, mock_client):
     }
     assert a._alias_registration == {
         "behaviour": "EVENT-1:N",
-        "description": "Alias description.",
         "on_unregister": 1.0,
     }
 
@@ -215,7 +544,6 @@ async def test_on_target_registration_changed(mock_alias_server, mock_client):
     }
     assert a._alias_registration == {
         "behaviour": "EVENT-N:1",
-        "description": "Alias description.",
         "on_unregister": 0.0,
     }
 
@@ -247,7 +575,6 @@ async def test_on_target_registration_changed(mock_alias_server, mock_client):
     }
     assert a._alias_registration == {
         "behaviour": "PROPERTY-N:1",
-        "description": "Alias description.",
         "delete_on_unregister": True,
     }
 
@@ -283,7 +610,6 @@ async def test_on_target_registration_changed(mock_alias_server, mock_client):
     }
     assert a._alias_registration == {
         "behaviour": "EVENT-N:1",
-        "description": "Alias description.",
     }
 
     assert mock_client.watch_property.call_count == 2
@@ -461,3 +787,253 @@ async def test_delete(mock_alias_server, mock_client,
             "foo/alias")
     else:
         assert mock_client.delete_property.call_count == 0
+
+
+@pytest.mark.asyncio
+async def test_passive(mock_alias_server, mock_client, mock_ls):
+    mock_alias_server._active = False
+    a = Alias(mock_alias_server, "foo/target", "foo/alias",
+              "value * 2", "value // 2")
+    await a.async_init()
+
+    # Transforms compiled up-front
+    assert set(a._transforms) == set(["value * 2", "value // 2"])
+
+    # Registration tracked but nothing registered or watched
+    await a._on_target_registration_changed("foo/target", [{
+        "behaviour": qth.PROPERTY_ONE_TO_MANY,
+        "description": "Target"}])
+    assert a._target_registration is not None
+    assert not mock_client.register.called
+    assert not mock_client.watch_property.called
+
+    # Activating brings the alias up
+    await a.activate()
+    mock_client.register.assert_called_once_with(
+        "foo/alias", behaviour=qth.PROPERTY_ONE_TO_MANY,
+        description="")
+    assert mock_client.watch_property.call_count == 2
+
+    # Deactivating takes it down again without touching the alias' value
+    # (which another server now maintains)
+    await a.deactivate()
+    mock_client.unregister.assert_called_once_with("foo/alias")
+    assert mock_client.unwatch_property.call_count == 2
+    assert not mock_client.delete_property.called
+    assert not mock_client.set_property.called
+
+    # ...and it may be activated once more
+    await a.activate()
+    assert mock_client.register.call_count == 2
+    assert mock_client.watch_property.call_count == 4
+
+
+@pytest.mark.asyncio
+async def test_stats(mock_alias_server, mock_client):
+    a = Alias(mock_alias_server, "foo/target", "foo/alias",
+              "value * 2", "value // 2", filter="value.bad")
+
+    # The filter fails for every value
+    await a._on_target_set("foo/target", 1)
+    a._filter_code = None
+
+    # Forwarded in each direction (with the echoes suppressed)
+    await a._on_target_set("foo/target", 1)
+    await a._on_alias_set("foo/alias", 2)
+    await a._on_alias_set("foo/alias", 10)
+    await a._on_target_set("foo/target", 5)
+
+    assert a._stats.to_alias == 1
+    assert a._stats.to_target == 1
+    assert a._stats.echoes_suppressed == 2
+    assert a._stats.errors == 1
+    assert a._stats.transform_time.count == 2
+
+    # Registration latency recorded on the server
+    await a._on_target_registration_changed("foo/target", [{
+        "behaviour": qth.PROPERTY_ONE_TO_MANY,
+        "description": "Target"}])
+    assert mock_alias_server._stats.registration_latency.count == 1
+
+
+@pytest.mark.asyncio
+async def test_trace(mock_alias_server, mock_client):
+    sink = RingBufferSink()
+    mock_alias_server._tracer = Tracer([sink])
+    a = Alias(mock_alias_server, "foo/target", "foo/alias",
+              "value * 2", "value // 2")
+
+    # (Each followed by its echo, which is not traced)
+    await a._on_target_set("foo/target", 1)
+    await a._on_alias_set("foo/alias", 2)
+    await a._on_alias_set("foo/alias", 10)
+    await a._on_target_set("foo/target", 5)
+    await a._on_target_sent("foo/target", 2)
+    await a._on_alias_sent("foo/alias", 4)
+    await a._on_alias_sent("foo/alias", 20)
+    await a._on_target_sent("foo/target", 10)
+
+    assert [span.direction for span in sink.spans] == [
+        "to_alias", "to_target", "to_alias", "to_target"]
+    for span in sink.spans:
+        assert span.alias == "foo/alias"
+        assert 0.0 <= span.transformed <= span.published
+
+
+@pytest.mark.asyncio
+async def test_compact(mock_alias_server, mock_client):
+    a = Alias(mock_alias_server, "foo/" + "target", "foo/alias")
+    b = Alias(mock_alias_server, "bar/target", "bar/alias")
+
+    # No per-instance dictionary and interned paths
+    assert not hasattr(a, "__dict__")
+    assert a._target is sys.intern("foo/target")
+
+    # Locks and transforms created on demand
+    assert a._lock is None
+    assert a._transforms is None
+
+    # Identical registrations shared
+    for alias in [a, b]:
+        await alias._on_target_registration_changed("foo/target", [{
+            "behaviour": qth.PROPERTY_ONE_TO_MANY,
+            "description": "Target"}])
+    assert a._lock is not None
+    assert a._alias_registration is b._alias_registration
+
+
+@pytest.mark.asyncio
+async def test_lazy(mock_alias_server, mock_client):
+    a = Alias(mock_alias_server, "foo/target", "foo/alias", lazy=True)
+    assert a.json["lazy"] is True
+    await a._on_target_registration_changed("foo/target", [{
+        "behaviour": qth.EVENT_ONE_TO_MANY,
+        "description": "Target"}])
+
+    # The alias is registered and watched but the target is not
+    mock_client.register.assert_called_once_with(
+        "foo/alias", behaviour=qth.EVENT_ONE_TO_MANY, description="")
+    mock_client.watch_event.assert_called_once_with("foo/alias",
+                                                    a._on_alias_sent)
+
+    # Demand starts watching the target...
+    await a.demand(0.05)
+    mock_client.watch_event.assert_called_with("foo/target",
+                                               a._on_target_sent)
+    assert mock_client.watch_event.call_count == 2
+
+    # ...and repeated demand extends it
+    await asyncio.sleep(0.03)
+    await a.demand(0.05)
+    await asyncio.sleep(0.03)
+    assert not mock_client.unwatch_event.called
+
+    # Once idle, the target is no longer watched
+    await asyncio.sleep(0.05)
+    mock_client.unwatch_event.assert_called_once_with("foo/target",
+                                                      a._on_target_sent)
+    assert a._demand_task is None
+
+
+@pytest.mark.asyncio
+async def test_lazy_property(mock_alias_server, mock_client):
+    # Property aliases cannot be lazy: reported and watched as usual
+    a = Alias(mock_alias_server, "foo/target", "foo/alias", lazy=True)
+    await a._on_target_registration_changed("foo/target", [{
+        "behaviour": qth.PROPERTY_ONE_TO_MANY,
+        "description": "Target"}])
+    mock_alias_server._error_sync.assert_called_once_with(
+        "lazy: foo/target is a property so alias foo/alias cannot be lazy.",
+        alias="foo/alias", kind="lazy")
+    assert mock_client.watch_property.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_not_lazy(mock_alias_server, mock_client):
+    # Demand is ignored by eager aliases
+    a = Alias(mock_alias_server, "foo/target", "foo/alias")
+    await a._on_target_registration_changed("foo/target", [{
+        "behaviour": qth.EVENT_ONE_TO_MANY,
+        "description": "Target"}])
+    assert mock_client.watch_event.call_count == 2
+    await a.demand(0.01)
+    assert a._demand_task is None
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("echo_suppression", ["counter", "value"])
+async def test_echo_suppression(mock_alias_server, mock_client,
+                                echo_suppression):
+    mock_alias_server._echo_suppression = echo_suppression
+    a = Alias(mock_alias_server, "foo/target", "foo/alias",
+              "value * 2", "value // 2")
+
+    # Echoes of our own writes are ignored
+    await a._on_target_set("foo/target", 1)
+    mock_client.set_property.assert_called_once_with("foo/alias", 2)
+    await a._on_alias_set("foo/alias", 2)
+    assert mock_client.set_property.call_count == 1
+    assert a._stats.echoes_suppressed == 1
+
+    # The inverse need not round-trip exactly
+    await a._on_alias_set("foo/alias", 3)
+    mock_client.set_property.assert_called_with("foo/target", 1)
+    await a._on_target_set("foo/target", 1)
+    assert mock_client.set_property.call_count == 2
+    assert a._stats.echoes_suppressed == 2
+
+    # Another client writes the target before our write's echo arrives.
+    # Counting echoes forwards the last value the target received, keeping
+    # the alias consistent with the target. Comparing values forwards the
+    # other client's (overwritten) value instead.
+    await a._on_alias_set("foo/alias", 10)
+    mock_client.set_property.assert_called_with("foo/target", 5)
+    await a._on_target_set("foo/target", 7)
+    await a._on_target_set("foo/target", 5)
+    if echo_suppression == "counter":
+        mock_client.set_property.assert_called_with("foo/alias", 10)
+    else:
+        mock_client.set_property.assert_called_with("foo/alias", 14)
+
+
+@pytest.mark.asyncio
+async def test_echo_suppression_rewatch(mock_alias_server, mock_client):
+    a = Alias(mock_alias_server, "foo/target", "foo/alias", lazy=True)
+    await a._on_target_registration_changed("foo/target", [{
+        "behaviour": qth.EVENT_ONE_TO_MANY,
+        "description": "Target"}])
+
+    # Events sent to the (unwatched) target are never echoed...
+    await a._on_alias_sent("foo/alias", 1)
+    mock_client.send_event.assert_called_once_with("foo/target", 1)
+    assert a._target_echoes == 1
+
+    # ...so are not expected once it is watched
+    await a.demand(0.01)
+    assert a._target_echoes == 0
+    await a._on_target_sent("foo/target", 2)
+    mock_client.send_event.assert_called_with("foo/alias", 2)
+    await asyncio.sleep(0.02)
+
+
+@pytest.mark.asyncio
+async def test_settle_window(mock_alias_server, mock_client):
+    mock_alias_server._settle_window = 0.05
+    mock_alias_server._reconciler = Reconciler(0.05)
+    a = Alias(mock_alias_server, "foo/target", "foo/alias")
+
+    # A flapping registration...
+    for registration in [
+            [{"behaviour": qth.PROPERTY_ONE_TO_MANY, "description": "A"}],
+            None,
+            [{"behaviour": qth.EVENT_ONE_TO_MANY, "description": "B"}]]:
+        await a._on_target_registration_changed("foo/target", registration)
+    assert not mock_client.register.called
+
+    # ...is applied once it settles
+    await mock_alias_server._reconciler.flush()
+    mock_client.register.assert_called_once_with(
+        "foo/alias", behaviour=qth.EVENT_ONE_TO_MANY, description="")
+    assert not mock_client.unregister.called
+    assert not mock_client.watch_property.called
+    assert mock_client.watch_event.call_count == 2
@@ -1,14 +1,22 @@
 import pytest
 import pytest_asyncio
+import asyncio
 import json
+import os
+import tracemalloc
 
+import mock
 from mock import Mock
 from util import AsyncMock
 
 import qth
+from qth_ls import Ls
 
 import qth_alias
 from qth_alias import has_cycle, AliasServer
+from qth_alias.computed import ComputedAlias
+from qth_alias.shard import shard_of, RemoteAlias
+from qth_alias.testing import FakeBroker, FakeClient
 
 
 @pytest_asyncio.fixture()
@@ -41,6 +49,17 @@ def test_has_cycle():
                                                ["b", "a", "b"])
     assert has_cycle({"a": "b", "b": "b"}) in (["a", "b", "b"], ["b", "b"])
 
+    # Multiple targets
+    assert has_cycle({"a": ["b", "c"], "b": "c", "c": "d"}) is None
+    assert has_cycle({"a": ["b", "c"], "b": "d", "c": ["d", "e"]}) is None
+    assert has_cycle({"a": ["b", "c"], "c": ["d", "a"]}) in (
+        ["a", "c", "a"], ["c", "a", "c"])
+    assert has_cycle({"a": ["b", "c"], "b": "x", "c": "c"}) in (
+        ["a", "c", "c"], ["c", "c"])
+
+    # Shared dependencies don't make a cycle
+    assert has_cycle({"a": ["b", "b"], "b": []}) is None
+
 
 @pytest.mark.asyncio
 async def test_async_init(mock_client):
@@ -54,12 +73,26 @@ async def test_async_init(mock_client):
         "meta/alias/remove": "EVENT-N:1",
         "meta/alias/aliases": "PROPERTY-1:N",
         "meta/alias/error": "EVENT-1:N",
+        "meta/alias/errors": "PROPERTY-1:N",
+        "meta/alias/profile": "EVENT-N:1",
+        "meta/alias/profile_response": "EVENT-1:N",
+        "meta/alias/memory": "EVENT-N:1",
+        "meta/alias/memory_response": "EVENT-1:N",
+        "meta/alias/snapshot": "EVENT-N:1",
+        "meta/alias/snapshot_response": "EVENT-1:N",
+        "meta/alias/activate": "EVENT-N:1",
     }
 
     # Check watches
-    assert mock_client.watch_event.call_count == 2
+    assert mock_client.watch_event.call_count == 6
     mock_client.watch_event.assert_any_call("meta/alias/add", s._on_add)
     mock_client.watch_event.assert_any_call("meta/alias/remove", s._on_remove)
+    mock_client.watch_event.assert_any_call("meta/alias/profile",
+                                            s._on_profile)
+    mock_client.watch_event.assert_any_call("meta/alias/memory",
+                                            s._on_memory)
+    mock_client.watch_event.assert_any_call("meta/alias/snapshot",
+                                            s._on_snapshot)
     mock_client.watch_property.assert_called_once_with(
         "meta/alias/aliases", s._on_change)
 
@@ -80,6 +113,41 @@ async def test_async_init(mock_client):
     {"alias": "bar"},
     # Unexpected value in long form
     {"target": "foo", "alias": "bar", "what?": "nope"},
+    # Invalid execution policy
+    {"target": "foo", "alias": "bar", "execution": "nope"},
+    # Invalid array flag
+    {"target": "foo", "alias": "bar", "array": "yes"},
+    # Invalid filter
+    {"target": "foo", "alias": "bar", "filter": 123},
+    # Invalid computed aliases
+    {"target": [], "alias": "bar", "transform": "sum(value)"},
+    {"target": ["a", 1], "alias": "bar", "transform": "sum(value)"},
+    {"target": ["a", "b"], "alias": "bar"},
+    {"target": ["a", "b"], "alias": "bar", "transform": "sum(value)",
+     "inverse": "value"},
+    {"target": ["a", "b"], "alias": "bar", "transform": "sum(value)",
+     "filter": "True"},
+    {"target": ["a", "b"], "alias": "bar", "transform": "sum(value)",
+     "coalesce": -1},
+    {"target": "foo", "alias": "bar", "coalesce": 1},
+    # Invalid batches
+    {"target": "foo", "alias": "bar", "batch": {}},
+    {"target": "foo", "alias": "bar", "batch": {"size": 0}},
+    {"target": "foo", "alias": "bar", "batch": {"interval": "1"}},
+    {"target": "foo", "alias": "bar", "batch": {"size": 1, "what": 2}},
+    {"target": "foo", "alias": "bar", "batch": {"size": 2},
+     "window": {"period": 1}},
+    # Invalid lazy flags
+    {"target": "foo", "alias": "bar", "lazy": 1},
+    {"target": ["a", "b"], "alias": "bar", "transform": "sum(value)",
+     "lazy": True},
+    # Invalid windows
+    {"target": "foo", "alias": "bar", "window": 1.0},
+    {"target": "foo", "alias": "bar", "window": {"period": 0}},
+    {"target": "foo", "alias": "bar", "window": {"period": 1, "what": 1}},
+    {"target": "foo", "alias": "bar", "window": {"period": 1, "mode": "?"}},
+    {"target": "foo", "alias": "bar",
+     "window": {"period": 1, "mode": "sliding"}},
 ])
 async def test_on_add_invalid_forms(mock_client, arg):
     s = AliasServer()
@@ -128,6 +196,82 @@ async def test_on_add_invalid_forms(mock_client, arg):
         "inverse": "int(value * 63)",
         "description": "A custom alias.",
     }),
+    # Longform: Execution policy
+    ({
+        "target": "foo/target",
+        "alias": "foo/alias",
+        "execution": "process",
+    }, {
+        "target": "foo/target",
+        "alias": "foo/alias",
+        "transform": None,
+        "inverse": None,
+        "description": "Alias of foo/target.",
+        "execution": "process",
+    }),
+    # Longform: Filter
+    ({
+        "target": "foo/target",
+        "alias": "foo/alias",
+        "filter": "value > 1",
+    }, {
+        "target": "foo/target",
+        "alias": "foo/alias",
+        "transform": None,
+        "inverse": None,
+        "description": "Alias of foo/target.",
+        "filter": "value > 1",
+    }),
+    # Longform: Computed alias
+    ({
+        "target": ["foo/a", "foo/b"],
+        "alias": "foo/alias",
+        "transform": "sum(value)",
+        "coalesce": 0.1,
+    }, {
+        "target": ["foo/a", "foo/b"],
+        "alias": "foo/alias",
+        "transform": "sum(value)",
+        "inverse": None,
+        "description": "Computed from foo/a, foo/b.",
+        "coalesce": 0.1,
+    }),
+    # Longform: Lazy (omitted when false)
+    ({
+        "target": "foo/target",
+        "alias": "foo/alias",
+        "lazy": True,
+    }, {
+        "target": "foo/target",
+        "alias": "foo/alias",
+        "transform": None,
+        "inverse": None,
+        "description": "Alias of foo/target.",
+        "lazy": True,
+    }),
+    ({
+        "target": "foo/target",
+        "alias": "foo/alias",
+        "lazy": False,
+    }, {
+        "target": "foo/target",
+        "alias": "foo/alias",
+        "transform": None,
+        "inverse": None,
+        "description": "Alias of foo/target.",
+    }),
+    # Longform: Default execution policy is omitted
+    ({
+        "target": "foo/target",
+        "alias": "foo/alias",
+        "execution": "inline",
+    }, {
+        "target": "foo/target",
+        "alias": "foo/alias",
+        "transform": None,
+        "inverse": None,
+        "description": "Alias of foo/target.",
+    }),
 ])
 async def test_on_add_long_form(mock_client, value, expected):
     s = AliasServer()
@@ -328,6 +472,20 @@ async def test_update_aliases(mock_client, monkeypatch):
     })
 
 
+@pytest.mark.asyncio
+async def test_computed_alias(mock_client):
+    s = AliasServer()
+    await s.async_init()
+
+    await s._on_add("meta/alias/add", {
+        "target": ["foo/a", "foo/b"],
+        "alias": "foo/total",
+        "transform": "sum(value)",
+    })
+    assert isinstance(s._aliases["foo/total"], ComputedAlias)
+    assert s._aliases_json["foo/total"]["target"] == ["foo/a", "foo/b"]
+
+
 @pytest.mark.asyncio
 async def test_on_remove(mock_client):
     s = AliasServer()
@@ -350,6 +508,25 @@ async def test_on_change(mock_client):
     assert s._aliases == {}
 
 
+@pytest.mark.asyncio
+async def test_on_add_bulk(mock_client):
+    s = AliasServer()
+    await s.async_init()
+
+    # Several aliases added at once; invalid ones reported and skipped
+    await s._on_add("meta/alias/add", [
+        ["foo/target", "foo/alias"],
+        {"target": "bar/target", "alias": "bar/alias"},
+        {"target": "baz/target"},
+    ])
+    assert set(s._aliases) == set(["foo/alias", "bar/alias"])
+    mock_client.send_event.assert_called_once_with("meta/alias/error",
+                                                   mock.ANY)
+
+    # Applied as a single update
+    assert mock_client.set_property.call_count == 2
+
+
 @pytest.mark.asyncio
 async def test_file_cache_dev_null(mock_client):
     s = AliasServer(cache_file="/dev/null")
@@ -387,9 +564,18 @@ async def test_file_cache(mock_client, tmpdir):
         }
     }
 
-    # Upon adding a new entry this should be saved
+    # Upon adding a new entry this should be saved (one alias per line)
     await s._on_add("meta/alias/add", ["bar/target", "bar/alias"])
-    assert json.loads(cache_file.read()) == {
+    await s._cache.flush()
+    lines = cache_file.read().splitlines()
+    assert len(lines) == 2
+
+    # ...and may be loaded again
+    s2 = AliasServer(cache_file=str(cache_file))
+    await s2.async_init()
+    assert set(mock_client.set_property.mock_calls[-1][1][1]) == set([
+        "foo/alias", "bar/alias"])
+    assert {spec["alias"]: spec for spec in map(json.loads, lines)} == {
         "foo/alias": {
             "target": "foo/target",
             "alias": "foo/alias",
@@ -407,6 +593,151 @@ async def test_file_cache(mock_client, tmpdir):
     }
 
 
+@pytest.mark.asyncio
+async def test_shared_client(mock_client, tmpdir):
+    a = AliasServer(cache_file=str(tmpdir.join("a.json")), prefix="a/")
+    b = AliasServer(cache_file=str(tmpdir.join("b.json")), prefix="b/",
+                    client=a._client, ls=a._ls)
+    assert qth.Client.call_count == 1
+    assert b._client is a._client
+    assert b._ls is a._ls
+
+    await a.async_init()
+    await b.async_init()
+
+    # Each prefix has its own control paths
+    registered = set(call[1][0] for call in mock_client.register.mock_calls)
+    assert registered == set([
+        "a/add", "a/remove", "a/aliases", "a/error", "a/errors",
+        "a/profile", "a/profile_response", "a/memory", "a/memory_response",
+        "a/snapshot", "a/snapshot_response", "a/activate",
+        "b/add", "b/remove", "b/aliases", "b/error", "b/errors",
+        "b/profile", "b/profile_response", "b/memory", "b/memory_response",
+        "b/snapshot", "b/snapshot_response", "b/activate",
+    ])
+
+    # ...and its own set of aliases and cache file
+    await a._on_add("a/add", ["foo/target", "foo/alias"])
+    await b._on_add("b/add", ["bar/target", "bar/alias"])
+    await a._cache.flush()
+    await b._cache.flush()
+    assert set(a._aliases) == set(["foo/alias"])
+    assert set(b._aliases) == set(["bar/alias"])
+    assert [json.loads(line)["alias"]
+            for line in tmpdir.join("a.json").readlines()] == ["foo/alias"]
+    assert [json.loads(line)["alias"]
+            for line in tmpdir.join("b.json").readlines()] == ["bar/alias"]
+
+    # ...and its own errors
+    await b._on_add("b/add", "nope")
+    mock_client.send_event.assert_called_once_with("b/error", mock.ANY)
+
+    await a.close()
+    await b.close()
+
+
+@pytest.mark.asyncio
+async def test_sharded_supervisor(mock_client):
+    s = AliasServer(shards=2)
+    await s.async_init()
+
+    # Shard properties registered
+    registered = set(call[1][0] for call in mock_client.register.mock_calls)
+    assert "meta/alias/shards/0" in registered
+    assert "meta/alias/shards/1" in registered
+
+    # Aliases are not served locally but published to their shard
+    specs = {}
+    for i in range(10):
+        path = "foo/alias{}".format(i)
+        await s._on_add("meta/alias/add", ["foo/target{}".format(i), path])
+        specs[path] = s._aliases_json[path]
+        assert isinstance(s._aliases[path], RemoteAlias)
+
+    shards = {}
+    for call in mock_client.set_property.mock_calls:
+        if call[1][0].startswith("meta/alias/shards/"):
+            shards[call[1][0]] = call[1][1]
+    assert set(shards) == set(["meta/alias/shards/0", "meta/alias/shards/1"])
+    for shard in range(2):
+        for path in shards["meta/alias/shards/{}".format(shard)]:
+            assert shard_of(path, 2) == shard
+    assert dict(list(shards["meta/alias/shards/0"].items()) +
+                list(shards["meta/alias/shards/1"].items())) == specs
+
+    # Cycles are still checked globally
+    await s._on_add("meta/alias/add", ["foo/alias0", "foo/target0"])
+    assert "foo/target0" not in s._aliases
+    mock_client.send_event.assert_called_once_with("meta/alias/error",
+                                                   mock.ANY)
+
+    await s.close()
+    mock_client.unregister.assert_any_call("meta/alias/shards/0")
+    mock_client.delete_property.assert_any_call("meta/alias/shards/1")
+
+
+@pytest.mark.asyncio
+async def test_sharded_worker(mock_client):
+    s = AliasServer(shard=1)
+    await s.async_init()
+
+    # Workers have no control plane, just their own errors property
+    mock_client.register.assert_called_once_with(
+        "meta/alias/errors/shard/1", "PROPERTY-1:N", mock.ANY,
+        delete_on_unregister=True)
+    mock_client.watch_property.assert_called_once_with(
+        "meta/alias/shards/1", s._on_shard_change)
+
+    # Aliases published for the worker are served
+    await s._on_shard_change("meta/alias/shards/1", {
+        "foo/alias": {
+            "target": "foo/target",
+            "alias": "foo/alias",
+            "transform": None,
+            "inverse": None,
+            "description": "A test alias.",
+        },
+    })
+    assert set(s._aliases) == set(["foo/alias"])
+    assert not isinstance(s._aliases["foo/alias"], RemoteAlias)
+    assert mock_client.set_property.call_count == 0
+
+    # Errors of the worker's aliases are published separately from those of
+    # other workers
+    await s._error("Oops", alias="foo/alias", kind="transform")
+    mock_client.set_property.assert_called_once_with(
+        "meta/alias/errors/shard/1", {"foo/alias": {"transform": mock.ANY}})
+
+    await s._on_shard_change("meta/alias/shards/1", qth.Empty)
+    assert s._aliases == {}
+
+    await s.close()
+    mock_client.unwatch_property.assert_called_with(
+        "meta/alias/shards/1", s._on_shard_change)
+    mock_client.unregister.assert_called_once_with(
+        "meta/alias/errors/shard/1")
+    mock_client.delete_property.assert_called_with(
+        "meta/alias/errors/shard/1")
+
+
+def test_errors_path(mock_client):
+    # Workers and cluster members each publish their own aliases' errors
+    assert AliasServer()._errors_path == "meta/alias/errors"
+    assert AliasServer(shard=0, shards=2)._errors_path == \
+        "meta/alias/errors/shard/0"
+    assert AliasServer(node_id="a")._errors_path == \
+        "meta/alias/errors/node/a"
+
+
+def test_stats_path(mock_client):
+    # Workers and cluster members each publish their own aliases' statistics
+    assert AliasServer()._stats_path == "meta/alias/stats"
+    assert AliasServer(shard=0, shards=2)._stats_path == \
+        "meta/alias/stats/shard/0"
+    assert AliasServer(node_id="a")._stats_path == \
+        "meta/alias/stats/node/a"
+
+
 @pytest.mark.asyncio
 async def test_close(mock_client):
     s = AliasServer()
@@ -429,3 +760,603 @@ async def test_close(mock_client):
     mock_client.delete_property.assert_any_call("meta/alias/aliases")
 
     mock_client.delete_property.assert_any_call("foo/alias")
+
+
+async def wait_for(condition, timeout=1.0):
+    """Wait until condition() holds."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not condition():
+        assert loop.time() < deadline
+        await asyncio.sleep(0.005)
+
+
+@pytest.mark.asyncio
+async def test_standby():
+    broker = FakeBroker()
+
+    device = FakeClient(broker, "device")
+    await device.register("foo/target", qth.PROPERTY_ONE_TO_MANY,
+                          "A target.")
+
+    def make_server(client_id):
+        client = FakeClient(broker, client_id)
+        return AliasServer(client=client, ls=Ls(client), standby=True,
+                           lease_interval=0.02, lease_timeout=0.1)
+
+    # With nobody holding the lease, the first server takes over once the
+    # lease timeout expires
+    a = make_server("a")
+    await a.async_init()
+    await broker.settle()
+    assert not a._active
+    assert "meta/alias/add" not in a._client._registration
+    await asyncio.sleep(0.2)
+    await broker.settle()
+    assert a._active
+    assert "meta/alias/add" in a._client._registration
+    assert broker.get_retained("meta/alias/lease")["holder"] == \
+        a._lease_holder
+
+    await a._client.send_event("meta/alias/add", {
+        "target": "foo/target", "alias": "foo/alias",
+        "transform": "value * 2", "inverse": "value // 2"})
+    await broker.settle()
+    assert "foo/alias" in a._client._registration
+
+    # A second server stays passive but prepares its aliases
+    b = make_server("b")
+    await b.async_init()
+    await asyncio.sleep(0.2)
+    await broker.settle()
+    assert not b._active
+    assert not b._client._registration
+    alias = b._aliases["foo/alias"]
+    assert alias._target_registration is not None
+    assert set(alias._transforms) == set(["value * 2", "value // 2"])
+
+    # Only the active server forwards values
+    await b._client.set_property("foo/target", 1)
+    await broker.settle()
+    assert broker.get_retained("foo/alias") == 2
+
+    # Standby takes over as soon as the active server shuts down (well
+    # within the lease timeout, after claiming the lease for one interval)
+    await a.close()
+    await broker.settle()
+    await asyncio.sleep(0.05)
+    await broker.settle()
+    assert b._active
+    assert "foo/alias" in b._client._registration
+    assert set(broker.get_retained("meta/alias/aliases")) == \
+        set(["foo/alias"])
+    await b._client.set_property("foo/target", 2)
+    await broker.settle()
+    assert broker.get_retained("foo/alias") == 4
+
+    await b.close()
+    assert broker.get_retained("meta/alias/lease") is None
+
+
+@pytest.mark.asyncio
+async def test_standby_contest():
+    broker = FakeBroker()
+
+    def make_server(client_id):
+        client = FakeClient(broker, client_id)
+        server = AliasServer(client=client, ls=Ls(client), standby=True,
+                             lease_interval=0.02, lease_timeout=0.1)
+        server._lease_holder = client_id
+        return server
+
+    # Two standbys starting together both claim the lease but only one
+    # takes over (normally the one with the lower holder name, unless the
+    # other's claim arrived too late to contest)
+    b = make_server("b")
+    a = make_server("a")
+    await asyncio.wait([asyncio.create_task(b.async_init()),
+                        asyncio.create_task(a.async_init())])
+
+    def serving(server):
+        return "meta/alias/add" in server._client._registration
+
+    await wait_for(lambda: serving(a) or serving(b))
+    active, passive = (a, b) if serving(a) else (b, a)
+
+    # The other keeps standing by while the lease is refreshed
+    await asyncio.sleep(0.2)
+    await broker.settle()
+    assert active._active
+    assert not passive._active
+    assert serving(active)
+    assert not passive._client._registration
+    assert broker.get_retained("meta/alias/lease")["holder"] == \
+        active._lease_holder
+
+    # ...and takes over when the active server goes away
+    await active.close()
+    await wait_for(lambda: passive._active)
+    await broker.settle()
+    assert broker.get_retained("meta/alias/lease")["holder"] == \
+        passive._lease_holder
+
+    await passive.close()
+
+
+@pytest.mark.asyncio
+async def test_standby_step_down():
+    broker = FakeBroker()
+
+    device = FakeClient(broker, "device")
+    await device.register("foo/target", qth.PROPERTY_ONE_TO_MANY,
+                          "A target.", delete_on_unregister=True)
+
+    def make_server(client_id):
+        client = FakeClient(broker, client_id)
+        server = AliasServer(client=client, ls=Ls(client), standby=True,
+                             lease_interval=0.02, lease_timeout=0.1)
+        server._lease_holder = client_id
+        return server
+
+    b = make_server("b")
+    await b.async_init()
+    await wait_for(lambda: b._active)
+    await b._client.send_event("meta/alias/add", {
+        "target": "foo/target", "alias": "foo/alias",
+        "transform": "value * 2", "inverse": "value // 2"})
+    await broker.settle()
+    await device.set_property("foo/target", 1)
+    await broker.settle()
+    assert broker.get_retained("foo/alias") == 2
+
+    a = make_server("a")
+    await a.async_init()
+    await asyncio.sleep(0.2)
+    await broker.settle()
+    assert not a._active
+
+    # The active server stalls for longer than the lease timeout so the
+    # standby takes over...
+    b._lease_task.cancel()
+    await wait_for(lambda: a._active)
+    await asyncio.sleep(0.05)
+    await broker.settle()
+    assert "foo/alias" in a._client._registration
+
+    # ...and when it resumes, the server with the higher holder name steps
+    # down without disturbing the aliases
+    b._lease_task = asyncio.create_task(b._refresh_lease())
+    await wait_for(lambda: not b._active)
+    await broker.settle()
+    assert a._active
+    assert not b._client._registration
+    assert not b._aliases["foo/alias"]._watching_property
+    assert broker.get_retained("foo/alias") == 2
+    assert broker.get_retained("meta/alias/lease")["holder"] == "a"
+
+    await device.set_property("foo/target", 2)
+    await broker.settle()
+    assert broker.get_retained("foo/alias") == 4
+
+    # It stands by (and takes over again) as usual
+    await asyncio.sleep(0.2)
+    await broker.settle()
+    assert not b._active
+    await a.close()
+    await wait_for(lambda: b._active)
+    await asyncio.sleep(0.05)
+    await broker.settle()
+    assert "foo/alias" in b._client._registration
+    await device.set_property("foo/target", 3)
+    await broker.settle()
+    assert broker.get_retained("foo/alias") == 6
+
+    await b.close()
+
+
+@pytest.mark.asyncio
+async def test_standby_claim_lost_to_refresh():
+    broker = FakeBroker()
+
+    def make_server(client_id, lease_interval):
+        client = FakeClient(broker, client_id)
+        server = AliasServer(client=client, ls=Ls(client), standby=True,
+                             lease_interval=lease_interval, lease_timeout=0.1)
+        server._lease_holder = client_id
+        return server
+
+    b = make_server("b", 0.02)
+    await b.async_init()
+    await wait_for(lambda: b._active)
+    a = make_server("a", 0.2)
+    await a.async_init()
+    await broker.settle()
+
+    # The active server stalls just long enough for the standby to claim
+    # the lease, then resumes refreshing it: the claim (despite its lower
+    # holder name) loses
+    b._lease_task.cancel()
+    await wait_for(lambda: broker.get_retained(
+        "meta/alias/lease")["holder"] == "a")
+    b._lease_task = asyncio.create_task(b._refresh_lease())
+    await asyncio.sleep(0.3)
+    await broker.settle()
+    assert b._active
+    assert not a._active
+    assert not a._client._registration
+
+    await b.close()
+    await a.close()
+
+
+@pytest.mark.asyncio
+async def test_standby_released_quickly():
+    broker = FakeBroker()
+
+    def make_server(client_id):
+        client = FakeClient(broker, client_id)
+        server = AliasServer(client=client, ls=Ls(client), standby=True,
+                             lease_interval=1.0, lease_timeout=0.1)
+        server._lease_holder = client_id
+        return server
+
+    a = make_server("a")
+    await a.async_init()
+    await wait_for(lambda: a._active, timeout=2.0)
+    b = make_server("b")
+    await b.async_init()
+    await broker.settle()
+
+    # A released lease is taken over well within a lease interval
+    loop = asyncio.get_running_loop()
+    await a.close()
+    start = loop.time()
+    await wait_for(lambda: b._active)
+    assert loop.time() - start < 0.5
+
+    await b.close()
+
+
+@pytest.mark.asyncio
+async def test_stats(monkeypatch):
+    monkeypatch.setattr(qth_alias, "LOOP_LAG_INTERVAL", 0.01)
+    broker = FakeBroker()
+    client = FakeClient(broker)
+    s = AliasServer(client=client, ls=Mock(watch_path=AsyncMock()),
+                    stats_interval=0.05, stats_per_alias=True)
+    await s.async_init()
+    await client.set_property("meta/alias/aliases", {
+        "foo/alias": {"target": "foo/target", "alias": "foo/alias",
+                      "transform": None, "inverse": None,
+                      "description": "A test..."},
+    })
+    await broker.settle()
+    await s._aliases["foo/alias"]._on_target_set("foo/target", 1)
+
+    await asyncio.sleep(0.1)
+    await broker.settle()
+
+    stats = broker.get_retained("meta/alias/stats")
+    assert stats["aliases"] == 1
+    assert stats["to_alias"] == 1
+    assert stats["loop_lag"]["count"] > 0
+    assert stats["pending_tasks"] > 0
+    assert "meta/alias/stats" in client._registration
+
+    alias_stats = broker.get_retained("meta/alias/stats/foo/alias")
+    assert alias_stats["to_alias"] == 1
+    assert "meta/alias/stats/foo/alias" in client._registration
+
+    await s.close()
+    assert broker.get_retained("meta/alias/stats") is None
+    assert broker.get_retained("meta/alias/stats/foo/alias") is None
+    assert not client._registration
+
+
+@pytest.mark.asyncio
+async def test_stats_worker(monkeypatch):
+    monkeypatch.setattr(qth_alias, "LOOP_LAG_INTERVAL", 0.01)
+    broker = FakeBroker()
+    client = FakeClient(broker)
+    s = AliasServer(client=client, ls=Mock(watch_path=AsyncMock()),
+                    shard=1, shards=2, stats_interval=0.05)
+    await s.async_init()
+    await client.set_property("meta/alias/shards/1", {
+        "foo/alias": {"target": "foo/target", "alias": "foo/alias",
+                      "transform": None, "inverse": None,
+                      "description": "A test..."},
+    })
+    await broker.settle()
+    await s._aliases["foo/alias"]._on_target_set("foo/target", 1)
+
+    await asyncio.sleep(0.1)
+    await broker.settle()
+
+    # Workers publish the statistics of their own aliases
+    stats = broker.get_retained("meta/alias/stats/shard/1")
+    assert stats["aliases"] == 1
+    assert stats["to_alias"] == 1
+    assert "meta/alias/stats/shard/1" in client._registration
+    assert broker.get_retained("meta/alias/stats") is None
+
+    await s.close()
+    assert broker.get_retained("meta/alias/stats/shard/1") is None
+    assert not client._registration
+
+
+@pytest.mark.asyncio
+async def test_profile(tmpdir):
+    broker = FakeBroker()
+    client = FakeClient(broker)
+    s = AliasServer(client=client, ls=Mock(watch_path=AsyncMock()),
+                    profile_dir=str(tmpdir))
+    await s.async_init()
+    await client.set_property("meta/alias/aliases", {
+        "foo/alias": {"target": "foo/target", "alias": "foo/alias",
+                      "transform": "value * 2", "inverse": "value // 2",
+                      "description": "A test..."},
+    })
+    await broker.settle()
+
+    responses = []
+    broker.subscribe("meta/alias/profile_response",
+                     lambda t, v: responses.append(v))
+    errors = []
+    broker.subscribe("meta/alias/error", lambda t, v: errors.append(v))
+
+    # Invalid durations
+    await client.send_event("meta/alias/profile", "forever")
+    await broker.settle()
+    assert len(errors) == 1
+
+    await client.send_event("meta/alias/profile", 0.05)
+    await broker.settle()
+    assert s._profile is not None
+
+    # Only one profile at a time
+    await client.send_event("meta/alias/profile", 0.05)
+    await broker.settle()
+    assert len(errors) == 2
+
+    await s._aliases["foo/alias"]._on_target_set("foo/target", 1)
+    await asyncio.sleep(0.1)
+    await broker.settle()
+
+    assert s._profile is None
+    assert len(responses) == 1
+    report = responses[0]
+    assert report["top_callback_time"][0]["alias"] == "foo/alias"
+    assert report["top_callback_time"][0]["calls"] == 1
+    assert report["file"].startswith(str(tmpdir))
+    assert os.path.isfile(report["file"])
+
+    await s.close()
+
+
+@pytest.mark.asyncio
+async def test_memory():
+    broker = FakeBroker()
+    client = FakeClient(broker)
+    s = AliasServer(client=client, ls=Mock(watch_path=AsyncMock()))
+    await s.async_init()
+    await broker.settle()
+
+    responses = []
+    broker.subscribe("meta/alias/memory_response",
+                     lambda t, v: responses.append(v))
+
+    try:
+        await client.send_event("meta/alias/memory", None)
+        await broker.settle()
+        assert responses.pop() == {"tracing": False, "aliases": 0}
+
+        await client.send_event("meta/alias/memory", "start")
+        await broker.settle()
+        response = responses.pop()
+        assert response["tracing"]
+        assert response["total"] >= 0
+        assert isinstance(response["components"], list)
+
+        await client.send_event("meta/alias/memory", "stop")
+        await broker.settle()
+        assert responses.pop()["tracing"] is False
+    finally:
+        tracemalloc.stop()
+
+    await s.close()
+
+
+@pytest.mark.asyncio
+async def test_forwarding_with_latency():
+    broker = FakeBroker(latency=0.005, jitter=0.01, seed=1)
+    device = FakeClient(broker, "device")
+    await device.register("foo/target", qth.PROPERTY_ONE_TO_MANY,
+                          "A target.")
+
+    client = FakeClient(broker)
+    s = AliasServer(client=client, ls=Ls(client))
+    await s.async_init()
+    await broker.settle()
+
+    # A chain of aliases (NB: Ls only resolves a newly watched path when a
+    # listing it depends on next arrives so each lives in its own directory)
+    await client.send_event("meta/alias/add", {
+        "target": "foo/target", "alias": "bar/alias",
+        "transform": "value * 2", "inverse": "value // 2"})
+    await broker.settle()
+    await client.send_event("meta/alias/add", {
+        "target": "bar/alias", "alias": "baz/alias",
+        "transform": "value + 1", "inverse": "value - 1"})
+    await broker.settle()
+    assert "baz/alias" in client._registration
+
+    # Values propagate down the chain...
+    await device.set_property("foo/target", 10)
+    await broker.settle()
+    assert broker.get_retained("bar/alias") == 20
+    assert broker.get_retained("baz/alias") == 21
+
+    # ...and back up it without feeding back
+    published = broker.published
+    await device.set_property("baz/alias", 41)
+    await broker.settle()
+    assert broker.get_retained("bar/alias") == 40
+    assert broker.get_retained("foo/target") == 20
+    assert broker.published - published == 3
+
+    await s.close()
+
+
+@pytest.mark.asyncio
+async def test_snapshot():
+    broker = FakeBroker()
+    device = FakeClient(broker, "device")
+    for path in ["foo/a", "foo/b", "bar/c", "foo/event"]:
+        await device.register(
+            path + "/target",
+            qth.EVENT_ONE_TO_MANY if path == "foo/event"
+            else qth.PROPERTY_ONE_TO_MANY,
+            "A target.")
+
+    client = FakeClient(broker)
+    s = AliasServer(client=client, ls=Ls(client))
+    await s.async_init()
+    await broker.settle()
+    await s._update_aliases({
+        path: {"target": path + "/target", "alias": path,
+               "transform": "value * 2", "inverse": "value // 2"}
+        for path in ["foo/a", "foo/b", "bar/c", "foo/event"]})
+    await broker.settle()
+
+    await device.set_property("foo/a/target", 1)
+    await device.set_property("bar/c/target", 3)
+    await device.send_event("foo/event/target", 4)
+    await broker.settle()
+
+    # Values written to the alias are also known
+    await device.set_property("foo/b", 20)
+    await broker.settle()
+
+    responses = []
+    await device.watch_event("meta/alias/snapshot_response",
+                             lambda _t, v: responses.append(v))
+    errors = []
+    await device.watch_event("meta/alias/error",
+                             lambda _t, v: errors.append(v))
+
+    # By list (unknown aliases and those without a value are omitted)
+    await device.send_event("meta/alias/snapshot", {
+        "id": 1, "aliases": ["foo/a", "foo/b", "foo/event", "nope"]})
+    await broker.settle()
+    assert responses.pop() == {"id": 1, "values": {"foo/a": 2, "foo/b": 20},
+                               "part": 0, "parts": 1}
+
+    # By prefix
+    await device.send_event("meta/alias/snapshot", {"id": 2,
+                                                    "prefix": "foo/"})
+    await broker.settle()
+    assert responses.pop()["values"] == {"foo/a": 2, "foo/b": 20}
+    await device.send_event("meta/alias/snapshot", {"prefix": ""})
+    await broker.settle()
+    response = responses.pop()
+    assert response["id"] is None
+    assert response["values"] == {"foo/a": 2, "foo/b": 20, "bar/c": 6}
+
+    # Deleted values are forgotten
+    await device.delete_property("foo/a/target")
+    await broker.settle()
+    await device.send_event("meta/alias/snapshot", {"id": 3,
+                                                    "prefix": "foo/"})
+    await broker.settle()
+    assert responses.pop()["values"] == {"foo/b": 20}
+
+    # Invalid requests
+    for request in [None, "foo/", {"id": 4},
+                    {"aliases": ["foo/a"], "prefix": "foo/"},
+                    {"aliases": "foo/a"}, {"aliases": [1]}, {"prefix": 1},
+                    {"prefix": "foo/", "what": 1}]:
+        await device.send_event("meta/alias/snapshot", request)
+    await broker.settle()
+    assert not responses
+    assert len(errors) == 8
+
+    await s.close()
+
+
+@pytest.mark.asyncio
+async def test_snapshot_worker():
+    broker = FakeBroker()
+    device = FakeClient(broker, "device")
+    await device.register("foo/target", qth.PROPERTY_ONE_TO_MANY, "Target.")
+    await device.set_property("foo/target", 1)
+
+    # Workers each reply with their share of the values
+    client = FakeClient(broker, "worker")
+    s = AliasServer(client=client, ls=Ls(client), shard=1, shards=3)
+    await s.async_init()
+    await broker.settle()
+    await device.set_property("meta/alias/shards/1", {
+        "foo/alias": {"target": "foo/target", "alias": "foo/alias"}})
+    await broker.settle()
+
+    responses = []
+    await device.watch_event("meta/alias/snapshot_response",
+                             lambda _t, v: responses.append(v))
+    await device.send_event("meta/alias/snapshot", {"id": 1, "prefix": ""})
+    await broker.settle()
+    assert responses == [{"id": 1, "values": {"foo/alias": 1},
+                          "part": 1, "parts": 3}]
+
+    await s.close()
+
+
+@pytest.mark.asyncio
+async def test_lazy_activate():
+    broker = FakeBroker()
+    device = FakeClient(broker, "device")
+    await device.register("foo/target", qth.EVENT_ONE_TO_MANY, "A target.")
+
+    client = FakeClient(broker)
+    s = AliasServer(client=client, ls=Ls(client), lazy_timeout=0.1)
+    await s.async_init()
+    await broker.settle()
+    await s._update_aliases({"foo/alias": {"target": "foo/target",
+                                           "alias": "foo/alias",
+                                           "lazy": True}})
+    await broker.settle()
+
+    received = []
+    await device.watch_event("foo/alias", lambda _t, v: received.append(v))
+    errors = []
+    await device.watch_event("meta/alias/error",
+                             lambda _t, v: errors.append(v))
+
+    # Not forwarded until activated
+    await device.send_event("foo/target", 1)
+    await broker.settle()
+    assert received == []
+
+    await device.send_event("meta/alias/activate", "foo/alias")
+    await broker.settle()
+    await device.send_event("foo/target", 2)
+    await broker.settle()
+    assert received == [2]
+
+    # A list of paths may be activated (unknown paths ignored)
+    await device.send_event("meta/alias/activate", ["foo/alias", "nope"])
+    await broker.settle()
+    assert errors == []
+
+    # Idle again after the timeout
+    await asyncio.sleep(0.15)
+    await broker.settle()
+    await device.send_event("foo/target", 3)
+    await broker.settle()
+    assert received == [2]
+
+    # Invalid requests are reported
+    await device.send_event("meta/alias/activate", [1])
+    await broker.settle()
+    assert len(errors) == 1
+
+    await s.close()
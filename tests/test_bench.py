@@ -0,0 +1,247 @@
+import pytest
+
+import json
+
+import qth
+
+import qth_alias.bench
+
+from qth_alias.bench import (
+    run_benchmarks, compare, main,
+    measure_forwarding, measure_control, measure_startup, measure_has_cycle,
+    measure_memory, replay)
+from qth_alias.bench.forwarding import KINDS
+from qth_alias.bench.replay import target_behaviours, merge_alias_sets
+from qth_alias.record import Recorder
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("kind", KINDS)
+async def test_measure_forwarding(kind):
+    result = await measure_forwarding(kind, 10)
+    assert result["benchmark"] == "forwarding"
+    assert result["kind"] == kind
+    assert result["received"] == 10
+    assert result["throughput"] > 0
+    assert result["latency"]["count"] == 10
+    assert 0 < result["latency"]["p50"] <= result["latency"]["max"]
+
+
+@pytest.mark.asyncio
+async def test_measure_control():
+    result = await measure_control(20, samples=5)
+    assert result["benchmark"] == "control"
+    assert result["aliases"] == 20
+    assert result["registered"] == 20
+    assert result["bulk"] > 0
+    assert result["bulk_per_alias"] == result["bulk"] / 20
+    assert result["add"]["count"] == 5
+    assert result["remove"]["count"] == 5
+
+
+@pytest.mark.asyncio
+async def test_measure_startup():
+    result = await measure_startup(20)
+    assert result["benchmark"] == "startup"
+    assert result["registered"] == 20
+    assert result["startup"] > 0
+    assert result["shutdown"] > 0
+
+
+def test_measure_has_cycle():
+    result = measure_has_cycle(100, repeat=1)
+    assert result["benchmark"] == "has_cycle"
+    assert result["aliases"] == 100
+    assert set(result) == set(["benchmark", "aliases", "independent",
+                               "chain", "computed"])
+
+
+@pytest.mark.asyncio
+async def test_measure_memory():
+    result = await measure_memory(20)
+    assert result["benchmark"] == "memory"
+    assert result["aliases"] == 20
+    assert result["bytes"] > 0
+    assert result["bytes_per_alias"] == result["bytes"] / 20
+
+
+@pytest.mark.asyncio
+async def test_run_benchmarks():
+    results = await run_benchmarks(["has_cycle", "memory"], [10, 20])
+    assert [(r["benchmark"], r["aliases"]) for r in results] == [
+        ("has_cycle", 10), ("has_cycle", 20), ("memory", 10), ("memory", 20)]
+
+
+def write_capture(filename):
+    """Write a capture of a property and an event alias."""
+    recorder = Recorder(filename)
+    recorder.record_aliases({
+        "foo/alias": {"target": "foo/target", "alias": "foo/alias",
+                      "transform": "value * 2", "inverse": "value // 2"},
+        "bar/alias": {"target": "bar/target", "alias": "bar/alias"},
+    })
+    for i in range(10):
+        recorder.record_message("foo/alias", "to_alias", "foo/target",
+                                "property", i)
+        recorder.record_message("bar/alias", "to_target", "bar/alias",
+                                "event", i)
+    recorder.record_message("foo/alias", "to_target", "foo/alias",
+                            "property", 100)
+    recorder.close()
+
+
+def test_target_behaviours():
+    assert target_behaviours([
+        {
+            "a": {"target": "x", "alias": "a"},
+            "b": {"target": "a", "alias": "b"},
+            "c": {"target": ["x", "y"], "alias": "c"},
+        },
+        {
+            "d": {"target": "z", "alias": "d"},
+        },
+    ], set(["d"])) == {
+        "x": qth.PROPERTY_ONE_TO_MANY,
+        "y": qth.PROPERTY_ONE_TO_MANY,
+        "z": qth.EVENT_ONE_TO_MANY,
+    }
+
+
+@pytest.mark.asyncio
+async def test_replay(tmpdir):
+    filename = str(tmpdir.join("capture.jsonl"))
+    write_capture(filename)
+
+    result = await replay(filename, speed=100.0)
+    assert result["benchmark"] == "replay"
+    assert result["capture"] == "capture.jsonl"
+    assert result["messages"] == 21
+    assert result["forwarded"] == 21
+    assert result["latency"]["count"] == 21
+    assert result["processing"]["count"] == 21
+    assert result["schedule_lag"]["count"] == 21
+    assert result["latency"]["p50"] >= result["processing"]["p50"] >= 0
+
+
+def test_merge_alias_sets():
+    a = {"a": {"target": "x", "alias": "a"}}
+    b = {"b": {"target": "y", "alias": "b"}}
+    message = {"type": "message"}
+    assert list(merge_alias_sets([
+        {"type": "aliases", "source": "one/", "aliases": a},
+        message,
+        {"type": "aliases", "source": "two/", "aliases": b},
+        # Unchanged
+        {"type": "aliases", "source": "one/", "aliases": a},
+        message,
+        {"type": "aliases", "source": "one/", "aliases": {}},
+    ])) == [
+        (0, a),
+        (2, dict(a, **b)),
+        (5, b),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_replay_sources(tmpdir):
+    # Servers with different prefixes sharing a capture file each record
+    # their own aliases
+    filename = str(tmpdir.join("capture.jsonl"))
+    for source, name in [("one/", "foo"), ("two/", "bar")]:
+        recorder = Recorder(filename, source=source)
+        recorder.record_aliases({
+            "{}/alias".format(name): {
+                "target": "{}/target".format(name),
+                "alias": "{}/alias".format(name)},
+        })
+        recorder.close()
+    recorder = Recorder(filename)
+    for i in range(2):
+        recorder.record_message("foo/alias", "to_alias", "foo/target",
+                                "property", i)
+        recorder.record_message("bar/alias", "to_alias", "bar/target",
+                                "property", i)
+    recorder.close()
+
+    result = await replay(filename, speed=100.0)
+    assert result["messages"] == 4
+    assert result["forwarded"] == 4
+
+
+@pytest.mark.asyncio
+async def test_replay_no_aliases(tmpdir):
+    filename = str(tmpdir.join("capture.jsonl"))
+    Recorder(filename).close()
+    with pytest.raises(ValueError):
+        await replay(filename)
+
+
+def test_compare():
+    old = [
+        {"benchmark": "forwarding", "kind": "plain", "throughput": 100.0,
+         "latency": {"p50": 2.0, "max": 0.0}},
+        {"benchmark": "memory", "aliases": 10, "bytes": 100},
+        {"benchmark": "memory", "aliases": 20, "bytes": 200},
+    ]
+    new = [
+        {"benchmark": "forwarding", "kind": "plain", "throughput": 50.0,
+         "latency": {"p50": 3.0, "max": 1.0}},
+        {"benchmark": "memory", "aliases": 10, "bytes": 150},
+        {"benchmark": "memory", "aliases": 30, "bytes": 300},
+    ]
+    assert compare(new, old) == {
+        "forwarding/plain": {"throughput": 0.5, "latency.p50": 1.5},
+        "memory/10": {"aliases": 1.0, "bytes": 1.5},
+    }
+
+
+def test_main(tmpdir):
+    baseline = str(tmpdir.join("baseline.json"))
+    output = str(tmpdir.join("output.json"))
+    args = ["--benchmark", "has_cycle", "--sizes", "10,20"]
+
+    main(args + ["--output", baseline])
+    main(args + ["--output", output, "--compare", baseline])
+
+    with open(output) as f:
+        result = json.load(f)
+    assert [r["aliases"] for r in result["results"]] == [10, 20]
+    assert set(result["comparison"]) == set(["has_cycle/10", "has_cycle/20"])
+
+
+@pytest.mark.parametrize("args,sizes", [
+    (["--sizes", "10"], [10]),
+    (["--sizes", "10", "--large"], [10, 20, 30]),
+    (["--sizes", "10,30", "--large"], [10, 30, 20]),
+])
+def test_main_large(tmpdir, monkeypatch, args, sizes):
+    # The large sizes are only run when asked for
+    monkeypatch.setattr(qth_alias.bench, "LARGE_SIZES", (20, 30))
+    output = str(tmpdir.join("output.json"))
+
+    main(["--benchmark", "has_cycle", "--output", output] + args)
+
+    with open(output) as f:
+        result = json.load(f)
+    assert [r["aliases"] for r in result["results"]] == sizes
+
+
+def test_main_replay(tmpdir):
+    capture = str(tmpdir.join("capture.jsonl"))
+    output = str(tmpdir.join("output.json"))
+    write_capture(capture)
+
+    main(["--output", output, "replay", capture, "--speed", "100"])
+
+    with open(output) as f:
+        result = json.load(f)
+    assert [r["benchmark"] for r in result["results"]] == ["replay"]
+
+
+@pytest.mark.parametrize("args", [
+    ["--sizes", "ten"],
+    ["replay", "capture.jsonl", "--speed", "0"],
+])
+def test_main_invalid(args):
+    with pytest.raises(SystemExit):
+        main(args)
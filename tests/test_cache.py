@@ -0,0 +1,76 @@
+import pytest
+
+import os
+import json
+import asyncio
+
+from qth_alias.cache import read_cache, write_cache, CacheFile
+from qth_alias.stats import ServerStats
+
+
+def test_write_cache(tmpdir):
+    filename = str(tmpdir.join("cache.json"))
+    write_cache(filename, [{"target": "a", "alias": "b"}])
+    assert read_cache(filename) == {"b": {"target": "a", "alias": "b"}}
+
+    # Permissions are kept when the file is replaced
+    os.chmod(filename, 0o640)
+    write_cache(filename, [])
+    assert read_cache(filename) == {}
+    assert os.stat(filename).st_mode & 0o777 == 0o640
+
+    # No temporary files left behind
+    assert os.listdir(str(tmpdir)) == ["cache.json"]
+
+
+def test_write_cache_failure(tmpdir):
+    filename = str(tmpdir.join("cache.json"))
+    write_cache(filename, [{"target": "a", "alias": "b"}])
+
+    # The original file survives a failed write
+    with pytest.raises(TypeError):
+        write_cache(filename, [{"target": "a", "alias": object()}])
+    assert read_cache(filename) == {"b": {"target": "a", "alias": "b"}}
+    assert os.listdir(str(tmpdir)) == ["cache.json"]
+
+
+def test_write_cache_symlink(tmpdir):
+    filename = str(tmpdir.join("cache.json"))
+    link = str(tmpdir.join("link.json"))
+    write_cache(filename, [])
+    os.symlink(filename, link)
+
+    # The link's target is replaced, not the link
+    write_cache(link, [{"target": "a", "alias": "b"}])
+    assert os.path.islink(link)
+    assert set(read_cache(filename)) == set(["b"])
+
+
+def test_write_cache_dev_null():
+    # Not replaced (with a regular file)
+    write_cache("/dev/null", [{"target": "a", "alias": "b"}])
+    assert not os.path.isfile("/dev/null")
+
+
+@pytest.mark.asyncio
+async def test_cache_file(tmpdir):
+    filename = str(tmpdir.join("cache.json"))
+    stats = ServerStats()
+    cache = CacheFile(filename, stats)
+
+    # Missing files are empty
+    assert await cache.load() == {}
+
+    # Saves made while a write is in progress are coalesced
+    cache.save({"b": {"target": "a0", "alias": "b"}})
+    await asyncio.sleep(0)
+    for i in range(1, 5):
+        cache.save({"b": {"target": "a{}".format(i), "alias": "b"}})
+    await cache.flush()
+    assert stats.cache_write_latency.count == 2
+    with open(filename) as f:
+        assert json.loads(f.read())["target"] == "a4"
+    assert await cache.load() == {"b": {"target": "a4", "alias": "b"}}
+
+    # Nothing to flush
+    await cache.flush()
@@ -0,0 +1,125 @@
+import pytest
+import asyncio
+
+from qth_ls import Ls
+
+from qth_alias import AliasServer
+from qth_alias.cluster import HashRing
+from qth_alias.shard import RemoteAlias
+from qth_alias.testing import FakeBroker, FakeClient
+
+
+def test_hash_ring():
+    paths = ["foo/{}".format(i) for i in range(1000)]
+
+    assert HashRing().owner("foo") is None
+
+    ring = HashRing(["a", "b", "c"])
+    owners = {path: ring.owner(path) for path in paths}
+
+    # Reasonably balanced
+    for node in "abc":
+        assert 200 < list(owners.values()).count(node) < 470
+
+    # Removing a node only moves that node's paths
+    ring.remove("c")
+    for path in paths:
+        if owners[path] != "c":
+            assert ring.owner(path) == owners[path]
+        else:
+            assert ring.owner(path) in ("a", "b")
+
+    # Adding a node only takes paths for that node
+    ring.add("c")
+    ring.add("d")
+    for path in paths:
+        assert ring.owner(path) in (owners[path], "d")
+
+
+def local_aliases(server):
+    return set(path for path, alias in server._aliases.items()
+               if not isinstance(alias, RemoteAlias))
+
+
+@pytest.mark.asyncio
+async def test_cluster():
+    broker = FakeBroker()
+
+    def make_server(node_id):
+        client = FakeClient(broker, node_id)
+        return AliasServer(client=client, ls=Ls(client), node_id=node_id,
+                           heartbeat_interval=0.02, node_timeout=0.1)
+
+    servers = {node_id: make_server(node_id) for node_id in "abc"}
+    for server in servers.values():
+        await server.async_init()
+    await asyncio.sleep(0.05)
+    await broker.settle()
+
+    assert all(s._cluster.members == ["a", "b", "c"]
+               for s in servers.values())
+    assert servers["a"]._cluster.is_leader
+    assert not servers["b"]._cluster.is_leader
+
+    # Add aliases via Qth: only the leader handles the request but all
+    # members follow the aliases property
+    client = FakeClient(broker)
+    paths = ["alias/{}".format(i) for i in range(30)]
+    for i, path in enumerate(paths):
+        await client.send_event("meta/alias/add",
+                                ["target/{}".format(i), path])
+        await broker.settle()
+    for server in servers.values():
+        assert set(server._aliases) == set(paths)
+
+    # Each alias is served by exactly one member
+    owners = {}
+    for node_id, server in servers.items():
+        for path in local_aliases(server):
+            assert path not in owners
+            owners[path] = node_id
+    assert set(owners) == set(paths)
+    assert set(owners.values()) == set("abc")
+
+    # When a member leaves cleanly, only its aliases move
+    await servers.pop("c").close()
+    await broker.settle()
+    for node_id, server in servers.items():
+        assert server._cluster.members == ["a", "b"]
+        for path in local_aliases(server):
+            assert owners[path] in (node_id, "c")
+    assert local_aliases(servers["a"]) | local_aliases(servers["b"]) == \
+        set(paths)
+
+    # When a member dies its heartbeat times out and the survivors take over
+    servers["b"]._cluster._task.cancel()
+    await asyncio.sleep(0.2)
+    await broker.settle()
+    assert servers["a"]._cluster.members == ["a"]
+    assert local_aliases(servers["a"]) == set(paths)
+
+    await servers["a"].close()
+
+
+@pytest.mark.asyncio
+async def test_cluster_initial_aliases(tmpdir):
+    broker = FakeBroker()
+    cache_file = tmpdir.join("cache.json")
+    cache_file.write('{"foo/alias": {"target": "foo/target", '
+                     '"alias": "foo/alias", "transform": null, '
+                     '"inverse": null, "description": "A test..."}}')
+
+    client = FakeClient(broker)
+    s = AliasServer(cache_file=str(cache_file), client=client,
+                    ls=Ls(client), node_id="a",
+                    heartbeat_interval=0.02, node_timeout=0.1)
+    await s.async_init()
+
+    # Cached aliases published by the leader when nothing else has
+    await asyncio.sleep(0.05)
+    await broker.settle()
+    assert set(broker.get_retained("meta/alias/aliases")) == \
+        set(["foo/alias"])
+    assert set(local_aliases(s)) == set(["foo/alias"])
+
+    await s.close()
@@ -0,0 +1,172 @@
+import pytest
+import asyncio
+
+from mock import Mock
+
+from util import AsyncMock
+
+import qth
+
+from qth_alias.computed import ComputedAlias
+from qth_alias.stats import ServerStats
+
+
+@pytest.fixture()
+def mock_client():
+    mock_client = Mock()
+
+    mock_client.register = AsyncMock()
+    mock_client.unregister = AsyncMock()
+
+    mock_client.set_property = AsyncMock()
+    mock_client.watch_property = AsyncMock()
+    mock_client.unwatch_property = AsyncMock()
+    mock_client.delete_property = AsyncMock()
+
+    return mock_client
+
+
+@pytest.fixture()
+def mock_alias_server(mock_client):
+    mock_alias_server = Mock()
+
+    mock_alias_server._client = mock_client
+
+    mock_alias_server._transform_cache_size = 16
+    mock_alias_server._transform_budget = None
+    mock_alias_server._quarantine_after = 2
+    mock_alias_server._stats = ServerStats()
+    mock_alias_server._tracer = None
+    mock_alias_server._profile = None
+    mock_alias_server._recorder = None
+    mock_alias_server._echo_suppression = "counter"
+    mock_alias_server._settle_window = 0
+    mock_alias_server._active = True
+
+    return mock_alias_server
+
+
+@pytest.mark.asyncio
+async def test_init_delete(mock_alias_server, mock_client):
+    a = ComputedAlias(mock_alias_server, ["foo/a", "foo/b"], "foo/total",
+                      "sum(value)", description="Total.")
+    await a.async_init()
+
+    mock_client.register.assert_called_once_with(
+        "foo/total", behaviour="PROPERTY-1:N", description="Total.",
+        delete_on_unregister=True)
+    assert mock_client.watch_property.call_count == 2
+    callbacks = [call[1] for call in mock_client.watch_property.mock_calls]
+    assert [c[0] for c in callbacks] == ["foo/a", "foo/b"]
+
+    assert a.json == {
+        "target": ["foo/a", "foo/b"],
+        "alias": "foo/total",
+        "transform": "sum(value)",
+        "inverse": None,
+        "description": "Total.",
+    }
+
+    await a.delete()
+    mock_client.unregister.assert_called_once_with("foo/total")
+    mock_client.delete_property.assert_called_once_with("foo/total")
+    for path, callback in callbacks:
+        mock_client.unwatch_property.assert_any_call(path, callback)
+
+
+@pytest.mark.asyncio
+async def test_deactivate(mock_alias_server, mock_client):
+    a = ComputedAlias(mock_alias_server, ["foo/a", "foo/b"], "foo/total",
+                      "sum(value)")
+    await a.async_init()
+    callbacks = [call[1] for call in mock_client.watch_property.mock_calls]
+
+    # The alias' value is left for the server which now maintains it
+    await a.deactivate()
+    mock_client.unregister.assert_called_once_with("foo/total")
+    assert not mock_client.delete_property.called
+    for path, callback in callbacks:
+        mock_client.unwatch_property.assert_any_call(path, callback)
+
+    await a.activate()
+    assert mock_client.register.call_count == 2
+    assert mock_client.watch_property.call_count == 4
+
+
+@pytest.mark.asyncio
+async def test_recompute(mock_alias_server, mock_client):
+    a = ComputedAlias(mock_alias_server, ["foo/a", "foo/b"], "foo/max",
+                      "max(value)")
+    await a.async_init()
+    on_a, on_b = (call[1][1] for call in
+                  mock_client.watch_property.mock_calls)
+
+    # Nothing published until all inputs are known
+    await on_a("foo/a", 1)
+    assert mock_client.set_property.call_count == 0
+    await on_b("foo/b", 2)
+    mock_client.set_property.assert_called_once_with("foo/max", 2)
+
+    # Unchanged inputs don't cause recomputation
+    await on_b("foo/b", 2)
+    assert mock_client.set_property.call_count == 1
+
+    # Unchanged results are not republished
+    await on_a("foo/a", 0)
+    assert mock_client.set_property.call_count == 1
+
+    await on_a("foo/a", 10)
+    mock_client.set_property.assert_called_with("foo/max", 10)
+    assert mock_client.set_property.call_count == 2
+
+    # Deleted inputs stop recomputation
+    await on_a("foo/a", qth.Empty)
+    await on_b("foo/b", 20)
+    assert mock_client.set_property.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_recompute_error(mock_alias_server, mock_client):
+    a = ComputedAlias(mock_alias_server, ["foo/a", "foo/b"], "foo/sum",
+                      "sum(value)")
+    await a.async_init()
+    on_a, on_b = (call[1][1] for call in
+                  mock_client.watch_property.mock_calls)
+
+    await on_a("foo/a", 1)
+    await on_b("foo/b", 2)
+    mock_client.set_property.assert_called_once_with("foo/sum", 3)
+
+    # Failures are reported but nothing (e.g. the input list) is published
+    await on_b("foo/b", "two")
+    assert mock_alias_server._error_sync.call_count == 1
+    assert mock_client.set_property.call_count == 1
+    assert a.value == 3
+
+    await on_b("foo/b", 3)
+    mock_client.set_property.assert_called_with("foo/sum", 4)
+
+
+@pytest.mark.asyncio
+async def test_coalesce(mock_alias_server, mock_client):
+    a = ComputedAlias(mock_alias_server, ["foo/a", "foo/b", "foo/c"],
+                      "foo/any", "any(value)", coalesce=0.05)
+    assert a.json["coalesce"] == 0.05
+    await a.async_init()
+    on_a, on_b, on_c = (call[1][1] for call in
+                        mock_client.watch_property.mock_calls)
+
+    # Simultaneous changes produce a single publication
+    await on_a("foo/a", False)
+    await on_b("foo/b", False)
+    await on_c("foo/c", True)
+    assert mock_client.set_property.call_count == 0
+    await asyncio.sleep(0.1)
+    mock_client.set_property.assert_called_once_with("foo/any", True)
+
+    await on_c("foo/c", False)
+    await on_b("foo/b", True)
+    await asyncio.sleep(0.1)
+    assert mock_client.set_property.call_count == 1
+
+    await a.delete()
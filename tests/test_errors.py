@@ -0,0 +1,121 @@
+import pytest
+import asyncio
+
+from qth_alias.errors import ErrorReporter
+from qth_alias.testing import FakeBroker, FakeClient
+
+
+@pytest.fixture
+def broker():
+    return FakeBroker()
+
+
+@pytest.fixture
+def events(broker):
+    events = []
+    broker.subscribe("meta/alias/error", lambda t, v: events.append(v))
+    return events
+
+
+@pytest.mark.asyncio
+async def test_storm_coalesced(broker, events):
+    errors = ErrorReporter(FakeClient(broker), "meta/alias/error",
+                           "meta/alias/errors", window=1000)
+
+    # Only the first of a storm is reported immediately
+    for i in range(100):
+        errors.report_sync("bad {}".format(i), "foo/alias", "transform")
+    await errors.report("also bad", "foo/alias", "filter")
+    await asyncio.sleep(0)
+    await broker.settle()
+    assert events == ["bad 0", "also bad"]
+
+    errors_property = broker.get_retained("meta/alias/errors")
+    assert errors_property["foo/alias"]["transform"]["count"] == 100
+    assert errors_property["foo/alias"]["transform"]["message"] == "bad 99"
+    assert errors_property["foo/alias"]["filter"]["count"] == 1
+
+    # The rest are summarised at the end of the window
+    del events[:]
+    await errors.flush()
+    await broker.settle()
+    assert events == [
+        "foo/alias: transform: 99 further occurrences in the last 1000 s "
+        "(latest: bad 99)"]
+
+    # Errors which continue are summarised again
+    del events[:]
+    errors.report_sync("bad again", "foo/alias", "transform")
+    await errors.flush()
+    await broker.settle()
+    assert len(events) == 1
+    assert "1 further occurrences" in events[0]
+    assert set(broker.get_retained("meta/alias/errors")["foo/alias"]) == \
+        set(["transform"])
+
+    # Errors which stop are forgotten
+    await errors.flush()
+    await broker.settle()
+    assert broker.get_retained("meta/alias/errors") == {}
+
+    # ...and reported immediately if they reoccur
+    del events[:]
+    errors.report_sync("bad", "foo/alias", "transform")
+    await asyncio.sleep(0)
+    await broker.settle()
+    assert events == ["bad"]
+
+    await errors.close()
+
+
+@pytest.mark.asyncio
+async def test_not_coalesced(broker, events):
+    errors = ErrorReporter(FakeClient(broker), "meta/alias/error",
+                           "meta/alias/errors", window=1000)
+
+    # Errors not associated with an alias are always reported
+    for _ in range(3):
+        await errors.report("bad request")
+    await broker.settle()
+    assert events == ["bad request"] * 3
+    assert broker.get_retained("meta/alias/errors") is None
+
+    await errors.close()
+
+
+@pytest.mark.asyncio
+async def test_window(broker, events):
+    errors = ErrorReporter(FakeClient(broker), "meta/alias/error",
+                           "meta/alias/errors", window=0.05)
+    errors.report_sync("bad", "foo/alias", "transform")
+    errors.report_sync("bad", "foo/alias", "transform")
+
+    await asyncio.sleep(0.2)
+    await broker.settle()
+    assert len(events) == 2
+    assert broker.get_retained("meta/alias/errors") == {}
+    assert errors._task is None
+
+
+@pytest.mark.asyncio
+async def test_forget(broker, events):
+    errors = ErrorReporter(FakeClient(broker), "meta/alias/error",
+                           "meta/alias/errors", window=1000)
+    errors.report_sync("bad", "foo/alias", "transform")
+    errors.report_sync("bad", "bar/alias", "transform")
+    errors.forget("foo/alias")
+    assert set(errors.errors) == set(["bar/alias"])
+    await errors.close()
+
+
+@pytest.mark.asyncio
+async def test_bounded(broker, events):
+    errors = ErrorReporter(FakeClient(broker), "meta/alias/error",
+                           "meta/alias/errors", window=1000, max_pending=4)
+    for i in range(10):
+        errors.report_sync("bad", "alias/{}".format(i), "transform")
+    assert len(errors._pending) == 4
+    assert errors.dropped == 16
+
+    await errors.close()
+    assert not errors._pending
@@ -0,0 +1,30 @@
+import os
+import tracemalloc
+
+import qth
+
+import qth_alias
+from qth_alias.memory import component_of, memory_report
+
+
+def test_component_of():
+    assert component_of(qth_alias.alias.__file__) == "qth_alias.alias"
+    assert component_of(qth.__file__) == "qth"
+    assert component_of(os.__file__) == "os"
+    assert component_of("<unknown>") == "<unknown>"
+
+
+def test_memory_report():
+    assert memory_report() is None
+
+    tracemalloc.start()
+    try:
+        data = [object() for _ in range(1000)]  # noqa
+        report = memory_report()
+        assert len(memory_report(top=1)["components"]) == 1
+    finally:
+        tracemalloc.stop()
+
+    assert report["total"] > 0
+    components = [c["component"] for c in report["components"]]
+    assert "test_memory" in components
@@ -0,0 +1,40 @@
+import pstats
+
+from qth_alias.profiler import Profile
+
+
+def busy():
+    return sum(range(10000))
+
+
+def test_profile(tmpdir):
+    profile = Profile()
+    profile.start()
+    busy()
+    profile.add_callback("foo/alias", 0.5)
+    profile.add_callback("foo/alias", 0.5)
+    profile.add_cpu("foo/alias", 0.1)
+    profile.add_callback("bar/alias", 2.0)
+    profile.add_cpu("bar/alias", 0.01)
+    profile.stop()
+
+    report = profile.report()
+    assert report["duration"] > 0.0
+
+    assert [a["alias"] for a in report["top_callback_time"]] == [
+        "bar/alias", "foo/alias"]
+    assert [a["alias"] for a in report["top_cpu_time"]] == [
+        "foo/alias", "bar/alias"]
+    assert report["top_callback_time"][1] == {
+        "alias": "foo/alias",
+        "calls": 2,
+        "callback_time": 1.0,
+        "cpu_time": 0.1,
+    }
+
+    assert any("busy" in f["function"] for f in report["top_functions"])
+    assert len(profile.report(top=1)["top_functions"]) == 1
+
+    filename = str(tmpdir.join("profile.prof"))
+    profile.write(filename)
+    pstats.Stats(filename)
@@ -0,0 +1,83 @@
+import pytest
+
+import asyncio
+
+from mock import Mock
+
+from util import AsyncMock
+
+from qth_alias.reconcile import Reconciler
+
+
+def mock_alias():
+    alias = Mock()
+    alias._reconcile = AsyncMock()
+    return alias
+
+
+@pytest.mark.asyncio
+async def test_settle():
+    r = Reconciler(0.05)
+    a = mock_alias()
+
+    # Repeated changes postpone the reconciliation
+    r.schedule(a)
+    await asyncio.sleep(0.03)
+    r.schedule(a)
+    await asyncio.sleep(0.03)
+    assert a._reconcile.call_count == 0
+
+    # ...which happens just once, when settled
+    await asyncio.sleep(0.03)
+    assert a._reconcile.call_count == 1
+    await r.flush()
+    assert a._reconcile.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_batch():
+    r = Reconciler(0.05)
+    aliases = [mock_alias() for _ in range(3)]
+
+    # Aliases changed together are reconciled together; those changed later
+    # wait for their own window
+    for alias in aliases[:2]:
+        r.schedule(alias)
+    await asyncio.sleep(0.03)
+    r.schedule(aliases[2])
+    await asyncio.sleep(0.035)
+    assert [a._reconcile.call_count for a in aliases] == [1, 1, 0]
+    await r.flush()
+    assert [a._reconcile.call_count for a in aliases] == [1, 1, 1]
+
+
+@pytest.mark.asyncio
+async def test_many():
+    r = Reconciler(0.05)
+    aliases = [mock_alias() for _ in range(1000)]
+
+    # Rescheduled aliases' earlier deadlines are skipped, so each alias is
+    # reconciled once, after its latest deadline
+    for alias in aliases:
+        r.schedule(alias)
+    await asyncio.sleep(0.02)
+    for alias in aliases[::2]:
+        r.schedule(alias)
+    await asyncio.sleep(0.04)
+    assert [a._reconcile.call_count for a in aliases[:4]] == [0, 1, 0, 1]
+
+    await r.flush()
+    assert all(a._reconcile.call_count == 1 for a in aliases)
+    assert r._pending == {}
+    assert r._deadlines == []
+
+
+@pytest.mark.asyncio
+async def test_close():
+    r = Reconciler(0.01)
+    a = mock_alias()
+    r.schedule(a)
+    r.close()
+    await asyncio.sleep(0.02)
+    assert a._reconcile.call_count == 0
+    await r.flush()
@@ -0,0 +1,121 @@
+import pytest
+
+import json
+
+import qth
+from qth_ls import Ls
+
+from qth_alias import AliasServer
+from qth_alias.record import Recorder, read_capture
+from qth_alias.testing import FakeBroker, FakeClient
+
+
+def test_recorder(tmpdir):
+    filename = str(tmpdir.join("capture.jsonl"))
+    recorder = Recorder(filename, source="meta/alias/")
+    recorder.record_aliases({"foo": {"target": "bar", "alias": "foo"}})
+    recorder.record_message("foo", "to_alias", "bar", "property",
+                            {"a": [1, 2]})
+    recorder.record_message("foo", "to_target", "foo", "event", None)
+    recorder.record_message("foo", "to_alias", "bar", "property", qth.Empty)
+    recorder.close()
+
+    # Compact encoding
+    with open(filename) as f:
+        assert ", " not in f.read()
+
+    records = list(read_capture(filename))
+    assert [r["type"] for r in records] == [
+        "aliases", "message", "message", "message"]
+    assert all(isinstance(r["time"], float) for r in records)
+
+    assert records[0]["aliases"] == {"foo": {"target": "bar", "alias": "foo"}}
+    assert records[0]["source"] == "meta/alias/"
+
+    assert records[1]["alias"] == "foo"
+    assert records[1]["direction"] == "to_alias"
+    assert records[1]["path"] == "bar"
+    assert records[1]["kind"] == "property"
+    assert records[1]["value"] == {"a": [1, 2]}
+    assert records[1]["size"] == len(json.dumps({"a": [1, 2]},
+                                                separators=(",", ":")))
+
+    assert records[2]["value"] is None
+    assert records[2]["size"] == 4
+
+    assert records[3]["deleted"] is True
+    assert records[3]["size"] == 0
+    assert "value" not in records[3]
+
+
+@pytest.mark.asyncio
+async def test_server_records(tmpdir):
+    filename = str(tmpdir.join("capture.jsonl"))
+
+    broker = FakeBroker()
+    device = FakeClient(broker, "device")
+    await device.register("foo/target", qth.PROPERTY_ONE_TO_MANY,
+                          "A target.")
+
+    client = FakeClient(broker)
+    s = AliasServer(client=client, ls=Ls(client), record_file=filename)
+    await s.async_init()
+    await client.send_event("meta/alias/add", {
+        "target": "foo/target", "alias": "foo/alias",
+        "transform": "value * 2", "inverse": "value // 2"})
+    await broker.settle()
+
+    await device.set_property("foo/target", 1)
+    await broker.settle()
+    await device.set_property("foo/alias", 4)
+    await broker.settle()
+    await s.close()
+
+    records = list(read_capture(filename))
+    assert [r["type"] for r in records] == ["aliases", "message", "message"]
+    assert set(records[0]["aliases"]) == set(["foo/alias"])
+
+    # Only the received values are recorded (not the server's own echoes)
+    assert [(r["direction"], r["path"], r["value"])
+            for r in records[1:]] == [
+        ("to_alias", "foo/target", 1),
+        ("to_target", "foo/alias", 4),
+    ]
+
+
+def test_recorder_writer_thread(tmpdir):
+    filename = str(tmpdir.join("capture.jsonl"))
+    recorder = Recorder(filename)
+
+    # Records are written by a separate thread...
+    assert recorder._thread.is_alive()
+    for i in range(1000):
+        recorder.record_message("foo", "to_alias", "bar", "event", i)
+
+    # ...all of which are written by the time the recorder is closed
+    recorder.close()
+    assert not recorder._thread.is_alive()
+    assert [r["value"] for r in read_capture(filename)] == list(range(1000))
+
+
+@pytest.mark.asyncio
+async def test_worker_records(tmpdir):
+    filename = str(tmpdir.join("capture.jsonl"))
+
+    broker = FakeBroker()
+    client = FakeClient(broker)
+    s = AliasServer(client=client, ls=Ls(client), record_file=filename,
+                    shard=1, shards=2)
+    await s.async_init()
+    await client.set_property("meta/alias/shards/1", {
+        "foo/alias": {"target": "foo/target", "alias": "foo/alias",
+                      "transform": None, "inverse": None,
+                      "description": "A test..."},
+    })
+    await broker.settle()
+    assert set(s._aliases) == set(["foo/alias"])
+    await s.close()
+
+    # Workers' shares of the aliases are not recorded (the control process
+    # records the complete set)
+    assert list(read_capture(filename)) == []
@@ -0,0 +1,43 @@
+import time
+import multiprocessing
+
+from argparse import Namespace
+from concurrent.futures import ProcessPoolExecutor
+
+from qth_alias import server
+
+
+def square(value):
+    return value * value
+
+
+def pool_worker(queue):
+    # Only possible in non-daemonic processes
+    with ProcessPoolExecutor(1) as executor:
+        queue.put(executor.submit(square, 3).result())
+
+
+def test_workers_may_start_processes(monkeypatch):
+    queue = multiprocessing.Queue()
+    monkeypatch.setattr(server, "run_worker",
+                        lambda args, prefixes, caches, shard:
+                        pool_worker(queue))
+
+    workers = server.start_workers(Namespace(workers=2), [], [])
+    assert len(workers) == 2
+    assert [queue.get(timeout=10) for _ in workers] == [9, 9]
+    server.stop_workers(workers)
+    assert not any(worker.is_alive() for worker in workers)
+
+
+def test_no_workers():
+    assert server.start_workers(Namespace(workers=1), [], []) == []
+
+
+def test_stop_workers_terminates():
+    worker = multiprocessing.Process(target=time.sleep, args=(60, ))
+    worker.start()
+    start = time.monotonic()
+    server.stop_workers([worker], timeout=0.1)
+    assert not worker.is_alive()
+    assert time.monotonic() - start < 10
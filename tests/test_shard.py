@@ -0,0 +1,20 @@
+import pytest
+
+from qth_alias.shard import shard_of, RemoteAlias
+
+
+def test_shard_of():
+    paths = ["foo/{}".format(i) for i in range(100)]
+
+    # Stable and in range
+    assert [shard_of(p, 4) for p in paths] == [shard_of(p, 4) for p in paths]
+    assert set(shard_of(p, 4) for p in paths) == set(range(4))
+    assert shard_of("foo/bar", 1) == 0
+
+
+@pytest.mark.asyncio
+async def test_remote_alias():
+    a = RemoteAlias(None, target="foo/target", alias="foo/alias")
+    await a.async_init()
+    assert a.json == {"target": "foo/target", "alias": "foo/alias"}
+    await a.delete()
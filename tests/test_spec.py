@@ -0,0 +1,70 @@
+import pytest
+
+import io
+import json
+
+from qth_alias.spec import validate_spec, read_specs, write_specs
+
+
+def test_validate_spec():
+    # Short form expanded and defaults filled in
+    assert validate_spec(["foo/target", "foo/alias"]) == {
+        "target": "foo/target",
+        "alias": "foo/alias",
+        "transform": None,
+        "inverse": None,
+        "description": "Alias of foo/target.",
+    }
+
+    # Default optional fields omitted; the argument is not modified
+    spec = {"target": "foo/target", "alias": "foo/alias", "lazy": False,
+            "execution": "inline", "filter": None}
+    assert set(validate_spec(spec)) == set([
+        "target", "alias", "transform", "inverse", "description"])
+    assert spec["lazy"] is False
+
+
+@pytest.mark.parametrize("spec,message", [
+    (["nope"], "short form alias must have two entries"),
+    ({"target": "foo"}, "no 'alias' in alias specification."),
+    ({"target": "foo", "alias": 1}, "'alias' must be a path."),
+    ({"target": 1, "alias": "bar"},
+     "'target' must be a path or a non-empty list of paths."),
+    ({"target": "foo", "alias": "bar", "transform": 1, "inverse": 1},
+     "'transform' must be a string."),
+    ({"target": "foo", "alias": "bar", "window": 1},
+     "'window' must be a dictionary {'period': seconds, 'mode': 'tumbling' "
+     "or 'sliding', 'length': periods}."),
+])
+def test_validate_spec_invalid(spec, message):
+    with pytest.raises(ValueError) as excinfo:
+        validate_spec(spec)
+    assert str(excinfo.value) == message
+
+
+def test_read_write_specs():
+    specs = [{"target": "a", "alias": "b"}, ["c", "d"]]
+    f = io.StringIO()
+    write_specs(f, specs)
+    assert f.getvalue().count("\n") == 2
+
+    # Blank lines ignored
+    f = io.StringIO(f.getvalue() + "\n")
+    assert list(read_specs(f)) == specs
+
+
+@pytest.mark.parametrize("indent", [None, 2])
+def test_read_specs_old_cache(indent):
+    aliases = {"b": {"target": "a", "alias": "b"},
+               "d": {"target": "c", "alias": "d"}}
+    f = io.StringIO(json.dumps(aliases, indent=indent))
+    assert list(read_specs(f)) == list(aliases.values())
+
+    assert list(read_specs(io.StringIO("{}"))) == []
+
+
+def test_read_specs_invalid():
+    f = io.StringIO('["a", "b"]\n["c", \n')
+    with pytest.raises(ValueError) as excinfo:
+        list(read_specs(f))
+    assert str(excinfo.value).startswith("line 2: ")
@@ -0,0 +1,60 @@
+import pytest
+
+from qth_alias.stats import log_bounds, Histogram, AliasStats
+
+
+def test_log_bounds():
+    assert log_bounds(1.0, 100.0, 1) == (1.0, 10.0, 100.0)
+    bounds = log_bounds(1e-3, 1.0, 4)
+    assert len(bounds) == 13
+    assert bounds[4] == pytest.approx(1e-2)
+
+
+def test_histogram():
+    h = Histogram((1.0, 10.0, 100.0))
+    assert h.quantile(0.5) is None
+    assert h.json == {"count": 0, "sum": 0.0, "max": 0.0,
+                      "p50": None, "p99": None, "buckets": []}
+
+    for sample in [0.5, 1.0, 5.0, 5.0, 1000.0]:
+        h.add(sample)
+
+    assert h.counts == [2, 2, 0, 1]
+    assert h.count == 5
+    assert h.total == 1011.5
+    assert h.maximum == 1000.0
+
+    assert h.quantile(0.0) == 1.0
+    assert h.quantile(0.5) == 10.0
+    assert h.quantile(1.0) == 1000.0
+
+    assert h.json["buckets"] == [[1.0, 2], [10.0, 2], [None, 1]]
+
+    h2 = Histogram((1.0, 10.0, 100.0))
+    h2.add(50.0)
+    h.merge(h2)
+    assert h.counts == [2, 2, 1, 1]
+    assert h.count == 6
+
+
+def test_alias_stats():
+    a = AliasStats()
+    a.to_alias += 2
+    a.errors += 1
+    a.memo_hits += 4
+    a.add_transform_time(0.001)
+
+    b = AliasStats()
+    b.to_target += 3
+    b.echoes_suppressed += 1
+    b.memo_misses += 5
+    b.merge(a)
+
+    json = b.json
+    assert json["to_alias"] == 2
+    assert json["to_target"] == 3
+    assert json["echoes_suppressed"] == 1
+    assert json["errors"] == 1
+    assert json["memo_hits"] == 4
+    assert json["memo_misses"] == 5
+    assert json["transform_time"]["count"] == 1
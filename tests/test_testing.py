@@ -0,0 +1,127 @@
+import pytest
+import asyncio
+
+import qth
+from qth_ls import Ls
+
+from qth_alias.testing import (
+    topic_matches, path_directories, FakeBroker, FakeClient)
+
+
+def test_topic_matches():
+    assert topic_matches("foo/bar", "foo/bar")
+    assert not topic_matches("foo/bar", "foo/baz")
+    assert not topic_matches("foo", "foo/bar")
+    assert topic_matches("foo/+", "foo/bar")
+    assert not topic_matches("foo/+", "foo/bar/baz")
+    assert topic_matches("foo/#", "foo/bar/baz")
+    assert topic_matches("#", "foo")
+
+
+def test_path_directories():
+    assert list(path_directories("foo")) == [("", "foo", False)]
+    assert list(path_directories("foo/bar/baz")) == [
+        ("", "foo", True),
+        ("foo/", "bar", True),
+        ("foo/bar/", "baz", False),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_retained():
+    broker = FakeBroker()
+    client = FakeClient(broker)
+    await client.set_property("foo", {"a": (1, 2)})
+
+    received = []
+    await client.watch_property("foo", lambda t, v: received.append(v))
+    await broker.settle()
+
+    # Round-tripped through JSON
+    assert received == [{"a": [1, 2]}]
+
+    await client.delete_property("foo")
+    await broker.settle()
+    assert received[-1] is qth.Empty
+    assert broker.get_retained("foo") is None
+
+
+@pytest.mark.asyncio
+async def test_registrar():
+    broker = FakeBroker()
+    a = FakeClient(broker, "a")
+    b = FakeClient(broker, "b")
+
+    await a.register("foo/bar/baz", qth.PROPERTY_ONE_TO_MANY, "Baz.",
+                     delete_on_unregister=True)
+    await b.register("foo/qux", qth.EVENT_ONE_TO_MANY, "Qux.")
+    await broker.settle()
+
+    assert broker.get_retained("meta/ls/")["foo"][0]["behaviour"] == \
+        qth.DIRECTORY
+    assert set(broker.get_retained("meta/ls/foo/")) == set(["bar", "qux"])
+    assert broker.get_retained("meta/ls/foo/bar/") == {"baz": [{
+        "behaviour": qth.PROPERTY_ONE_TO_MANY,
+        "description": "Baz.",
+        "delete_on_unregister": True,
+        "client_id": "a",
+    }]}
+
+    # The real Ls can be used
+    ls = Ls(b)
+    registrations = []
+
+    async def on_change(path, registration):
+        registrations.append(registration)
+    await ls.watch_path("foo/bar/baz", on_change)
+    await broker.settle()
+    assert registrations[-1][0]["description"] == "Baz."
+
+    # Registrations are removed (and delete_on_unregister applied) on
+    # disconnect
+    await a.set_property("foo/bar/baz", 123)
+    await a.close()
+    await broker.settle()
+    assert registrations[-1] is None
+    assert broker.get_retained("foo/bar/baz") is None
+    assert broker.get_retained("meta/ls/foo/bar/") is None
+    assert set(broker.get_retained("meta/ls/foo/")) == set(["qux"])
+
+    await b.unregister("foo/qux")
+    await broker.settle()
+    assert broker.get_retained("meta/ls/") is None
+
+
+@pytest.mark.asyncio
+async def test_latency_and_ordering():
+    broker = FakeBroker(latency=0.02, jitter=0.05, seed=1)
+    client = FakeClient(broker)
+    loop = asyncio.get_running_loop()
+
+    received = []
+    await client.watch_event("foo", lambda t, v: received.append(
+        (v, loop.time())))
+
+    start = loop.time()
+    for i in range(20):
+        await client.send_event("foo", i)
+    await broker.settle()
+
+    assert [v for v, _ in received] == list(range(20))
+    assert all(t - start >= 0.02 for _, t in received)
+
+
+@pytest.mark.asyncio
+async def test_drop_rate():
+    broker = FakeBroker(drop_rate=0.5, seed=1)
+    client = FakeClient(broker)
+
+    received = []
+    await client.watch_event("foo", lambda t, v: received.append(v))
+    for i in range(1000):
+        await client.send_event("foo", i)
+    await broker.settle()
+
+    assert 400 < len(received) < 600
+    assert broker.dropped + broker.delivered == 1000
+    assert received == sorted(received)
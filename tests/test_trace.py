@@ -0,0 +1,78 @@
+import pytest
+import asyncio
+import json
+
+from mock import Mock
+
+from qth_alias.trace import (
+    Span, RingBufferSink, JsonLinesSink, EventSink, Tracer)
+from qth_alias.testing import FakeBroker, FakeClient
+
+
+def test_span():
+    span = Span("foo/alias", "to_alias")
+    assert span.transformed is None
+    assert span.published is None
+
+    span.mark_transformed()
+    span.mark_published()
+    assert 0.0 <= span.transformed <= span.published
+
+    assert set(span.json) == set(["alias", "direction", "received",
+                                  "transformed", "published"])
+
+
+def test_ring_buffer_sink():
+    sink = RingBufferSink(2)
+    spans = [Span("foo/alias", "to_alias") for _ in range(3)]
+    for span in spans:
+        sink.record(span)
+    assert list(sink.spans) == spans[1:]
+
+
+def test_json_lines_sink(tmpdir):
+    filename = str(tmpdir.join("trace.jsonl"))
+    sink = JsonLinesSink(filename)
+    sink.record(Span("foo/alias", "to_alias"))
+    sink.record(Span("foo/alias", "to_target"))
+    sink.close()
+
+    with open(filename) as f:
+        lines = [json.loads(line) for line in f]
+    assert [line["direction"] for line in lines] == ["to_alias", "to_target"]
+
+
+@pytest.mark.asyncio
+async def test_event_sink():
+    broker = FakeBroker()
+    client = FakeClient(broker)
+    received = []
+    broker.subscribe("meta/alias/trace", lambda t, v: received.append(v))
+
+    sink = EventSink(client, "meta/alias/trace")
+    sink.record(Span("foo/alias", "to_alias"))
+    await asyncio.sleep(0)
+    await broker.settle()
+
+    assert len(received) == 1
+    assert received[0]["alias"] == "foo/alias"
+
+
+def test_tracer_sampling():
+    sink = Mock()
+    tracer = Tracer([sink], 1.0)
+    span = tracer.start("foo/alias", "to_alias")
+    tracer.finish(span)
+    sink.record.assert_called_once_with(span)
+    assert span.published is not None
+
+    tracer = Tracer([sink], 0.25, seed=1)
+    sampled = sum(tracer.start("foo/alias", "to_alias") is not None
+                  for _ in range(1000))
+    assert 150 < sampled < 350
+
+    tracer = Tracer([sink], 0.0)
+    assert tracer.start("foo/alias", "to_alias") is None
+
+    tracer.close()
+    sink.close.assert_called_once_with()
@@ -0,0 +1,155 @@
+import pytest
+
+import ast
+import json
+import math  # noqa
+
+from qth_alias.transform import is_pure, freeze, LRUMemo, Transform
+
+
+@pytest.mark.parametrize("code,pure", [
+    ("value", True),
+    ("value / 63.0", True),
+    ("int(round(value * 63))", True),
+    ("math.floor(value)", True),
+    ("[x * 2 for x in value]", True),
+    ("functools.reduce(lambda a, b: a + b, value)", True),
+    ("{'on': 1, 'off': 0}[value]", True),
+    # Unknown globals
+    ("time.time()", False),
+    ("random.random() * value", False),
+    ("print(value)", False),
+    ("map(print, value)", False),
+    # Method calls on values
+    ("value.upper()", False),
+    ("value.append(1)", False),
+    ("functools.lru_cache(value)", False),
+])
+def test_is_pure(code, pure):
+    assert is_pure(ast.parse(code, mode="eval")) is pure
+
+
+def test_freeze():
+    # Equal-but-different-type values don't collide
+    assert len(set(map(freeze, [1, 1.0, True]))) == 3
+
+    # Unhashable JSON values become hashable
+    hash(freeze([1, [2, 3], {"a": [4]}]))
+    assert freeze({"a": 1, "b": 2}) == freeze({"b": 2, "a": 1})
+    assert freeze([1, 2]) != freeze([2, 1])
+
+
+def test_lru_memo():
+    m = LRUMemo(2)
+    assert m.lookup("a") == (False, None)
+    m.store("a", 1)
+    m.store("b", 2)
+    assert m.lookup("a") == (True, 1)
+
+    # "b" is now least recently used and is evicted
+    m.store("c", 3)
+    assert len(m) == 2
+    assert m.lookup("b") == (False, None)
+    assert m.lookup("a") == (True, 1)
+    assert m.lookup("c") == (True, 3)
+
+    assert m.hits == 3
+    assert m.misses == 2
+
+
+def test_transform():
+    t = Transform("value * 2", globals(), cache_size=4)
+    assert t.pure
+    assert t(2) == 4
+    assert t(2) == 4
+    assert t.memo.hits == 1
+
+    # Impure transforms are not memoised
+    t = Transform("print(value)", globals(), cache_size=4)
+    assert not t.pure
+    assert t.memo is None
+
+    # Memoisation can be disabled
+    t = Transform("value * 2", globals(), cache_size=0)
+    assert t.memo is None
+    assert t(2) == 4
+
+    with pytest.raises(SyntaxError):
+        Transform("value +", globals())
+
+
+def test_transform_not_memoisable():
+    # Container values are not memoised
+    t = Transform("value + [1]", globals(), cache_size=4)
+    assert t([0]) == [0, 1]
+    assert t([0]) == [0, 1]
+    assert t.memo.hits == 0
+    assert t.memo.misses == 0
+    assert len(t.memo) == 0
+
+    # ...nor are long strings
+    t = Transform("len(value)", globals(), cache_size=4)
+    assert t("x" * 1000) == 1000
+    assert len(t.memo) == 0
+
+    # ...nor container results (which callers could modify)
+    t = Transform("[value]", globals(), cache_size=4)
+    result = t(1)
+    assert result == [1]
+    result.append(2)
+    assert t(1) == [1]
+    assert t.memo.misses == 2
+    assert len(t.memo) == 0
+
+    # Equal values of different types are distinct
+    t = Transform("repr(value)", globals(), cache_size=4)
+    assert [t(1), t(1.0), t(True)] == ["1", "1.0", "True"]
+
+
+def test_transform_array():
+    numpy = pytest.importorskip("numpy")
+
+    t = Transform("numpy.clip(value * 2, 0, 5)", {"numpy": numpy},
+                  cache_size=4, array=True)
+    assert t.array
+    assert t.memo is None
+
+    result = t([0, 1, 2, 3])
+    assert result == [0, 2, 4, 5]
+    assert type(result) is list
+    assert all(type(v) is int for v in result)
+
+    # Scalar results are converted too
+    result = t.__class__("value.sum()", {}, array=True)([1.5, 2.5])
+    assert result == 4.0
+    assert type(result) is float
+
+    # Non-list values are passed through as-is
+    assert Transform("value * 2", {}, array=True)(3) == 6
+
+
+def test_transform_array_nested():
+    pytest.importorskip("numpy")
+
+    # NumPy values within containers are converted
+    t = Transform("[value.min(), value.max()]", {}, array=True)
+    result = t([3, 1, 2])
+    assert result == [1, 3]
+    assert all(type(v) is int for v in result)
+    json.dumps(result)
+
+    t = Transform("{'mean': value.mean(), 'range': (value.min(), value)}",
+                  {}, array=True)
+    result = t([1, 3])
+    assert result == {"mean": 2.0, "range": [1, [1, 3]]}
+    json.dumps(result)
+
+
+def test_transform_array_without_numpy(monkeypatch):
+    from qth_alias import transform
+    monkeypatch.setattr(transform, "numpy", None)
+
+    # Falls back to plain Python lists
+    t = Transform("value * 2", {}, array=True)
+    assert not t.array
+    assert t([1, 2]) == [1, 2, 1, 2]
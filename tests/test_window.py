@@ -0,0 +1,57 @@
+import pytest
+
+from qth_alias.window import Window
+
+
+def test_empty():
+    w = Window()
+    assert w.aggregate() is None
+    w.advance()
+    assert w.aggregate() is None
+
+
+def test_tumbling():
+    w = Window()
+
+    w.add(1)
+    w.add(2.5)
+    w.add(True)
+    assert w.aggregate() == {"mean": 1.5, "min": 1.0, "max": 2.5, "count": 3}
+
+    # Each period starts afresh
+    w.advance()
+    assert w.aggregate() is None
+    w.add(-4)
+    assert w.aggregate() == {"mean": -4.0, "min": -4.0, "max": -4.0,
+                             "count": 1}
+
+
+def test_sliding():
+    w = Window(3)
+
+    w.add(1)
+    w.advance()
+    w.add(2)
+    w.add(4)
+    w.advance()
+    w.add(6)
+    assert w.aggregate() == {"mean": 3.25, "min": 1.0, "max": 6.0,
+                             "count": 4}
+
+    # Oldest period drops out
+    w.advance()
+    assert w.aggregate() == {"mean": 4.0, "min": 2.0, "max": 6.0,
+                             "count": 3}
+    w.advance()
+    assert w.aggregate() == {"mean": 6.0, "min": 6.0, "max": 6.0,
+                             "count": 1}
+    w.advance()
+    assert w.aggregate() is None
+
+
+@pytest.mark.parametrize("sample", ["1x", None, [1]])
+def test_non_numeric(sample):
+    w = Window()
+    with pytest.raises((TypeError, ValueError)):
+        w.add(sample)
+    assert w.aggregate() is None